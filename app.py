@@ -1,125 +1,210 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import os
 import json
 import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
 import time
-import base64
 import traceback
 import re
+import gc
 from urllib.parse import urljoin, urlparse
 import mimetypes
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
-from openai import OpenAI
 # import speech_recognition as sr
 # from pydub import AudioSegment
-import pandas as pd
-import PyPDF2
-from bs4 import BeautifulSoup
+from data_processor import DataProcessor, summarize_dataframe
+from sandbox import get_sandbox_pool, run_code
+from page_scraper import capture_json_responses, tables_to_dataframes, api_dataframes
+from tracing import span, traced, job_trace, record_tokens, render_metrics, in_current_trace, set_job_deadline
+from llm_governor import get_governor, estimate_tokens
+from memory import job_account, spool_chunks, TeeSpool
+from processors import get_processor, run_processor
+from archives import ARCHIVE_TYPES, ARCHIVE_MAX_DEPTH, iter_members
+from downloads import Download, DownloadChanged, preview_file
+from sql_engine import SQL_READERS, SQL_PANDAS_MAX_BYTES, open_sql_workspace
+from browser_pool import BROWSER_PROFILE, LEAN_MIN_TEXT_CHARS, open_browser, browser_metrics, get_browser_manager
+from result_store import get_result_store, ResultStore, JobRunning
+from work_queue import get_work_queue
 
-# AI Pipe Configuration
-client = OpenAI(
-    api_key=os.environ.get("AIPIPE_TOKEN"),
-    base_url="https://aipipe.org/openai/v1"
-)
+_client = None
+
+def get_client():
+    """AI Pipe client, created on first use in each worker (never shared across fork)"""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(
+            api_key=os.environ.get("AIPIPE_TOKEN"),
+            base_url=os.environ.get("AIPIPE_BASE_URL", "https://aipipe.org/openai/v1"),
+            # Retries and backoff are done by the callers through the LLM governor
+            max_retries=0
+        )
+    return _client
 
 app = Flask(__name__)
 
 YOUR_EMAIL = os.environ.get("STUDENT_EMAIL", "your-email@example.com")
 YOUR_SECRET = os.environ.get("STUDENT_SECRET", "your-secret-string")
 
-def get_browser():
-    """Initialize Chrome"""
-    chrome_options = Options()
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1920,1080")
-    
-    chrome_paths = [
-        "/usr/bin/chromium",
-        "/usr/bin/chromium-browser", 
-        "/usr/bin/google-chrome",
-        "/usr/bin/google-chrome-stable"
-    ]
+DEFAULT_MODEL = os.environ.get("AI_MODEL", "gpt-4o-mini")
+
+# Ensemble mode: ENSEMBLE_SIZE > 1 solves the final step with several
+# concurrent completions (models x temperatures) and votes on the answer
+ENSEMBLE_SIZE = int(os.environ.get("ENSEMBLE_SIZE", 1))
+# (AI_MODEL unless ENSEMBLE_MODELS lists the models to mix)
+ENSEMBLE_MODELS = [m.strip() for m in os.environ.get("ENSEMBLE_MODELS", DEFAULT_MODEL).split(",") if m.strip()]
+ENSEMBLE_TEMPERATURES = [0, 0.4, 0.8]
+
+# Wrong answers are retried with the grader's feedback while time allows
+MAX_ANSWER_RETRIES = int(os.environ.get("MAX_ANSWER_RETRIES", 2))
+RETRY_MIN_SECONDS = int(os.environ.get("RETRY_MIN_SECONDS", 20))
+
+# Files needed by one quiz are downloaded and processed concurrently
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 4))
+
+# These types are parsed while they download (0 turns it off)
+PROGRESSIVE_DOWNLOADS = os.environ.get("PROGRESSIVE_DOWNLOADS", "1") == "1"
+PROGRESSIVE_TYPES = ('csv', 'text')
+
+# Linked data files are sampled with range reads for the planning step
+PREVIEW_TYPES = ('csv', 'json', 'pdf')
+PREVIEW_MAX_LINKS = int(os.environ.get("PREVIEW_MAX_LINKS", 5))
+
+# Longest wait for the quiz's script to render its content after page load
+PAGE_RENDER_TIMEOUT = float(os.environ.get("PAGE_RENDER_TIMEOUT", 5))
+
+# Tag -> (link type, URL attribute, default text) for single-pass extraction
+LINK_TAGS = {
+    'a': ('link', 'href', None),
+    'source': ('media', 'src', 'media'),
+    'audio': ('audio', 'src', 'audio'),
+    'video': ('video', 'src', 'video'),
+    'img': ('image', 'src', 'image'),
+}
+
+SCRIPT_URL_PATTERN = re.compile(r"""["'`]((?:https?://|/)[^"'`\s<>]+)["'`]""")
+
+def parse_page(html, base_url):
+    """Parse HTML once and collect links, media, script URLs, forms and tables in one traversal"""
+    tree = DataProcessor.parse_html(html)
+    links = []
+    script_urls = []
+    forms = []
+    tables = []
     
-    for path in chrome_paths:
-        if os.path.exists(path):
-            chrome_options.binary_location = path
-            break
+    if tree is None:
+        return {"tree": None, "links": links, "script_urls": script_urls, "forms": forms, "tables": tables}
     
-    return webdriver.Chrome(options=chrome_options)
+    for el in tree.iter():
+        tag = el.tag
+        if not isinstance(tag, str):
+            continue  # comments and processing instructions
+        
+        if tag in LINK_TAGS:
+            link_type, attr, default_text = LINK_TAGS[tag]
+            value = el.get(attr)
+            if not value or value.startswith(('data:', 'javascript:')):
+                continue
+            if default_text is None:
+                text = el.text_content().strip()
+            elif tag == 'img':
+                text = el.get('alt') or default_text
+            else:
+                text = default_text
+            links.append({
+                'url': urljoin(base_url, value),
+                'text': text,
+                'type': link_type
+            })
+        
+        elif tag == 'script':
+            if el.get('src'):
+                script_urls.append(urljoin(base_url, el.get('src')))
+            elif el.text:
+                for match in SCRIPT_URL_PATTERN.findall(el.text):
+                    script_urls.append(urljoin(base_url, match))
+        
+        elif tag == 'form':
+            forms.append({
+                'action': urljoin(base_url, el.get('action') or ''),
+                'method': (el.get('method') or 'get').lower(),
+                'inputs': {i.get('name'): i.get('value') for i in el.iter('input', 'select', 'textarea') if i.get('name')}
+            })
+        
+        elif tag == 'table':
+            tables.append(DataProcessor.table_from_element(el))
+    
+    return {
+        "tree": tree,
+        "links": links,
+        "script_urls": list(dict.fromkeys(script_urls)),
+        "forms": forms,
+        "tables": tables
+    }
 
 def extract_all_links_from_html(html, base_url):
     """Extract ALL downloadable links from HTML"""
-    soup = BeautifulSoup(html, 'html.parser')
-    links = []
-    
-    # Find all <a> tags with href
-    for a_tag in soup.find_all('a', href=True):
-        href = a_tag['href']
-        full_url = urljoin(base_url, href)
-        links.append({
-            'url': full_url,
-            'text': a_tag.get_text(strip=True),
-            'type': 'link'
-        })
-    
-    # Find all <source> tags (audio/video)
-    for source_tag in soup.find_all('source', src=True):
-        src = source_tag['src']
-        full_url = urljoin(base_url, src)
-        links.append({
-            'url': full_url,
-            'text': 'media',
-            'type': 'media'
-        })
-    
-    # Find all <audio> tags
-    for audio_tag in soup.find_all('audio', src=True):
-        src = audio_tag['src']
-        full_url = urljoin(base_url, src)
-        links.append({
-            'url': full_url,
-            'text': 'audio',
-            'type': 'audio'
-        })
-    
-    # Find all <video> tags
-    for video_tag in soup.find_all('video', src=True):
-        src = video_tag['src']
-        full_url = urljoin(base_url, src)
-        links.append({
-            'url': full_url,
-            'text': 'video',
-            'type': 'video'
-        })
-    
-    return links
+    return parse_page(html, base_url)['links']
 
+@traced('fetch_quiz_page')
 def fetch_quiz_page(url):
     """Fetch quiz page and extract all content"""
     print(f"\n{'='*60}")
     print(f"Fetching: {url}")
     
-    driver = None
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+    
+    profiles = [BROWSER_PROFILE] + (['full'] if BROWSER_PROFILE == 'lean' else [])
+    
+    session = None
     try:
-        driver = get_browser()
-        driver.get(url)
-        time.sleep(5)
+        for profile in profiles:
+            if session:
+                session.close()
+                session = None
+            try:
+                # A context in the worker's shared browser (or a dedicated browser)
+                with span('browser_launch', profile=profile):
+                    session = open_browser(profile)
+                    driver = session.driver
+                # Per-profile stage name, so /metrics compares lean and full renders
+                with span(f'page_load_{profile}', url=url) as attrs:
+                    driver.get(url)
+                    try:
+                        # Quiz content is rendered by script; stop waiting as soon as it shows up
+                        WebDriverWait(driver, PAGE_RENDER_TIMEOUT, poll_frequency=0.1).until(
+                            lambda d: len(d.find_element(By.TAG_NAME, "body").text.strip()) >= LEAN_MIN_TEXT_CHARS)
+                    except TimeoutException:
+                        pass
+                    
+                    page_html = driver.page_source
+                    page_text = driver.find_element(By.TAG_NAME, "body").text
+                    attrs.update(browser_metrics(driver, session.browser_pid))
+            except Exception as e:
+                if profile == profiles[-1]:
+                    raise
+                print(f"⚠️ {profile} render failed ({e}), retrying with full rendering")
+                continue
+            
+            if profile == profiles[-1] or len(page_text.strip()) >= LEAN_MIN_TEXT_CHARS:
+                break
+            print(f"⚠️ {profile} render produced {len(page_text.strip())} chars, retrying with full rendering")
         
-        page_html = driver.page_source
-        page_text = driver.find_element(By.TAG_NAME, "body").text
+        # Parse once; the tree is shared with later scraping steps
+        with span('page_parse'):
+            page = parse_page(page_html, url)
+            all_links = page['links']
         
-        # Extract all links
-        all_links = extract_all_links_from_html(page_html, url)
+        # Structured data: page tables and JSON the page fetched (plus its other pages)
+        with span('page_scrape'):
+            dataframes = tables_to_dataframes(page['tables'])
+            dataframes.update(api_dataframes(capture_json_responses(driver)))
         
         print(f"✓ Loaded: {len(page_text)} chars text")
         print(f"✓ Found {len(all_links)} downloadable items")
+        print(f"✓ Structured data: {len(dataframes)} DataFrames")
         
         print(f"\nText preview:")
         print("-" * 60)
@@ -134,14 +219,16 @@ def fetch_quiz_page(url):
             "html": page_html,
             "text": page_text,
             "url": url,
-            "all_links": all_links
+            "all_links": all_links,
+            "tree": page['tree'],
+            "script_urls": page['script_urls'],
+            "forms": page['forms'],
+            "tables": page['tables'],
+            "dataframes": dataframes
         }
     finally:
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+        if session:
+            session.close()
 
 def detect_file_type(url, content_bytes=None):
     """Detect file type from URL or content"""
@@ -155,6 +242,12 @@ def detect_file_type(url, content_bytes=None):
         '.xlsx': 'excel',
         '.xls': 'excel',
         '.txt': 'text',
+        '.parquet': 'parquet',
+        '.json': 'json',
+        '.jsonl': 'json',
+        '.ndjson': 'json',
+        '.zip': 'zip',
+        '.gz': 'gzip',
         '.mp3': 'audio',
         '.wav': 'audio',
         '.ogg': 'audio',
@@ -164,12 +257,26 @@ def detect_file_type(url, content_bytes=None):
         '.jpg': 'image',
         '.jpeg': 'image',
         '.png': 'image',
-        '.gif': 'image'
+        '.gif': 'image',
+        '.webp': 'image',
+        '.bmp': 'image'
     }
     
     if ext in type_map:
         return type_map[ext]
     
+    # Archives by their magic bytes
+    if content_bytes is not None:
+        if hasattr(content_bytes, 'read'):
+            head = content_bytes.read(4)
+            content_bytes.seek(0)
+        else:
+            head = bytes(content_bytes[:4])
+        if head.startswith(b'PK\x03\x04'):
+            return 'zip'
+        if head.startswith(b'\x1f\x8b'):
+            return 'gzip'
+    
     # Try MIME type from content
     if content_bytes:
         mime = mimetypes.guess_type(url)[0]
@@ -185,158 +292,233 @@ def detect_file_type(url, content_bytes=None):
     
     return 'unknown'
 
-def transcribe_audio(audio_bytes):
-    """Transcribe audio to text using speech recognition"""
-    print("  🎤 Audio transcription disabled")
-    return None
-    # print("  🎤 Transcribing audio...")
-    
-    # try:
-    #     # Convert audio to WAV format
-    #     audio = AudioSegment.from_file(BytesIO(audio_bytes))
-    #     audio = audio.set_channels(1).set_frame_rate(16000)
-        
-    #     wav_io = BytesIO()
-    #     audio.export(wav_io, format='wav')
-    #     wav_io.seek(0)
-        
-    #     # Use speech recognition
-    #     recognizer = sr.Recognizer()
-    #     with sr.AudioFile(wav_io) as source:
-    #         audio_data = recognizer.record(source)
-    #         text = recognizer.recognize_google(audio_data)
-        
-    #     print(f"  ✓ Transcribed: {len(text)} chars")
-    #     print(f"  Preview: {text[:200]}")
-    #     return text
-    
-    # except Exception as e:
-    #     print(f"  ✗ Transcription failed: {e}")
-    #     # Fallback: try with OpenAI Whisper if available
-    #     try:
-    #         print("  Trying OpenAI Whisper...")
-    #         # Save audio temporarily
-    #         temp_audio = BytesIO(audio_bytes)
-    #         temp_audio.name = "audio.mp3"
-            
-    #         response = client.audio.transcriptions.create(
-    #             model="whisper-1",
-    #             file=temp_audio
-    #         )
-    #         text = response.text
-    #         print(f"  ✓ Whisper transcribed: {len(text)} chars")
-    #         return text
-    #     except Exception as e2:
-    #         print(f"  ✗ Whisper also failed: {e2}")
-    #         return None
-
-def process_pdf(pdf_bytes):
-    """Extract text from PDF"""
-    print("  📄 Processing PDF...")
-    try:
-        pdf_file = BytesIO(pdf_bytes)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        all_text = []
-        for i, page in enumerate(pdf_reader.pages):
-            text = page.extract_text()
-            all_text.append(f"[Page {i+1}]\n{text}")
-        
-        full_text = "\n\n".join(all_text)
-        print(f"  ✓ Extracted {len(full_text)} chars from {len(pdf_reader.pages)} pages")
-        return full_text
-    except Exception as e:
-        print(f"  ✗ PDF processing failed: {e}")
-        return None
+def describe_images_with_ai(quiz_text, images):
+    """Describe several images in one batched vision call"""
+    print(f"\n👁️ Vision call for {len(images)} image(s)...")
+    
+    content = [{
+        "type": "text",
+        "text": f"""You are helping solve this quiz:
+
+{quiz_text[:2000]}
 
-def process_csv(csv_bytes):
-    """Process CSV file"""
-    print("  📊 Processing CSV...")
+Describe each of the following {len(images)} image(s) in order. Transcribe any text, numbers, tables or chart values exactly.
+
+RESPONSE FORMAT (JSON only):
+{{"descriptions": ["description of image 1", "description of image 2"]}}
+"""
+    }]
+    for pf in images:
+        content.append({"type": "image_url", "image_url": {"url": pf['vision_image'], "detail": "auto"}})
+    
+    # Text plus roughly a detail=auto image's worth of tokens per image
+    estimated = estimate_tokens(content[0]['text'], 2048) + 1000 * len(images)
     try:
-        df = pd.read_csv(BytesIO(csv_bytes))
-        
-        # Get summary
-        summary = {
-            "shape": df.shape,
-            "columns": df.columns.tolist(),
-            "head": df.head(10).to_dict('records'),
-            "dtypes": df.dtypes.astype(str).to_dict(),
-            "describe": df.describe().to_dict() if not df.empty else {}
-        }
+        for attempt in range(2):
+            try:
+                with span('call_ai_vision', images=len(images)) as attrs, \
+                        get_governor().slot(estimated, DEFAULT_MODEL) as usage:
+                    resp = get_client().chat.completions.create(
+                        model=DEFAULT_MODEL,
+                        messages=[{"role": "user", "content": content}],
+                        max_tokens=2048,
+                        temperature=0
+                    )
+                    if resp.usage:
+                        record_tokens(attrs, DEFAULT_MODEL, resp.usage.prompt_tokens, resp.usage.completion_tokens,
+                                      cached_tokens(resp.usage))
+                        usage['tokens'] = resp.usage.total_tokens
+                break
+            except Exception as e:
+                if attempt == 1:
+                    raise
+                print(f"✗ Vision call error: {e}")
+                time.sleep(get_governor().backoff(attempt, e))
+        response_text = resp.choices[0].message.content.strip()
+        start = response_text.find('{')
+        end = response_text.rfind('}') + 1
+        descriptions = json.loads(response_text[start:end]).get('descriptions', [])
         
-        print(f"  ✓ CSV: {df.shape[0]} rows x {df.shape[1]} columns")
-        return {
-            "dataframe": df,
-            "summary": summary,
-            "full_data": df.to_dict('records')
-        }
+        for pf, description in zip(images, descriptions):
+            pf['vision_description'] = description
+            pf['content'] = description
+        print(f"✓ Described {len(descriptions)} image(s)")
     except Exception as e:
-        print(f"  ✗ CSV processing failed: {e}")
-        return None
+        print(f"✗ Vision call failed: {e}")
 
-def download_and_process_file(url):
-    """Download and process any file type"""
+@traced('download_and_process_file')
+def download_and_process_file(url, workspace=None, restarted=False):
+    """Download and process any file type (CSV/Parquet/JSON also become SQL tables in workspace)"""
     print(f"\n📥 Downloading: {url}")
     
+    spool = None
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        content = response.content
-        
-        file_type = detect_file_type(url, content)
-        print(f"  Type: {file_type}")
-        
-        result = {
-            "url": url,
-            "type": file_type,
-            "size": len(content),
-            "content": None,
-            "raw_base64": base64.b64encode(content).decode('utf-8')
-        }
-        
-        # Process based on type
-        if file_type == 'audio':
-            transcription = transcribe_audio(content)
-            result['content'] = transcription
-            result['transcription'] = transcription
-        
-        elif file_type == 'pdf':
-            text = process_pdf(content)
-            result['content'] = text
-            result['text'] = text
-        
-        elif file_type == 'csv':
-            csv_data = process_csv(content)
-            if csv_data:
-                result['content'] = csv_data['summary']
-                result['csv_data'] = csv_data
-        
-        elif file_type == 'text':
-            result['content'] = content.decode('utf-8', errors='ignore')
+        processed = None
+        file_type = detect_file_type(url)
+        with span('download', url=url) as attrs:
+            download = Download(url).open()
+            attrs['encoding'] = download.encoding
+            if PROGRESSIVE_DOWNLOADS and file_type in PROGRESSIVE_TYPES and not (
+                    workspace is not None and file_type in SQL_READERS
+                    and (download.size is None or download.size > SQL_PANDAS_MAX_BYTES)):
+                # Parse while the bytes arrive; the spool still gets the whole file
+                tee = TeeSpool(download.chunks())
+                try:
+                    processed = run_processor(file_type, tee)
+                except Exception as e:
+                    print(f"  ✗ {file_type} processing failed: {e}")
+                    processed = {}
+                spool, size, digest = tee.finish()
+                attrs['progressive'] = True
+            else:
+                # Streams to memory, spilling to a temp file for large downloads
+                spool, size, digest = spool_chunks(download.chunks())
+            attrs['bytes'] = size
+            attrs['resumes'] = download.resumes
         
+        if file_type == 'unknown':
+            file_type = detect_file_type(url, spool)
+        result = process_file(url, file_type, spool, size, digest, workspace, processed=processed)
         print(f"  ✓ Processed successfully")
         return result
     
+    except DownloadChanged as e:
+        if restarted:
+            print(f"  ✗ Download failed: {e}")
+            return None
+        # The partial bytes are of the old version, so fetch the new one whole
+        print(f"  ↻ {e}, downloading again")
+        return download_and_process_file(url, workspace, restarted=True)
+    
     except Exception as e:
         print(f"  ✗ Download failed: {e}")
         traceback.print_exc()
         return None
+    
+    finally:
+        # Raw bytes are not needed once processed; drops the temp file too
+        if spool is not None:
+            spool.close()
 
-def call_ai(prompt, max_retries=3):
-    """Call AI with robust error handling"""
+def process_file(url, file_type, spool, size, digest, workspace=None, depth=0, processed=None):
+    """Process a spooled file with the processor for its type (processed: its result, if already parsed); archives are expanded into 'members'"""
+    print(f"  Type: {file_type} ({size} bytes)")
+    
+    result = {
+        "url": url,
+        "type": file_type,
+        "size": size,
+        "sha256": digest,
+        "content": None
+    }
+    
+    if file_type in ARCHIVE_TYPES:
+        result['members'] = []
+        if depth >= ARCHIVE_MAX_DEPTH:
+            print(f"  ⚠️ Nested archive not expanded")
+            return result
+        try:
+            for member in expand_archive(url, file_type, spool, workspace, depth):
+                result['members'].append(member)
+        except Exception as e:
+            print(f"  ✗ {file_type} extraction failed: {e}")
+        result['content'] = "\n".join(f"[{m['type']}] {m['url']}" for m in result['members'])
+        return result
+    
+    # Data files are queried in place with SQL; large ones skip pandas
+    if workspace is not None and file_type in SQL_READERS:
+        spool.seek(0)
+        result['sql_table'] = workspace.add_file(url, file_type, spool)
+        spool.seek(0)
+        print(f"  ✓ SQL table: {result['sql_table']}")
+    
+    # Registered processor for the type decides its executor and caching
+    processor = get_processor(file_type)
+    if processed is not None:
+        result.update(processed)
+    elif result.get('sql_table') and (not processor or size > SQL_PANDAS_MAX_BYTES):
+        try:
+            result['sql_summary'] = workspace.describe(result['sql_table'])
+            result['content'] = json.dumps(result['sql_summary'], default=str)
+        except Exception as e:
+            print(f"  ✗ SQL describe failed: {e}")
+    elif processor:
+        source = spool if processor.streaming else spool.read()
+        try:
+            result.update(run_processor(file_type, source, digest))
+        except Exception as e:
+            print(f"  ✗ {file_type} processing failed: {e}")
+        if file_type == 'image':
+            # Kept for local pixel operations on the full-size image
+            result['image_bytes'] = source
+    
+    return result
+
+def expand_archive(url, file_type, spool, workspace=None, depth=0):
+    """Yield each archive member processed as a file of its own, decompressing one at a time"""
+    name = os.path.basename(urlparse(url).path)
+    for member_name, chunks in iter_members(file_type, spool, name):
+        member_url = f"{url}!/{member_name}"
+        print(f"  📦 {member_url}")
+        with span('extract', url=member_url) as attrs:
+            # Decompressed bytes count against the same size cap and job budget
+            member_spool, size, digest = spool_chunks(chunks)
+            attrs['bytes'] = size
+        try:
+            member_type = detect_file_type(member_name, member_spool)
+            if member_type == 'unknown':
+                print(f"  ⚠️ Skipping {member_name}: unknown type")
+                continue
+            member = process_file(member_url, member_type, member_spool, size, digest, workspace, depth + 1)
+        finally:
+            member_spool.close()
+        nested = member.pop('members', None)
+        yield member
+        yield from nested or []
+
+def release_hop_data(quiz_data, processed_files):
+    """Free DataFrames, parsed trees and raw bytes once a quiz hop is finished"""
+    if quiz_data:
+        for key in ('tree', 'html', 'dataframes', 'tables', 'conversation', 'previews'):
+            quiz_data.pop(key, None)
+        workspace = quiz_data.pop('sql', None)
+        if workspace is not None:
+            workspace.close()
+    for pf in processed_files or []:
+        for key in ('csv_data', 'excel_data', 'json_data', 'sql_summary', 'image_bytes', 'vision_image', 'content', 'text', 'pages'):
+            pf.pop(key, None)
+    gc.collect()
+
+def cached_tokens(usage):
+    """Prompt tokens the provider served from its prompt cache"""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+
+def call_ai(prompt, max_retries=3, model=DEFAULT_MODEL, temperature=0):
+    """Call AI with robust error handling (prompt: text, or a list of chat messages)"""
+    messages = prompt if isinstance(prompt, list) else [{"role": "user", "content": prompt}]
+    prompt_text = "".join(m["content"] for m in messages)
     for attempt in range(max_retries):
         try:
-            print(f"\n🤖 AI call {attempt + 1}/{max_retries}...")
+            print(f"\n🤖 AI call {attempt + 1}/{max_retries} ({model}, t={temperature})...")
             
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=4096,
-                temperature=0
-            )
+            # Waits for a slot under the shared RPM/TPM and concurrency limits
+            with span('call_ai', attempt=attempt + 1) as attrs, \
+                    get_governor().slot(estimate_tokens(prompt_text, 4096), model) as usage:
+                resp = get_client().chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=4096,
+                    temperature=temperature
+                )
+                if resp.usage:
+                    record_tokens(attrs, model, resp.usage.prompt_tokens, resp.usage.completion_tokens,
+                                  cached_tokens(resp.usage))
+                    usage['tokens'] = resp.usage.total_tokens
             
             response_text = resp.choices[0].message.content
-            print(f"✓ Response: {len(response_text)} chars")
+            print(f"✓ Response: {len(response_text)} chars "
+                  f"({attrs.get('cached_prompt_tokens', 0)}/{attrs.get('prompt_tokens', 0)} prompt tokens cached)")
             return response_text
             
         except Exception as e:
@@ -344,44 +526,123 @@ def call_ai(prompt, max_retries=3):
             if attempt == max_retries - 1:
                 traceback.print_exc()
                 return None
-            time.sleep(2)
+            time.sleep(get_governor().backoff(attempt, e))
     
     return None
 
-def solve_quiz_with_ai(quiz_data):
-    """Solve quiz using AI as a data analyst"""
-    print(f"\n{'='*60}")
-    print("SOLVING QUIZ WITH AI")
-    print(f"{'='*60}")
-    
-    # Build comprehensive context
-    context_parts = [
-        "=== QUIZ PAGE CONTENT ===",
-        quiz_data['text'],
-        "\n=== AVAILABLE FILES ===",
+def call_ai_ensemble(prompt, size=ENSEMBLE_SIZE):
+    """Several completions of one prompt dispatched concurrently; returns [(variant, text)]"""
+    variants = [
+        {"model": ENSEMBLE_MODELS[i % len(ENSEMBLE_MODELS)],
+         "temperature": ENSEMBLE_TEMPERATURES[i % len(ENSEMBLE_TEMPERATURES)]}
+        for i in range(size)
     ]
+    print(f"\n🤖 Ensemble of {size}: {variants}")
     
-    for link in quiz_data.get('all_links', []):
-        context_parts.append(f"[{link['type']}] {link['url']} - {link['text']}")
+    call = in_current_trace(lambda v: call_ai(prompt, max_retries=2, **v))
+    with span('call_ai_ensemble', size=size), ThreadPoolExecutor(max_workers=size) as pool:
+        texts = list(pool.map(call, variants))
+    return [(v, t) for v, t in zip(variants, texts) if t]
+
+def parse_ai_json(response_text):
+    """JSON object from a model response (markdown fences stripped), or None"""
+    response_text = response_text.strip()
+    for marker in ['```json', '```', '`']:
+        response_text = response_text.replace(marker, '')
+    response_text = response_text.strip()
+    
+    start = response_text.find('{')
+    end = response_text.rfind('}') + 1
     
-    context = "\n".join(context_parts)
+    if start == -1 or end == 0:
+        return None
     
-    prompt = f"""You are an expert data analyst solving a quiz. Your task is to analyze the question and determine what needs to be done.
+    return json.loads(response_text[start:end])
 
-{context}
+def answer_key(answer):
+    """Normalised form of an answer for voting (1, 1.0 and "1" agree)"""
+    if isinstance(answer, bool):
+        return ('bool', answer)
+    if isinstance(answer, (int, float)):
+        return ('num', round(float(answer), 6))
+    if isinstance(answer, str):
+        text = answer.strip()
+        try:
+            return ('num', round(float(text.replace(',', '')), 6))
+        except ValueError:
+            return ('str', text.lower())
+    return ('json', json.dumps(answer, sort_keys=True, default=str))
 
-YOUR ROLE:
-- You are a professional data analyst
-- You must actually solve the problem, not just copy text
-- You must think step by step
-- You must identify ALL files that need to be downloaded
+def vote_on_candidates(candidates):
+    """Majority vote over candidate solutions; locally computed answers get extra weight"""
+    scores = {}
+    first = {}
+    for i, candidate in enumerate(candidates):
+        if candidate.get('answer') is None:
+            continue
+        key = answer_key(candidate['answer'])
+        scores[key] = scores.get(key, 0) + (1.5 if candidate.get('computed_locally') else 1)
+        # Prefer a locally computed representative, then the earliest (t=0) one
+        if key not in first or (candidate.get('computed_locally') and not first[key][1].get('computed_locally')):
+            first[key] = (i, candidate)
+    
+    if not scores:
+        return candidates[0] if candidates else None
+    
+    best = max(scores, key=lambda k: (scores[k], -first[k][0]))
+    chosen = dict(first[best][1])
+    chosen['ensemble'] = {
+        "candidates": len(candidates),
+        "votes": {json.dumps(k[1], default=str): v for k, v in scores.items()},
+        "agreement": round(scores[best] / sum(scores.values()), 3)
+    }
+    print(f"\n🗳️ Ensemble picked {chosen['answer']!r} (agreement {chosen['ensemble']['agreement']})")
+    return chosen
+
+# Identical for every call and every chain, so the provider can cache it as a
+# prompt prefix; everything quiz-specific goes in the user messages after it
+SYSTEM_PROMPT = """You are an expert data analyst solving a chain of data quizzes. Each quiz is solved in two steps
+within one conversation.
 
-CRITICAL INSTRUCTIONS:
+STEP 1 - PLAN: you get the quiz page (text, downloadable items, structured page data).
 1. READ the question carefully and understand what is being asked
 2. IDENTIFY all files that need to be downloaded (CSV, PDF, audio, video, images, etc.)
 3. EXTRACT the submission URL from the page
 4. If you can answer without files, provide the answer
 5. If files are needed, list ALL file URLs
+6. If the answer must be computed over the structured page data (already loaded), set answer to null
+
+Step 1 RESPONSE FORMAT (JSON only, no markdown):
+{
+    "submit_url": "actual_url_from_page",
+    "reasoning": "brief explanation of what you understand",
+    "answer": your_answer_or_null,
+    "files_needed": ["url1", "url2"]
+}
+
+STEP 2 - SOLVE: you get the processed files (transcriptions, PDF text, CSV/Excel/JSON summaries, image OCR,
+descriptions and statistics) and the names of the data available for local code.
+1. Understand what the question is asking
+2. Use the audio transcription (if any) to understand the exact task
+3. Analyze the data files (CSV, PDF, etc.)
+4. Perform the required calculations/analysis
+5. Provide the final answer
+
+Step 2 RESPONSE FORMAT (JSON only):
+{
+    "submit_url": "actual_url_from_page",
+    "reasoning": "step by step explanation of your solution",
+    "calculations": "show your work",
+    "answer": your_final_answer
+}
+The answer can be a number, string, boolean, or JSON object depending on what's asked.
+
+YOUR ROLE:
+- You are a professional data analyst
+- You must actually solve the problem, not just copy text
+- You must think step by step
+- If there's an audio file, it likely contains instructions on what to do; follow them EXACTLY
+- Actually perform calculations, don't just guess; the answer must be precise and correct
 
 IMPORTANT RULES:
 - DO NOT just copy text from the question
@@ -391,20 +652,82 @@ IMPORTANT RULES:
 - If you see audio/video files, you MUST include them in files_needed
 - Extract the REAL submission URL from the page content
 
-RESPONSE FORMAT (JSON only, no markdown):
-{{
-    "submit_url": "actual_url_from_page",
-    "reasoning": "brief explanation of what you understand",
-    "answer": your_answer_or_null,
-    "files_needed": ["url1", "url2"]
-}}
+LOCAL CODE EXECUTION (step 2, when data is available):
+For any calculation over tabular data, do NOT compute by hand. Instead add a "code" field
+containing a short Python snippet; it runs locally on the FULL data and its value becomes the answer.
+- pandas is `pd`, numpy is `np`
+- DataFrames: `dfs` dict keyed by the names listed in step 2; `df` is the first one
+- Assign the final answer to `result` (or end with an expression)
+- Only pandas, numpy, math, statistics, re, json, datetime, collections, itertools may be imported; no file or network access
 
-If you cannot determine the answer without files, set answer to null.
+PIXEL-LEVEL IMAGE QUESTIONS (step 2, when images were processed):
+If the question asks about pixels or colours in an image (e.g. count pixels of a colour,
+most frequent colour), do NOT estimate. Instead add an "image_operation" field and it
+will be computed exactly on the original image:
+    "image_operation": {"file": "image_url", "type": "count_color", "color": "#rrggbb", "tolerance": 0}
+Supported types: count_color (color, tolerance), most_frequent_color, histogram (top_n),
+unique_colors, threshold_count (value, above), region_stats (box: [left, top, right, bottom]), dimensions
+
+SQL QUERIES (step 2, when SQL tables are listed):
+CSV, Parquet and JSON files are also available as DuckDB tables named in step 2; they are scanned
+in place, so SQL works on the FULL data even when it was too large to load for local code.
+For joins across files or aggregations over large files add a "sql" field instead of "code":
+    "sql": "SELECT c.region, sum(o.amount) FROM orders o JOIN customers c USING (customer_id) GROUP BY 1"
+- Exactly one SELECT (WITH ... SELECT is fine) in DuckDB syntax, over the listed table names only
+- A single value becomes the answer as is; one column becomes a list, several columns a list of records
+
+If a step 2 message lists previous attempts graded wrong, use the grader's feedback to find the
+mistake and do NOT repeat a previous answer.
 """
 
-    response_text = call_ai(prompt)
+def page_context(quiz_data):
+    """Quiz page text, downloadable items and structured page data for the prompt"""
+    context_parts = [
+        "=== QUIZ PAGE CONTENT ===",
+        quiz_data['text'],
+        "\n=== AVAILABLE FILES ===",
+    ]
+    
+    previews = quiz_data.get('previews') or {}
+    for link in quiz_data.get('all_links', []):
+        context_parts.append(f"[{link['type']}] {link['url']} - {link['text']}")
+        preview = previews.get(link['url'])
+        if preview:
+            context_parts.append(f"    preview: {json.dumps(preview, default=str)}")
+    
+    if quiz_data.get('dataframes'):
+        context_parts.append("\n=== STRUCTURED PAGE DATA (already loaded, set answer to null to compute on it) ===")
+        for name, df in quiz_data['dataframes'].items():
+            context_parts.append(f"{name}: {json.dumps(summarize_dataframe(df), default=str)}")
+    
+    return "\n".join(context_parts)
+
+def preview_links(links):
+    """Size and sample of linked data files, read with range requests; url -> preview"""
+    targets = [link['url'] for link in links if detect_file_type(link['url']) in PREVIEW_TYPES][:PREVIEW_MAX_LINKS]
+    if not targets:
+        return {}
+    preview = in_current_trace(lambda url: preview_file(url, detect_file_type(url)))
+    with span('preview_links', links=len(targets)), ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        return {url: p for url, p in zip(targets, pool.map(preview, targets)) if p}
+
+def solve_quiz_with_ai(quiz_data):
+    """Solve quiz using AI as a data analyst"""
+    print(f"\n{'='*60}")
+    print("SOLVING QUIZ WITH AI")
+    print(f"{'='*60}")
+    
+    # Static instructions first (cacheable prefix), the page last
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"STEP 1 - PLAN\n\n{page_context(quiz_data)}"}
+    ]
+
+    response_text = call_ai(messages)
     if not response_text:
         return None
+    # The solve step continues this conversation instead of resending the page
+    quiz_data['conversation'] = messages + [{"role": "assistant", "content": response_text}]
 
     try:
         # Parse response
@@ -451,8 +774,82 @@ If you cannot determine the answer without files, set answer to null.
         traceback.print_exc()
         return None
 
-def solve_with_processed_files(quiz_data, processed_files):
-    """Solve quiz after processing all files"""
+def collect_dataframes(processed_files, quiz_data=None):
+    """DataFrames from the quiz page and processed files, keyed by name or file URL"""
+    dataframes = dict((quiz_data or {}).get('dataframes') or {})
+    for pf in processed_files:
+        for key in ('csv_data', 'json_data'):
+            if pf.get(key) and pf[key].get('dataframe') is not None:
+                dataframes[pf['url']] = pf[key]['dataframe']
+        for sheet, data in (pf.get('excel_data') or {}).items():
+            dataframes[f"{pf['url']}#{sheet}"] = data['dataframe']
+    return dataframes
+
+def run_analysis_code(code, dataframes):
+    """Run model-written analysis code in the sandbox"""
+    print(f"\n🧪 Running analysis code in sandbox:")
+    print(code)
+    
+    with span('sandbox'):
+        outcome = run_code(code, dataframes)
+    if not outcome.get('ok'):
+        print(f"  ✗ Sandbox error: {outcome.get('error')}")
+        return None
+    
+    print(f"  ✓ Result: {outcome['result']}")
+    return outcome['result']
+
+def run_sql_query(sql, workspace):
+    """Run a model-written SQL query over the hop's SQL tables"""
+    print(f"\n🦆 Running SQL query:")
+    print(sql)
+    
+    try:
+        with span('sql'):
+            value = workspace.query(sql)
+    except Exception as e:
+        print(f"  ✗ SQL error: {e}")
+        return None
+    
+    print(f"  ✓ Result: {value}")
+    return value
+
+def apply_local_computation(result, processed_files, dataframes, workspace=None):
+    """Replace the model's answer with a locally computed one when it supplied SQL, code or an image operation"""
+    local_answer = None
+    if result.get('sql') and workspace is not None and workspace.tables:
+        local_answer = run_sql_query(result['sql'], workspace)
+    if local_answer is None and result.get('code') and dataframes:
+        local_answer = run_analysis_code(result['code'], dataframes)
+    elif local_answer is None and result.get('image_operation'):
+        local_answer = run_image_operation(processed_files, result['image_operation'])
+    
+    if local_answer is not None:
+        result['model_answer'] = result.get('answer')
+        result['answer'] = local_answer
+        result['computed_locally'] = True
+    return result
+
+def run_image_operation(processed_files, operation):
+    """Compute a pixel-level image operation locally"""
+    images = [pf for pf in processed_files if pf['type'] == 'image' and pf.get('image_bytes')]
+    if not images:
+        return None
+    
+    target = next((pf for pf in images if pf['url'] == operation.get('file')), images[0])
+    print(f"\n🧮 Local image operation: {operation.get('type')} on {target['url']}")
+    
+    arr = DataProcessor.load_image_array(target['image_bytes'])
+    value = DataProcessor.analyze_image(arr, operation)
+    if isinstance(value, dict) and 'error' in value:
+        print(f"  ✗ Image operation failed: {value['error']}")
+        return None
+    
+    print(f"  ✓ Result: {value}")
+    return value
+
+def solve_with_processed_files(quiz_data, processed_files, feedback=None):
+    """Solve quiz after processing all files (feedback: earlier wrong answers and the grader's reasons)"""
     print(f"\n{'='*60}")
     print("SOLVING WITH PROCESSED FILES")
     print(f"{'='*60}")
@@ -478,59 +875,110 @@ def solve_with_processed_files(quiz_data, processed_files):
             file_context.append(f"Columns: {csv_data['summary']['columns']}")
             file_context.append(f"First 10 rows: {json.dumps(csv_data['summary']['head'], indent=2)}")
             file_context.append(f"Statistics: {json.dumps(csv_data['summary']['describe'], indent=2)}")
+        
+        elif pf.get('sql_summary'):
+            summary = pf['sql_summary']
+            file_context.append(f"Shape: {summary['shape']}")
+            file_context.append(f"Columns: {json.dumps(summary['dtypes'])}")
+            file_context.append(f"First 10 rows: {json.dumps(summary['head'], indent=2, default=str)}")
+        
+        elif pf['type'] == 'json' and pf.get('json_data'):
+            summary = pf['json_data']['summary']
+            file_context.append(f"JSON Records Shape: {summary['shape']}")
+            file_context.append(f"Columns: {summary['columns']}")
+            file_context.append(f"First 10 rows: {json.dumps(summary['head'], indent=2, default=str)}")
+        
+        elif pf['type'] == 'json' and isinstance(pf.get('content'), str):
+            file_context.append("JSON Content:")
+            file_context.append(pf['content'][:2000])
+        
+        elif pf['type'] in ARCHIVE_TYPES:
+            file_context.append("Archive members (listed as files below):")
+            file_context.append(pf['content'] or "(none readable)")
+        
+        elif pf['type'] == 'excel' and pf.get('excel_data'):
+            for sheet, data in pf['excel_data'].items():
+                file_context.append(f"Sheet {sheet}: shape {data['summary']['shape']}, columns {data['summary']['columns']}")
+                file_context.append(f"First 10 rows: {json.dumps(data['summary']['head'], indent=2, default=str)}")
+        
+        elif pf['type'] == 'video':
+            if pf.get('transcription'):
+                file_context.append("Video Audio Transcription:")
+                file_context.append(pf['transcription'])
+            if pf.get('frame_text'):
+                file_context.append(f"Text in {pf['keyframe_count']} keyframe(s):")
+                file_context.append(pf['frame_text'][:2000])
+            if pf.get('vision_description'):
+                file_context.append("Keyframe Description:")
+                file_context.append(pf['vision_description'])
+        
+        elif pf['type'] == 'image':
+            if pf.get('ocr_text'):
+                file_context.append("Image OCR Text:")
+                file_context.append(pf['ocr_text'][:2000])
+            if pf.get('vision_description'):
+                file_context.append("Image Description:")
+                file_context.append(pf['vision_description'])
+            if pf.get('image_stats'):
+                file_context.append(f"Image Statistics: {json.dumps(pf['image_stats'])}")
+    
+    for name, df in (quiz_data.get('dataframes') or {}).items():
+        file_context.append(f"\n=== PAGE DATA: {name} ===")
+        file_context.append(json.dumps(summarize_dataframe(df, rows=10), default=str))
     
     files_text = "\n".join(file_context)
     
-    prompt = f"""You are an expert data analyst. You have been given a quiz question and all necessary files have been processed.
-
-=== ORIGINAL QUESTION ===
-{quiz_data['text']}
-
-=== PROCESSED FILES ===
-{files_text}
-
-YOUR TASK:
-You are a professional data analyst. You must:
-1. Understand what the question is asking
-2. Use the audio transcription (if any) to understand the exact task
-3. Analyze the data files (CSV, PDF, etc.)
-4. Perform the required calculations/analysis
-5. Provide the final answer
-
-CRITICAL:
-- If there's an audio file, it likely contains instructions on what to do
-- Follow those instructions EXACTLY
-- Actually perform calculations, don't just guess
-- The answer must be precise and correct
-
-RESPONSE FORMAT (JSON only):
-{{
-    "submit_url": "https://tds-llm-analysis.s-anand.net/submit",
-    "reasoning": "step by step explanation of your solution",
-    "calculations": "show your work",
-    "answer": your_final_answer
-}}
-
-The answer can be a number, string, boolean, or JSON object depending on what's asked.
+    dataframes = collect_dataframes(processed_files, quiz_data)
+    data_text = ""
+    if dataframes:
+        data_text = f"\n=== DATA FOR LOCAL CODE ===\n`dfs` keys: {list(dataframes.keys())}\n"
+    workspace = quiz_data.get('sql')
+    if workspace is not None and workspace.tables:
+        tables = "\n".join(f"{pf['sql_table']}: {pf['url']}" for pf in processed_files if pf.get('sql_table'))
+        data_text += f"\n=== SQL TABLES ===\n{tables}\n"
+    
+    feedback_text = ""
+    if feedback:
+        attempts = "\n".join(
+            f"- Answer {json.dumps(f['answer'], default=str)} was graded WRONG. Grader said: {f['reason']}"
+            for f in feedback)
+        feedback_text = f"""
+=== PREVIOUS ATTEMPTS (all graded wrong) ===
+{attempts}
 """
+    
+    # Continue the planning conversation: the page is already in it
+    conversation = quiz_data.get('conversation') or [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"STEP 1 - PLAN\n\n{page_context(quiz_data)}"}
+    ]
+    messages = conversation + [{
+        "role": "user",
+        "content": f"STEP 2 - SOLVE\n\n=== PROCESSED FILES ===\n{files_text}\n{data_text}{feedback_text}"
+    }]
 
-    response_text = call_ai(prompt)
-    if not response_text:
+    if ENSEMBLE_SIZE > 1:
+        responses = [text for _, text in call_ai_ensemble(messages)]
+    else:
+        response_text = call_ai(messages)
+        responses = [response_text] if response_text else []
+    if not responses:
         return None
 
     try:
-        response_text = response_text.strip()
-        for marker in ['```json', '```', '`']:
-            response_text = response_text.replace(marker, '')
-        response_text = response_text.strip()
-        
-        start = response_text.find('{')
-        end = response_text.rfind('}') + 1
+        candidates = []
+        for response_text in responses:
+            try:
+                candidate = parse_ai_json(response_text)
+            except ValueError as e:
+                print(f"✗ Parse error in candidate: {e}")
+                continue
+            if candidate:
+                candidates.append(apply_local_computation(candidate, processed_files, dataframes, workspace))
         
-        if start == -1 or end == 0:
+        if not candidates:
             return None
-        
-        result = json.loads(response_text[start:end])
+        result = candidates[0] if len(candidates) == 1 else vote_on_candidates(candidates)
         
         print("\n✓ Final answer:")
         print(json.dumps(result, indent=2))
@@ -547,6 +995,7 @@ The answer can be a number, string, boolean, or JSON object depending on what's
         print(f"✗ Parse error: {e}")
         return None
 
+@traced('submit_answer')
 def submit_answer(submit_url, email, secret, quiz_url, answer):
     """Submit answer"""
     print(f"\n{'='*60}")
@@ -575,8 +1024,69 @@ def submit_answer(submit_url, email, secret, quiz_url, answer):
         print(f"✗ Error: {e}")
         return {"correct": False, "reason": str(e)}
 
-def solve_quiz_chain(initial_url, email, secret, max_time=180):
-    """Solve complete quiz chain"""
+def solve_quiz(quiz_url):
+    """Fetch and solve one quiz; returns (solution, quiz_data, processed_files, error)"""
+    processed_files = []
+    
+    # Fetch page
+    quiz_data = fetch_quiz_page(quiz_url)
+    # Headers and page counts of linked files help the plan without downloading them
+    quiz_data['previews'] = preview_links(quiz_data.get('all_links', []))
+    
+    # Solve with AI
+    solution = solve_quiz_with_ai(quiz_data)
+    if not solution:
+        return None, quiz_data, processed_files, "Failed to parse"
+
+    # Download and process files if needed
+    if solution.get("files_needed"):
+        print(f"\n📎 Processing {len(solution['files_needed'])} files...")
+        
+        # Downloads overlap; CPU-bound processing is handed to the processor pool
+        # and data files land in the hop's SQL workspace
+        quiz_data['sql'] = open_sql_workspace()
+        download = in_current_trace(lambda url: download_and_process_file(url, quiz_data['sql']))
+        workers = max(1, min(DOWNLOAD_WORKERS, len(solution['files_needed'])))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for pf in pool.map(download, solution['files_needed']):
+                if pf:
+                    # Archive members are processed files of their own
+                    processed_files.append(pf)
+                    processed_files.extend(pf.pop('members', []))
+        
+        # One batched vision call for images OCR could not read
+        needs_vision = [pf for pf in processed_files if pf.get('vision_image')]
+        if needs_vision:
+            describe_images_with_ai(quiz_data['text'], needs_vision)
+        
+        if processed_files:
+            # Re-solve with processed files
+            solution = solve_with_processed_files(quiz_data, processed_files)
+            if not solution:
+                return None, quiz_data, processed_files, "Failed with files"
+    
+    elif solution.get("answer") is None and quiz_data.get('dataframes'):
+        # Answer needs computing over the page's tables/API data
+        solution = solve_with_processed_files(quiz_data, [])
+        if not solution:
+            return None, quiz_data, processed_files, "Failed with page data"
+    
+    return solution, quiz_data, processed_files, None
+
+def open_result_store():
+    """Result store, or None if the database is unavailable (solving still works)"""
+    try:
+        return get_result_store()
+    except Exception as e:
+        print(f"✗ Result store unavailable: {e}")
+        return None
+
+def solve_quiz_chain(initial_url, email, secret, max_time=180, job_id=None, on_hop=None, leased=False):
+    """Solve complete quiz chain (on_hop(results, next_url) is called after every graded hop)
+
+    Only a job_id passed in resumes an earlier run; leased=True means the caller
+    holds the job's work-queue lease, so a run still marked running is taken over.
+    """
     print(f"\n{'#'*60}")
     print(f"# QUIZ CHAIN START")
     print(f"{'#'*60}\n")
@@ -584,64 +1094,113 @@ def solve_quiz_chain(initial_url, email, secret, max_time=180):
     start_time = time.time()
     current_url = initial_url
     results = []
+    # Model calls of chains closest to their deadline are served first
+    set_job_deadline(time.monotonic() + max_time)
+    
+    # Resume an interrupted run of the same job from its last unanswered URL
+    store = open_result_store()
+    job_id = job_id or ResultStore.new_job_id()
+    if store:
+        current_url, results = store.start_job(job_id, email, initial_url, leased=leased)
+    
+    # Warm sandbox interpreters while the browser loads the first page
+    get_sandbox_pool()
 
-    while current_url and (time.time() - start_time) < max_time:
-        print(f"\n{'*'*60}")
-        print(f"Quiz #{len(results) + 1}")
-        print(f"Time: {time.time() - start_time:.1f}s / {max_time}s")
-        print(f"{'*'*60}")
+    # Every exit gives the job a terminal status, so it is never left "running"
+    outcome = "failed"
+    try:
+        while current_url and (time.time() - start_time) < max_time:
+            print(f"\n{'*'*60}")
+            print(f"Quiz #{len(results) + 1}")
+            print(f"Time: {time.time() - start_time:.1f}s / {max_time}s")
+            print(f"{'*'*60}")
 
-        # Fetch page
-        quiz_data = fetch_quiz_page(current_url)
+            hop_start = time.time()
+            quiz_data, processed_files = None, []
         
-        # Solve with AI
-        solution = solve_quiz_with_ai(quiz_data)
-        if not solution:
-            results.append({"url": current_url, "error": "Failed to parse"})
-            break
-
-        # Download and process files if needed
-        if solution.get("files_needed"):
-            print(f"\n📎 Processing {len(solution['files_needed'])} files...")
-            
-            processed_files = []
-            for file_url in solution['files_needed']:
-                pf = download_and_process_file(file_url)
-                if pf:
-                    processed_files.append(pf)
-            
-            if processed_files:
-                # Re-solve with processed files
-                solution = solve_with_processed_files(quiz_data, processed_files)
+            known = store.correct_answer(current_url, email) if store else None
+            if known:
+                # Already graded correct earlier: resubmit without re-solving
+                submit_url, answer, _ = known
+                print(f"\n♻️ Reusing correct answer from store: {answer}")
+                solution = {"submit_url": submit_url, "answer": answer}
+            else:
+                solution, quiz_data, processed_files, error = solve_quiz(current_url)
                 if not solution:
-                    results.append({"url": current_url, "error": "Failed with files"})
+                    results.append({"url": current_url, "error": error})
                     break
 
-        # Submit
-        submit_result = submit_answer(
-            solution["submit_url"],
-            email,
-            secret,
-            current_url,
-            solution["answer"]
-        )
+            # Submit
+            submit_result = submit_answer(
+                solution["submit_url"],
+                email,
+                secret,
+                current_url,
+                solution["answer"]
+            )
+        
+            # Retry only the final solve step, reusing the page, files and DataFrames
+            retries = 0
+            feedback = []
+            while (not submit_result.get("correct") and quiz_data is not None
+                   and retries < MAX_ANSWER_RETRIES
+                   and max_time - (time.time() - start_time) > RETRY_MIN_SECONDS):
+                retries += 1
+                feedback.append({"answer": solution["answer"], "reason": submit_result.get("reason")})
+                print(f"\n🔁 Retry {retries}/{MAX_ANSWER_RETRIES} with grader feedback: {submit_result.get('reason')}")
+            
+                with span('retry', attempt=retries):
+                    retry = solve_with_processed_files(quiz_data, processed_files, feedback=feedback)
+                if not retry or retry.get("answer") in [f["answer"] for f in feedback]:
+                    print("  ✗ No new answer, keeping the graded result")
+                    break
+            
+                retry["submit_url"] = retry.get("submit_url") or solution["submit_url"]
+                solution = retry
+                submit_result = submit_answer(
+                    solution["submit_url"],
+                    email,
+                    secret,
+                    current_url,
+                    solution["answer"]
+                )
+        
+            hop_seconds = round(time.time() - hop_start, 2)
+            results.append({
+                "url": current_url,
+                "answer": solution["answer"],
+                "correct": submit_result.get("correct"),
+                "reason": submit_result.get("reason"),
+                "attempts": retries + 1,
+                "seconds": hop_seconds
+            })
+        
+            if store:
+                store.record_hop(job_id, email, current_url, solution["submit_url"], solution["answer"],
+                                 submit_result.get("correct"), submit_result.get("reason"),
+                                 submit_result.get("url"), hop_seconds)
+            if on_hop:
+                on_hop(results, submit_result.get("url"))
 
-        results.append({
-            "url": current_url,
-            "answer": solution["answer"],
-            "correct": submit_result.get("correct"),
-            "reason": submit_result.get("reason")
-        })
+            if submit_result.get("correct"):
+                print("\n✅ CORRECT")
+            else:
+                print(f"\n❌ WRONG: {submit_result.get('reason')}")
 
-        if submit_result.get("correct"):
-            print("\n✅ CORRECT")
+            release_hop_data(quiz_data, processed_files)
+            quiz_data = processed_files = None
+        
+            current_url = submit_result.get("url")
+            if not current_url:
+                print("\n✓ Chain complete")
+                outcome = "completed"
+                break
         else:
-            print(f"\n❌ WRONG: {submit_result.get('reason')}")
-
-        current_url = submit_result.get("url")
-        if not current_url:
-            print("\n✓ Chain complete")
-            break
+            print(f"\n⏱ Out of time after {len(results)} quizzes")
+            outcome = "timed_out"
+    finally:
+        if store:
+            store.finish_job(job_id, outcome)
 
     print(f"\n{'#'*60}")
     print(f"# FINISHED: {len(results)} quizzes")
@@ -668,18 +1227,77 @@ def handle_quiz():
         if not quiz_url:
             return jsonify({"error": "No URL provided"}), 400
 
-        results = solve_quiz_chain(quiz_url, YOUR_EMAIL, YOUR_SECRET)
+        # Only a job_id sent by the caller resumes an earlier run
+        job_id = data.get("job_id") or ResultStore.new_job_id()
+
+        # Queue mode: worker processes (any node) run the chain, poll /jobs/<id>
+        queue = get_work_queue()
+        if queue:
+            queue.enqueue(job_id, {"url": quiz_url, "email": YOUR_EMAIL})
+            return jsonify({"status": "queued", "job_id": job_id}), 202
+
+        with job_account() as account, job_trace() as trace:
+            results = solve_quiz_chain(quiz_url, YOUR_EMAIL, YOUR_SECRET, job_id=job_id)
+
+        return jsonify({
+            "status": "completed",
+            "job_id": job_id,
+            "results": results,
+            "trace": trace.to_dict(),
+            "memory": account.to_dict()
+        }), 200
 
-        return jsonify({"status": "completed", "results": results}), 200
+    except JobRunning as e:
+        return jsonify({"error": str(e), "job_id": job_id}), 409
 
     except Exception as e:
         print(f"\n✗ ERROR: {e}")
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Progress of a chain as recorded in the work queue or the result store"""
+    queue = get_work_queue()
+    job = queue.status(job_id) if queue else None
+    if job:
+        body = {
+            "job_id": job_id,
+            "status": job["status"],
+            "current_url": job["current_url"],
+            "attempt": job["attempts"],
+            "worker": job["worker"],
+            "results": job["results"]
+        }
+        if job["response"]:
+            body.update(trace=job["response"].get("trace"), memory=job["response"].get("memory"))
+        if job["error"]:
+            body["error"] = job["error"]
+        return jsonify(body), 200
+    
+    store = open_result_store()
+    job = store.job_status(job_id) if store else None
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({
+        "job_id": job_id,
+        "status": job["status"],
+        "current_url": job["current_url"],
+        "attempt": job["attempt"],
+        "results": store.job_results(job_id)
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy"}), 200
+    return jsonify({
+        "status": "healthy",
+        "browser": get_browser_manager().stats(),
+        "llm": get_governor().stats()
+    }), 200
 
 @app.route('/', methods=['GET'])
 def index():
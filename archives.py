@@ -0,0 +1,64 @@
+"""
+Streaming iteration over archive downloads (zip, gzip).
+
+Members are yielded one at a time as chunk iterators, so the caller can
+spool each one (under the usual size cap and job budget), run it through
+the processor for its own type and release it before the next member is
+decompressed. Nothing is extracted to disk or held in memory as a whole.
+"""
+import gzip
+import os
+import zipfile
+
+ARCHIVE_TYPES = ('zip', 'gzip')
+ARCHIVE_MAX_MEMBERS = int(os.environ.get("ARCHIVE_MAX_MEMBERS", 50))
+ARCHIVE_MAX_DEPTH = int(os.environ.get("ARCHIVE_MAX_DEPTH", 2))
+ARCHIVE_CHUNK_SIZE = 256 * 1024
+
+
+def read_chunks(f, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """Chunks of a (decompressing) file object until EOF"""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _skip_member(name):
+    """Directories and OS metadata files are not data"""
+    base = os.path.basename(name.rstrip('/'))
+    return name.endswith('/') or name.startswith('__MACOSX/') or base.startswith('._') or base == '.DS_Store'
+
+
+def iter_zip(stream):
+    zf = zipfile.ZipFile(stream)
+    try:
+        count = 0
+        for info in zf.infolist():
+            if info.is_dir() or _skip_member(info.filename):
+                continue
+            if count == ARCHIVE_MAX_MEMBERS:
+                print(f"  ⚠️ Archive has more than {ARCHIVE_MAX_MEMBERS} members, rest skipped")
+                return
+            count += 1
+            with zf.open(info) as member:
+                yield info.filename, read_chunks(member)
+    finally:
+        zf.close()
+
+
+def iter_gzip(stream, name):
+    # A gzip file holds one member: the archive name without .gz
+    inner = name[:-3] if name.lower().endswith('.gz') else name
+    with gzip.GzipFile(fileobj=stream, mode='rb') as member:
+        yield inner, read_chunks(member)
+
+
+def iter_members(file_type, stream, name):
+    """(member name, chunk iterator) for each file in the archive; consume each before the next"""
+    if file_type == 'zip':
+        return iter_zip(stream)
+    if file_type == 'gzip':
+        return iter_gzip(stream, name)
+    raise ValueError(f"Not an archive type: {file_type}")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark: lean vs full browser profile.
+Renders the same quiz pages with each profile of get_browser() and reports
+launch and load time, DOM/JS heap size and Chrome's resident memory.
+Defaults to the local mock quiz server; pass --url to measure a real page.
+Needs Chrome/Chromium.
+Usage: python benchmarks/bench_browser_profiles.py [--url URL] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+os.environ.setdefault("AIPIPE_TOKEN", "bench")
+
+import mock_quiz_server
+from run_benchmark import serve
+from browser_pool import get_browser, browser_metrics
+
+PROFILES = ["lean", "full"]
+
+def render(profile, url):
+    """Launch, load and measure one page; returns a row of timings and metrics"""
+    from selenium.webdriver.common.by import By
+
+    start = time.perf_counter()
+    driver = get_browser(profile)
+    launched = time.perf_counter()
+    try:
+        driver.get(url)
+        text = driver.find_element(By.TAG_NAME, "body").text
+        loaded = time.perf_counter()
+        row = browser_metrics(driver)
+    finally:
+        driver.quit()
+    row.update(launch_s=launched - start, load_s=loaded - launched, text_chars=len(text))
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", action="append", help="page to render (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    urls = args.url
+    if not urls:
+        server, base = serve(mock_quiz_server.create_app())
+        urls = [f"{base}/quiz/{step}" for step in range(len(mock_quiz_server.DEFAULT_CHAIN))]
+
+    print("=" * 96)
+    print("Browser profiles")
+    print("=" * 96)
+    print(f"{'profile':<8} {'launch s':>9} {'load s':>8} {'dom ms':>8} {'nodes':>7} "
+          f"{'js heap MB':>11} {'chrome MB':>10} {'text':>6}")
+    for profile in PROFILES:
+        rows = [render(profile, url) for url in urls for _ in range(args.repeat)]
+        mean = lambda key: sum(r.get(key, 0) for r in rows) / len(rows)
+        print(f"{profile:<8} {mean('launch_s'):>9.2f} {mean('load_s'):>8.2f} {mean('dom_ready_ms'):>8.0f} "
+              f"{mean('dom_nodes'):>7.0f} {mean('js_heap_mb'):>11.1f} {mean('browser_rss_mb'):>10.1f} "
+              f"{mean('text_chars'):>6.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: single-pass lxml page parsing vs the previous BeautifulSoup extractor
+Usage: python benchmarks/bench_html_parsing.py [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import time
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import parse_page
+from data_processor import DataProcessor
+
+BASE_URL = "https://quiz.example.test/page"
+
+def legacy_extract_all_links(html, base_url):
+    """The previous extractor: html.parser plus one find_all per tag"""
+    soup = BeautifulSoup(html, 'html.parser')
+    links = []
+    for a_tag in soup.find_all('a', href=True):
+        links.append({'url': urljoin(base_url, a_tag['href']), 'text': a_tag.get_text(strip=True), 'type': 'link'})
+    for source_tag in soup.find_all('source', src=True):
+        links.append({'url': urljoin(base_url, source_tag['src']), 'text': 'media', 'type': 'media'})
+    for audio_tag in soup.find_all('audio', src=True):
+        links.append({'url': urljoin(base_url, audio_tag['src']), 'text': 'audio', 'type': 'audio'})
+    for video_tag in soup.find_all('video', src=True):
+        links.append({'url': urljoin(base_url, video_tag['src']), 'text': 'video', 'type': 'video'})
+    return links
+
+def legacy_pipeline(html, base_url):
+    """Old behaviour: extract links, then reparse the same HTML to scrape text"""
+    links = legacy_extract_all_links(html, base_url)
+    text = BeautifulSoup(html, 'html.parser').get_text(strip=True)
+    return links, text
+
+def new_pipeline(html, base_url):
+    """New behaviour: one parse, tree shared with the scraper"""
+    page = parse_page(html, base_url)
+    text = DataProcessor.scrape_data_from_html(page['tree'])
+    return page['links'], text
+
+def make_page(n_blocks):
+    """Synthetic quiz page with links, media, scripts, a form and a table"""
+    parts = ["<html><head><title>Quiz</title>",
+             "<script>fetch('/api/data?page=1').then(r => r.json())</script></head><body>"]
+    for i in range(n_blocks):
+        parts.append(f"<div class='q'><p>Question {i}: sum the <b>value</b> column.</p>"
+                     f"<a href='/files/data{i}.csv'>data {i}</a>"
+                     f"<audio src='/files/clip{i}.mp3'></audio>"
+                     f"<video><source src='/files/clip{i}.mp4'></video>"
+                     f"<img src='/files/chart{i}.png' alt='chart {i}'></div>")
+    parts.append("<form action='/submit' method='post'><input name='answer'></form>")
+    parts.append("<table><tr><th>id</th><th>value</th></tr>")
+    for i in range(n_blocks):
+        parts.append(f"<tr><td>{i}</td><td>{i * 3}</td></tr>")
+    parts.append("</table></body></html>")
+    return "".join(parts)
+
+def time_it(fn, html, repeat):
+    """Best-of-repeat wall time in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html, BASE_URL)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'blocks':>8} {'size KB':>9} {'legacy links':>13} {'lxml links':>11} {'legacy+text':>12} {'lxml+text':>10} {'speedup':>8}")
+    for n_blocks in (10, 100, 1000, 5000):
+        html = make_page(n_blocks)
+        legacy_links = time_it(legacy_extract_all_links, html, args.repeat)
+        new_links = time_it(lambda h, b: parse_page(h, b)['links'], html, args.repeat)
+        legacy_total = time_it(legacy_pipeline, html, args.repeat)
+        new_total = time_it(new_pipeline, html, args.repeat)
+        print(f"{n_blocks:>8} {len(html) / 1024:>9.1f} {legacy_links:>11.2f}ms {new_links:>9.2f}ms "
+              f"{legacy_total:>10.2f}ms {new_total:>8.2f}ms {legacy_total / new_total:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark: worker startup cost.
+Reports `import app` wall time (lazy imports), the cost of preloading heavy
+modules, each heavy module's import time in a fresh interpreter, and the
+slowest modules from `python -X importtime -c "import app"`.
+Usage: python benchmarks/bench_startup.py [--repeat 3] [--top 15]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lazy_imports import HEAVY_MODULES
+
+ENV = dict(os.environ, AIPIPE_TOKEN=os.environ.get("AIPIPE_TOKEN", "bench"))
+
+def time_snippet(code, repeat):
+    """Best-of-repeat seconds for running `code` in a fresh interpreter"""
+    timer = f"import time; _t = time.perf_counter()\n{code}\nprint(time.perf_counter() - _t)"
+    best = float('inf')
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", timer], cwd=ROOT, env=ENV,
+                             capture_output=True, text=True, check=True)
+        best = min(best, float(out.stdout.strip().splitlines()[-1]))
+    return best
+
+def importtime_top(n):
+    """Slowest imports (cumulative) as reported by -X importtime"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=ENV,
+                         capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(cumulative_us), int(self_us), depth, name.strip()))
+    top_level = [r for r in rows if r[2] == 0]
+    return sorted(top_level, reverse=True)[:n]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    lazy = time_snippet("import app", args.repeat)
+    preload = time_snippet("import app\nfrom lazy_imports import preload_heavy_modules\npreload_heavy_modules()",
+                           args.repeat)
+
+    print("=" * 60)
+    print("Worker startup")
+    print("=" * 60)
+    print(f"import app (lazy):                 {lazy * 1000:8.1f} ms")
+    print(f"import app + preload heavy modules: {preload * 1000:8.1f} ms")
+    print(f"-> paid once in the gunicorn master instead of per worker boot")
+
+    print(f"\n{'module':<40} {'import ms':>10}")
+    for name in HEAVY_MODULES + ["matplotlib.figure"]:
+        seconds = time_snippet(f"import {name}", args.repeat)
+        print(f"{name:<40} {seconds * 1000:>10.1f}")
+
+    print(f"\nSlowest imports during `import app` (-X importtime):")
+    print(f"{'module':<40} {'cumulative ms':>14} {'self ms':>9}")
+    for cumulative, self_us, _, name in importtime_top(args.top):
+        print(f"{name:<40} {cumulative / 1000:>14.1f} {self_us / 1000:>9.1f}")
+
+if __name__ == "__main__":
+    main()
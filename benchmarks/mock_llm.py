@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+OpenAI-compatible mock chat completions server for offline benchmarks.
+Understands the prompts app.py sends for pages served by mock_quiz_server.py
+and answers after a configurable latency.
+Usage: python benchmarks/mock_llm.py [--port 8002] [--latency 0.5] [--jitter 0.2] [--rate-limit 0.0]
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+
+from flask import Flask, request, jsonify
+
+SUBMIT_PATTERN = re.compile(r"POST your answer as JSON to (\S+)")
+KEY_PATTERN = re.compile(r"Answer key \(mock\): (.+)")
+FILE_PATTERN = re.compile(r"\[(?:link|media|audio|video|image)\] (\S+/assets/\S+)")
+
+def message_text(messages):
+    """Concatenated text of all messages, plus the number of image parts"""
+    texts = []
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    images += 1
+    return "\n".join(texts), images
+
+def answer_for(prompt, images, last_message=""):
+    """The JSON reply a competent model would give for this conversation"""
+    if images:
+        return {"descriptions": [f"mock description of image {i + 1}" for i in range(images)]}
+
+    submit = SUBMIT_PATTERN.search(prompt)
+    key = KEY_PATTERN.search(prompt)
+    reply = {
+        "submit_url": submit.group(1) if submit else None,
+        "reasoning": "mock reasoning",
+        "answer": json.loads(key.group(1)) if key else None,
+    }
+
+    if "STEP 2 - SOLVE" in last_message:
+        if "=== DATA FOR LOCAL CODE ===" in last_message and 'sum of the "value" column' in prompt:
+            reply["answer"] = None
+            reply["code"] = "result = int(df['value'].sum())"
+        elif "Type: image" in last_message and "red (#ff0000) pixels" in prompt:
+            reply["image_operation"] = {"type": "count_color", "color": "#ff0000", "tolerance": 0}
+        return reply
+
+    files = list(dict.fromkeys(FILE_PATTERN.findall(prompt)))
+    reply["files_needed"] = files
+    if files:
+        reply["answer"] = None
+    return reply
+
+def cached_prefix_tokens(messages, seen):
+    """Simulated provider prompt cache: tokens of the longest message prefix sent before"""
+    cached = 0
+    for i in range(1, len(messages)):
+        key = hash(json.dumps(messages[:i], sort_keys=True))
+        tokens = len(message_text(messages[:i])[0]) // 4
+        if key in seen:
+            # Providers cache in 128-token blocks above a 1024-token minimum
+            cached = tokens // 128 * 128 if tokens >= 1024 else 0
+        seen.add(key)
+    return cached
+
+def create_app(latency=0.5, jitter=0.2, rate_limit=0.0):
+    app = Flask(__name__)
+    seen_prefixes = set()
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        data = request.get_json(silent=True) or {}
+        if rate_limit and random.random() < rate_limit:
+            response = jsonify({"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}})
+            response.headers["Retry-After"] = "1"
+            return response, 429
+
+        time.sleep(latency + random.uniform(0, jitter))
+
+        messages = data.get("messages", [])
+        prompt, images = message_text(messages)
+        last_message = message_text(messages[-1:])[0]
+        content = json.dumps(answer_for(prompt, images, last_message))
+        prompt_tokens = len(prompt) // 4 + images * 85
+        cached_tokens = cached_prefix_tokens(messages, seen_prefixes)
+        completion_tokens = len(content) // 4
+        return jsonify({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": data.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of calls answered with 429")
+    args = parser.parse_args()
+    create_app(args.latency, args.jitter, args.rate_limit).run(host="127.0.0.1", port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    main()
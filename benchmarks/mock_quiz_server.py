@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Local mock of the quiz service: static and JS-rendered pages, CSV/PDF/audio/image
+assets and a submit endpoint that walks a multi-hop chain.
+Usage: python benchmarks/mock_quiz_server.py [--port 8001] [--chain static,js,csv,pdf,audio,image]
+"""
+
+import argparse
+import base64
+import io
+import json
+import struct
+import wave
+from urllib.parse import urlparse
+
+from flask import Flask, request, jsonify, Response
+from PIL import Image
+
+DEFAULT_CHAIN = ["static", "js", "csv", "pdf", "audio", "image"]
+CSV_ROWS = 500
+
+# Embedded for the mock LLM only; a real model never sees this line format
+ANSWER_KEY_FORMAT = "Answer key (mock): {}"
+
+def expected_answer(kind, step):
+    """Deterministic expected answer for a hop"""
+    if kind == "csv":
+        return sum(i * (step + 1) for i in range(CSV_ROWS))
+    if kind == "image":
+        return 40 * 30
+    return f"answer-{kind}-{step}"
+
+def make_csv(step):
+    lines = ["id,value,category"]
+    for i in range(CSV_ROWS):
+        lines.append(f"{i},{i * (step + 1)},{'abc'[i % 3]}")
+    return "\n".join(lines) + "\n"
+
+def make_pdf(text):
+    """Minimal single-page PDF containing one line of text"""
+    stream = f"BT /F1 14 Tf 72 720 Td ({text}) Tj ET".encode('latin-1')
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{i} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+def make_wav(seconds=1.0, rate=8000):
+    """Short silent mono WAV"""
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(struct.pack('<h', 0) * int(seconds * rate))
+    return out.getvalue()
+
+def make_png():
+    """White image with a 40x30 red block"""
+    img = Image.new('RGB', (200, 120), 'white')
+    img.paste((255, 0, 0), (10, 10, 50, 40))
+    out = io.BytesIO()
+    img.save(out, format='PNG')
+    return out.getvalue()
+
+def create_app(chain=None):
+    chain = chain or DEFAULT_CHAIN
+    app = Flask(__name__)
+
+    def quiz_url(step):
+        return f"{request.host_url}quiz/{step}"
+
+    def question(kind, step):
+        base = request.host_url
+        submit = f"POST your answer as JSON to {base}submit"
+        key = ANSWER_KEY_FORMAT.format(json.dumps(expected_answer(kind, step)))
+        if kind == "csv":
+            body = (f"<p>Download <a href='/assets/{step}/data.csv'>data.csv</a>. "
+                    f"What is the sum of the \"value\" column?</p>")
+        elif kind == "pdf":
+            body = f"<p>Read <a href='/assets/{step}/report.pdf'>the report</a> and give its code.</p>"
+        elif kind == "audio":
+            body = f"<p>Listen to the instructions: <audio src='/assets/{step}/clip.wav'></audio></p>"
+        elif kind == "image":
+            body = (f"<p>How many red (#ff0000) pixels are in this chart? "
+                    f"<img src='/assets/{step}/chart.png' alt='chart'></p>")
+        else:
+            body = f"<p>Quiz {step}: reply with the code for this step.</p>"
+        return f"{body}<p>{submit}</p><p>{key}</p>"
+
+    @app.route('/quiz/<int:step>')
+    def quiz_page(step):
+        if step >= len(chain):
+            return "No such quiz", 404
+        kind = chain[step]
+        html = question(kind, step)
+        if kind == "js":
+            # Content only exists after the page's script runs, like the real quiz
+            encoded = base64.b64encode(html.encode()).decode()
+            html = f"<div id='result'></div><script>document.querySelector('#result').innerHTML = atob('{encoded}');</script>"
+        return f"<html><body>{html}</body></html>"
+
+    @app.route('/assets/<int:step>/<name>')
+    def asset(step, name):
+        kind = chain[step]
+        if kind == "csv":
+            return Response(make_csv(step), mimetype='text/csv')
+        if kind == "pdf":
+            return Response(make_pdf(f"The code is {expected_answer(kind, step)}"), mimetype='application/pdf')
+        if kind == "audio":
+            return Response(make_wav(), mimetype='audio/wav')
+        if kind == "image":
+            return Response(make_png(), mimetype='image/png')
+        return "Not found", 404
+
+    @app.route('/submit', methods=['POST'])
+    def submit():
+        data = request.get_json(silent=True) or {}
+        path = urlparse(data.get("url", "")).path
+        try:
+            step = int(path.rstrip('/').rsplit('/', 1)[-1])
+        except ValueError:
+            return jsonify({"correct": False, "reason": "Unknown quiz URL"}), 400
+
+        expected = expected_answer(chain[step], step)
+        answer = data.get("answer")
+        correct = answer == expected or str(answer) == str(expected)
+        result = {"correct": correct, "reason": None if correct else f"Expected {expected!r}"}
+        if step + 1 < len(chain):
+            result["url"] = quiz_url(step + 1)
+        return jsonify(result)
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--chain", default=",".join(DEFAULT_CHAIN))
+    args = parser.parse_args()
+    create_app(args.chain.split(",")).run(host="127.0.0.1", port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    main()
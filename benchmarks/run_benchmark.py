@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark: drives solve_quiz_chain and the /quiz endpoint against the
+local mock quiz server and mock LLM at several concurrency levels.
+Reports p50/p95 latency per stage, peak memory and quizzes per minute.
+Needs Chrome/Chromium (pages are rendered exactly as in production).
+Usage: python benchmarks/run_benchmark.py [--concurrency 1,2,4] [--chains 4] [--llm-latency 0.5] [--json report.json]
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import mock_llm
+import mock_quiz_server
+from tracing import percentile
+
+EMAIL = "bench@example.com"
+SECRET = "bench-secret"
+
+def serve(flask_app):
+    """Run a Flask app on a free local port in a background thread"""
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def peak_rss_mb():
+    """Peak RSS of this process and of its (reaped) children such as Chrome"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(own, 1), round(children, 1)
+
+def summarize(label, concurrency, wall, traces, chain_results):
+    """Per-stage p50/p95 and throughput for one benchmark level"""
+    stages = {}
+    prompt_tokens = cached_tokens = 0
+    for trace in traces:
+        for s in trace["spans"]:
+            stages.setdefault(s["name"], []).append(s["duration"])
+            prompt_tokens += s.get("attrs", {}).get("prompt_tokens", 0)
+            cached_tokens += s.get("attrs", {}).get("cached_prompt_tokens", 0)
+
+    hops = [hop for results in chain_results for hop in results]
+    correct = sum(1 for hop in hops if hop.get("correct"))
+    traced_mem, traced_peak = tracemalloc.get_traced_memory()
+    own_rss, child_rss = peak_rss_mb()
+
+    return {
+        "mode": label,
+        "concurrency": concurrency,
+        "chains": len(chain_results),
+        "quizzes": len(hops),
+        "correct": correct,
+        "wall_seconds": round(wall, 2),
+        "quizzes_per_minute": round(len(hops) / wall * 60, 2) if wall else None,
+        "chain_p50": percentile([t["total_seconds"] for t in traces], 50),
+        "chain_p95": percentile([t["total_seconds"] for t in traces], 95),
+        "python_heap_peak_mb": round(traced_peak / 1024 / 1024, 1),
+        "peak_rss_mb": own_rss,
+        "peak_child_rss_mb": child_rss,
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": cached_tokens,
+        "stages": {
+            name: {
+                "count": len(durations),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+            }
+            for name, durations in sorted(stages.items())
+        }
+    }
+
+def bench_job_id():
+    """Fresh job id, so a chain never resumes an earlier run of the same URL"""
+    return f"bench-{uuid.uuid4().hex}"
+
+def run_direct(app_module, quiz_url, concurrency, chains):
+    """Call solve_quiz_chain in-process from `concurrency` threads"""
+    from tracing import job_trace
+
+    def one_chain(_):
+        with job_trace() as trace:
+            results = app_module.solve_quiz_chain(quiz_url, EMAIL, SECRET, job_id=bench_job_id())
+        return results, trace.to_dict()
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one_chain, range(chains)))
+    wall = time.time() - start
+    return wall, [o[1] for o in outcomes], [o[0] for o in outcomes]
+
+def run_endpoint(endpoint, quiz_url, concurrency, chains):
+    """POST to /quiz from `concurrency` threads"""
+    def one_chain(_):
+        response = requests.post(endpoint, json={"email": EMAIL, "secret": SECRET, "url": quiz_url, "job_id": bench_job_id()},
+                                 timeout=600)
+        body = response.json()
+        return body.get("results", []), body.get("trace", {"spans": [], "total_seconds": 0})
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one_chain, range(chains)))
+    wall = time.time() - start
+    return wall, [o[1] for o in outcomes], [o[0] for o in outcomes]
+
+def print_report(report):
+    print(f"\n{'=' * 60}")
+    print(f"{report['mode']} | concurrency {report['concurrency']} | {report['chains']} chains")
+    print(f"{'=' * 60}")
+    print(f"Quizzes: {report['quizzes']} ({report['correct']} correct) in {report['wall_seconds']}s "
+          f"-> {report['quizzes_per_minute']} quizzes/min")
+    print(f"Chain p50/p95: {report['chain_p50']}s / {report['chain_p95']}s")
+    print(f"Memory: heap peak {report['python_heap_peak_mb']} MB, "
+          f"RSS peak {report['peak_rss_mb']} MB, children {report['peak_child_rss_mb']} MB")
+    print(f"Prompt tokens: {report['prompt_tokens']} ({report['cached_prompt_tokens']} served from cache)")
+    print(f"{'stage':<28} {'n':>5} {'p50 s':>9} {'p95 s':>9}")
+    for name, stats in report["stages"].items():
+        print(f"{name:<28} {stats['count']:>5} {stats['p50']:>9.3f} {stats['p95']:>9.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chain", default=",".join(mock_quiz_server.DEFAULT_CHAIN))
+    parser.add_argument("--concurrency", default="1,2,4")
+    parser.add_argument("--chains", type=int, default=4, help="chains per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument("--llm-rate-limit", type=float, default=0.0)
+    parser.add_argument("--mode", choices=["direct", "endpoint", "both"], default="both")
+    parser.add_argument("--json", help="write the machine-readable report here")
+    args = parser.parse_args()
+
+    _, quiz_base = serve(mock_quiz_server.create_app(args.chain.split(",")))
+    _, llm_base = serve(mock_llm.create_app(args.llm_latency, args.llm_jitter, args.llm_rate_limit))
+
+    # app reads these at import time
+    os.environ["AIPIPE_BASE_URL"] = f"{llm_base}/v1"
+    os.environ["AIPIPE_TOKEN"] = "mock-token"
+    os.environ["STUDENT_EMAIL"] = EMAIL
+    os.environ["STUDENT_SECRET"] = SECRET
+    # Throwaway result store: stored correct answers would be replayed instead of solved
+    os.environ["RESULT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "quiz_results.db")
+    import app as app_module
+
+    endpoint = None
+    if args.mode in ("endpoint", "both"):
+        _, app_base = serve(app_module.app)
+        endpoint = f"{app_base}/quiz"
+
+    quiz_url = f"{quiz_base}/quiz/0"
+    tracemalloc.start()
+    reports = []
+
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        if args.mode in ("direct", "both"):
+            tracemalloc.reset_peak()
+            wall, traces, results = run_direct(app_module, quiz_url, concurrency, args.chains)
+            reports.append(summarize("direct", concurrency, wall, traces, results))
+            print_report(reports[-1])
+        if endpoint:
+            tracemalloc.reset_peak()
+            wall, traces, results = run_endpoint(endpoint, quiz_url, concurrency, args.chains)
+            reports.append(summarize("endpoint", concurrency, wall, traces, results))
+            print_report(reports[-1])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "config": vars(args),
+                "reports": reports
+            }, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Chrome for quiz pages: launch profiles and a per-worker shared browser.
+
+Instead of one Chromium per quiz, each worker keeps one long-lived browser
+per profile and gives every chain its own browser context (separate
+cookies, cache and storage) with one tab, driven by a WebDriver session
+attached to that tab. Open contexts are capped, and a browser that stopped
+answering is relaunched on the next request.
+"""
+import atexit
+import os
+import threading
+
+from lazy_imports import lazy_import
+from memory import process_tree_rss_mb
+
+webdriver = lazy_import('selenium.webdriver')
+
+# Browser profiles: 'lean' only builds the DOM (no images, fonts, media, CSS
+# or trackers, eager load) and falls back to 'full' if the page comes out empty
+BROWSER_PROFILE = os.environ.get("BROWSER_PROFILE", "lean")
+LEAN_MIN_TEXT_CHARS = int(os.environ.get("LEAN_MIN_TEXT_CHARS", 20))
+
+# Shared mode: one browser per profile, at most BROWSER_MAX_CONTEXTS chains in it
+BROWSER_SHARED = os.environ.get("BROWSER_SHARED", "1") != "0"
+BROWSER_MAX_CONTEXTS = int(os.environ.get("BROWSER_MAX_CONTEXTS", 4))
+BROWSER_CONTEXT_WAIT = int(os.environ.get("BROWSER_CONTEXT_WAIT", 60))
+
+LEAN_CHROME_FLAGS = [
+    "--window-size=1280,800",
+    "--blink-settings=imagesEnabled=false",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--no-first-run",
+    "--mute-audio",
+    "--autoplay-policy=user-gesture-required",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication",
+]
+
+LEAN_BLOCKED_EXTENSIONS = [
+    "png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "bmp",
+    "woff", "woff2", "ttf", "otf", "eot", "css",
+    "mp3", "mp4", "wav", "ogg", "webm", "avi", "mov",
+]
+
+LEAN_BLOCKED_HOSTS = [
+    "fonts.googleapis.com",
+    "fonts.gstatic.com",
+    "www.google-analytics.com",
+    "www.googletagmanager.com",
+    "*.doubleclick.net",
+    "connect.facebook.net",
+    "static.cloudflareinsights.com",
+] + [h.strip() for h in os.environ.get("BROWSER_BLOCKED_HOSTS", "").split(",") if h.strip()]
+
+LEAN_BLOCKED_URLS = (
+    [f"*.{ext}" for ext in LEAN_BLOCKED_EXTENSIONS] +
+    [f"*.{ext}?*" for ext in LEAN_BLOCKED_EXTENSIONS] +
+    [f"*://{host}/*" for host in LEAN_BLOCKED_HOSTS]
+)
+
+
+def get_browser(profile=BROWSER_PROFILE):
+    """Initialize Chrome with the 'lean' or 'full' rendering profile"""
+    chrome_options = webdriver.ChromeOptions()
+    chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    if profile == 'lean':
+        for flag in LEAN_CHROME_FLAGS:
+            chrome_options.add_argument(flag)
+        # Return once the DOM is ready instead of waiting for every subresource
+        chrome_options.page_load_strategy = 'eager'
+    else:
+        chrome_options.add_argument("--window-size=1920,1080")
+    # Performance log exposes the page's network events (JSON/XHR capture)
+    chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    
+    chrome_paths = [
+        "/usr/bin/chromium",
+        "/usr/bin/chromium-browser", 
+        "/usr/bin/google-chrome",
+        "/usr/bin/google-chrome-stable"
+    ]
+    
+    for path in chrome_paths:
+        if os.path.exists(path):
+            chrome_options.binary_location = path
+            break
+    
+    driver = webdriver.Chrome(options=chrome_options)
+    if profile == 'lean':
+        block_resources(driver)
+    return driver
+
+
+def browser_metrics(driver, browser_pid=None):
+    """Render timings, JS heap, DOM size and Chrome's memory for the loaded page"""
+    metrics = {}
+    try:
+        driver.execute_cdp_cmd('Performance.enable', {})
+        values = {m['name']: m['value'] for m in driver.execute_cdp_cmd('Performance.getMetrics', {})['metrics']}
+        metrics['js_heap_mb'] = round(values.get('JSHeapUsedSize', 0) / 1024 / 1024, 1)
+        metrics['dom_nodes'] = int(values.get('Nodes', 0))
+        dom_ready, loaded = driver.execute_script(
+            "const t = performance.timing;"
+            "return [t.domContentLoadedEventEnd - t.navigationStart, t.loadEventEnd - t.navigationStart];")
+        metrics['dom_ready_ms'] = max(dom_ready, 0)
+        metrics['load_ms'] = max(loaded, 0)
+        metrics['browser_rss_mb'] = round(process_tree_rss_mb(browser_pid or driver.service.process.pid), 1)
+    except Exception as e:
+        print(f"  ✗ Browser metrics unavailable: {e}")
+    return metrics
+
+
+def block_resources(driver):
+    """Apply the lean profile's URL block list to the driver's current tab"""
+    # Blocked at the network layer before the first navigation
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {"urls": LEAN_BLOCKED_URLS})
+
+
+def attach_session(debugger_address, target_id, profile):
+    """WebDriver session on an existing browser, switched to one tab"""
+    options = webdriver.ChromeOptions()
+    options.debugger_address = debugger_address
+    if profile == 'lean':
+        options.page_load_strategy = 'eager'
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    driver = webdriver.Chrome(options=options)
+    try:
+        handle = next(h for h in driver.window_handles if h.endswith(target_id))
+        driver.switch_to.window(handle)
+        if profile == 'lean':
+            block_resources(driver)
+    except BaseException:
+        driver.quit()
+        raise
+    return driver
+
+
+def _quit(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+class BrowserSession:
+    """A tab in its own browser context; close() disposes the context"""
+
+    def __init__(self, manager, profile, driver, context_id, browser_pid):
+        self.manager = manager
+        self.profile = profile
+        self.driver = driver
+        self.context_id = context_id
+        self.browser_pid = browser_pid
+
+    def close(self):
+        self.manager.release(self)
+
+
+class BrowserManager:
+    """Long-lived browsers (one per profile) handing out isolated contexts"""
+
+    def __init__(self, max_contexts=BROWSER_MAX_CONTEXTS):
+        self.max_contexts = max_contexts
+        self._slots = threading.BoundedSemaphore(max_contexts)
+        self._browsers = {}
+        self._open = 0
+        self._restarts = 0
+        self._lock = threading.Lock()
+
+    def _browser(self, profile):
+        """Control session of the profile's browser, relaunched if it stopped responding; call with the lock held"""
+        control = self._browsers.get(profile)
+        if control is not None:
+            try:
+                control.execute_cdp_cmd('Browser.getVersion', {})
+            except Exception:
+                # Only a dead browser is restarted: other chains have contexts open in it
+                print(f"♻️ Restarting {profile} browser")
+                self._restarts += 1
+                _quit(control)
+                control = None
+        if control is None:
+            control = get_browser(profile)
+            self._browsers[profile] = control
+        return control
+
+    def _new_session(self, profile):
+        with self._lock:
+            control = self._browser(profile)
+            context_id = control.execute_cdp_cmd('Target.createBrowserContext', {})['browserContextId']
+            target_id = control.execute_cdp_cmd(
+                'Target.createTarget', {'url': 'about:blank', 'browserContextId': context_id})['targetId']
+            address = control.capabilities['goog:chromeOptions']['debuggerAddress']
+            browser_pid = control.service.process.pid
+        try:
+            driver = attach_session(address, target_id, profile)
+        except BaseException:
+            self._dispose(profile, context_id)
+            raise
+        return BrowserSession(self, profile, driver, context_id, browser_pid)
+
+    def open(self, profile):
+        """Isolated session for one chain; waits while all context slots are taken"""
+        if not self._slots.acquire(timeout=BROWSER_CONTEXT_WAIT):
+            raise RuntimeError(f"No free browser context after {BROWSER_CONTEXT_WAIT}s")
+        try:
+            try:
+                session = self._new_session(profile)
+            except Exception as e:
+                # Transient attach/CDP errors just retry; the liveness probe restarts a dead browser
+                print(f"✗ Browser context failed ({e}), retrying")
+                session = self._new_session(profile)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._open += 1
+        return session
+
+    def _dispose(self, profile, context_id):
+        with self._lock:
+            control = self._browsers.get(profile)
+            if control is None:
+                return
+            try:
+                # Closes the context's tab and drops its cookies, cache and storage
+                control.execute_cdp_cmd('Target.disposeBrowserContext', {'browserContextId': context_id})
+            except Exception as e:
+                print(f"✗ Could not dispose browser context: {e}")
+
+    def release(self, session):
+        # Detaches the WebDriver session; an attached browser is left running
+        _quit(session.driver)
+        self._dispose(session.profile, session.context_id)
+        with self._lock:
+            self._open -= 1
+        self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            for control in self._browsers.values():
+                _quit(control)
+            self._browsers.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "browsers": len(self._browsers),
+                "open_contexts": self._open,
+                "max_contexts": self.max_contexts,
+                "restarts": self._restarts
+            }
+
+
+class DedicatedSession:
+    """A browser of its own, for BROWSER_SHARED=0"""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.driver = get_browser(profile)
+        self.browser_pid = self.driver.service.process.pid
+
+    def close(self):
+        _quit(self.driver)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_browser_manager():
+    """Per-process browser manager (created after fork, so never shared between workers)"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = BrowserManager()
+            atexit.register(_manager.shutdown)
+    return _manager
+
+
+def open_browser(profile=BROWSER_PROFILE):
+    """Browser session for one page load: a context in the shared browser, or a dedicated browser"""
+    if BROWSER_SHARED:
+        return get_browser_manager().open(profile)
+    return DedicatedSession(profile)
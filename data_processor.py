@@ -1,47 +1,122 @@
-import pandas as pd
-import PyPDF2
 import io
 import base64
 import json
-from PIL import Image
-import requests
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+PyPDF2 = lazy_import('PyPDF2')
+Image = lazy_import('PIL.Image')
+ImageColor = lazy_import('PIL.ImageColor')
+ImageOps = lazy_import('PIL.ImageOps')
+lxml_html = lazy_import('lxml.html')
+
+# Chart output caps, keeps answer payloads small
+CHART_MAX_WIDTH = int(os.environ.get("CHART_MAX_WIDTH", 1000))
+CHART_MAX_HEIGHT = int(os.environ.get("CHART_MAX_HEIGHT", 600))
+CHART_MAX_DPI = int(os.environ.get("CHART_MAX_DPI", 100))
+CHART_WORKERS = int(os.environ.get("CHART_WORKERS", 2))
+
+_render_pool = None
+_chart_backend = None
+
+def load_chart_backend():
+    """Select matplotlib's Agg backend (before pyplot can be imported) and load the Figure API"""
+    global _chart_backend
+    if _chart_backend is None:
+        # Charts use the object-oriented Figure API, so no global pyplot state
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        _chart_backend = (Figure, FigureCanvasAgg)
+    return _chart_backend
+
+def get_render_pool():
+    """Lazily create the process pool used for chart rendering"""
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=CHART_WORKERS)
+    return _render_pool
+
+def render_chart(data, chart_type='bar', image_format='png', width=CHART_MAX_WIDTH,
+                 height=CHART_MAX_HEIGHT, dpi=CHART_MAX_DPI):
+    """Render a chart to compressed image bytes (safe to run in a worker process)"""
+    width = min(width, CHART_MAX_WIDTH)
+    height = min(height, CHART_MAX_HEIGHT)
+    dpi = min(dpi, CHART_MAX_DPI)
+    
+    Figure, FigureCanvasAgg = load_chart_backend()
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi, layout='tight')
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    
+    labels = [str(k) for k in data.keys()]
+    values = list(data.values())
+    if chart_type == 'bar':
+        ax.bar(labels, values)
+    elif chart_type == 'line':
+        ax.plot(labels, values)
+    elif chart_type == 'pie':
+        ax.pie(values, labels=labels, autopct='%1.1f%%')
+    else:
+        raise ValueError(f"Unknown chart type: {chart_type}")
+    
+    canvas.draw()
+    img = Image.fromarray(np.asarray(canvas.buffer_rgba())).convert('RGB')
+    
+    buf = io.BytesIO()
+    if image_format == 'webp':
+        img.save(buf, format='WEBP', quality=80, method=6)
+    else:
+        # Charts use few colours, so a palette PNG is several times smaller
+        img.quantize(colors=256).save(buf, format='PNG', optimize=True)
+    return buf.getvalue()
+
+def summarize_dataframe(df, rows=5, stats=False):
+    """Shape, columns, dtypes and first rows of a DataFrame for prompts (and describe() with stats=True)"""
+    summary = {
+        "shape": list(df.shape),
+        "columns": df.columns.tolist(),
+        "dtypes": df.dtypes.astype(str).to_dict(),
+        "head": json.loads(df.head(rows).to_json(orient='records', date_format='iso'))
+    }
+    if stats:
+        summary["describe"] = json.loads(df.describe().to_json(date_format='iso')) if not df.empty else {}
+    return summary
 
 class DataProcessor:
     """Handle various data processing tasks"""
     
     @staticmethod
     def process_pdf(pdf_content_base64, page_number=None):
-        """Extract text and tables from PDF"""
+        """Extract text from PDF (base64 input), via the processor registry"""
+        from processors import run_processor
         try:
-            pdf_bytes = base64.b64decode(pdf_content_base64)
-            pdf_file = io.BytesIO(pdf_bytes)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            pages = run_processor('pdf', base64.b64decode(pdf_content_base64))['pages']
             
             if page_number is not None:
                 # Extract specific page (1-indexed)
-                page = pdf_reader.pages[page_number - 1]
-                text = page.extract_text()
-                return {"page": page_number, "text": text}
-            else:
-                # Extract all pages
-                all_text = []
-                for i, page in enumerate(pdf_reader.pages):
-                    all_text.append({
-                        "page": i + 1,
-                        "text": page.extract_text()
-                    })
-                return all_text
+                return {"page": page_number, "text": pages[page_number - 1]}
+            # Extract all pages
+            return [{"page": i + 1, "text": text} for i, text in enumerate(pages)]
         except Exception as e:
             return {"error": str(e)}
     
     @staticmethod
     def process_csv(csv_content, encoding='utf-8'):
-        """Process CSV data"""
+        """Process CSV data, via the processor registry"""
+        from processors import run_processor
         try:
-            if isinstance(csv_content, bytes):
+            if isinstance(csv_content, bytes) and encoding.lower() not in ('utf-8', 'utf8'):
                 csv_content = csv_content.decode(encoding)
+            if isinstance(csv_content, str):
+                csv_content = csv_content.encode('utf-8')
             
-            df = pd.read_csv(io.StringIO(csv_content))
+            df = run_processor('csv', csv_content)['csv_data']['dataframe']
             return {
                 "columns": df.columns.tolist(),
                 "shape": df.shape,
@@ -53,16 +128,14 @@ class DataProcessor:
     
     @staticmethod
     def process_excel(excel_content_base64):
-        """Process Excel files"""
+        """Process Excel files (all sheets), via the processor registry"""
+        from processors import run_processor
         try:
-            excel_bytes = base64.b64decode(excel_content_base64)
-            excel_file = io.BytesIO(excel_bytes)
-            
-            # Read all sheets
-            sheets = pd.read_excel(excel_file, sheet_name=None)
+            sheets = run_processor('excel', base64.b64decode(excel_content_base64))['excel_data']
             
             result = {}
-            for sheet_name, df in sheets.items():
+            for sheet_name, data in sheets.items():
+                df = data['dataframe']
                 result[sheet_name] = {
                     "columns": df.columns.tolist(),
                     "shape": df.shape,
@@ -92,6 +165,128 @@ class DataProcessor:
             elif operation['type'] == 'filter':
                 condition = operation['condition']
                 return len(df.query(condition))
+            elif operation['type'] == 'sql':
+                # The frame is the table `df` in a DuckDB query
+                from sql_engine import query_frames
+                return query_frames({'df': df}, operation['query'])
+            else:
+                return {"error": "Unknown operation"}
+        except Exception as e:
+            return {"error": str(e)}
+    
+    @staticmethod
+    def load_image_array(image_content, mode='RGB'):
+        """Decode image bytes into a NumPy array (H x W x C, or H x W for mode 'L')"""
+        # BytesIO shares the bytes object's buffer, so the download is not copied
+        if isinstance(image_content, str):
+            image_content = base64.b64decode(image_content)
+        img = Image.open(io.BytesIO(image_content))
+        if getattr(img, 'is_animated', False):
+            img.seek(0)
+        img = ImageOps.exif_transpose(img)
+        if img.mode != mode:
+            img = img.convert(mode)
+        return np.asarray(img)
+    
+    @staticmethod
+    def parse_color(color):
+        """Normalise '#rrggbb', 'red', 'rgb(...)' or [r, g, b] to an RGB tuple"""
+        if isinstance(color, str):
+            return ImageColor.getrgb(color)[:3]
+        return tuple(int(c) for c in color[:3])
+    
+    @staticmethod
+    def _pack_rgb(arr):
+        """Pack an RGB array into one uint32 per pixel"""
+        pixels = arr.reshape(-1, 3).astype(np.uint32)
+        return (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+    
+    @staticmethod
+    def color_histogram(arr, top_n=None):
+        """Exact colour frequencies, most frequent first"""
+        if arr.ndim == 2:
+            counts = np.bincount(arr.ravel(), minlength=256)
+            colors = np.nonzero(counts)[0]
+            counts = counts[colors]
+        else:
+            colors, counts = np.unique(DataProcessor._pack_rgb(arr[..., :3]), return_counts=True)
+        
+        order = np.argsort(counts, kind='stable')[::-1]
+        if top_n:
+            order = order[:top_n]
+        
+        total = int(counts.sum())
+        histogram = []
+        for idx in order:
+            value = int(colors[idx])
+            entry = {"count": int(counts[idx]), "fraction": round(float(counts[idx]) / total, 6)}
+            if arr.ndim == 2:
+                entry["value"] = value
+            else:
+                entry["rgb"] = [(value >> 16) & 255, (value >> 8) & 255, value & 255]
+                entry["hex"] = f"#{value:06x}"
+            histogram.append(entry)
+        return histogram
+    
+    @staticmethod
+    def count_pixels(arr, color, tolerance=0):
+        """Count pixels within `tolerance` (per channel) of a colour"""
+        target = np.array(DataProcessor.parse_color(color), dtype=np.int16)
+        diff = np.abs(arr[..., :3].astype(np.int16) - target)
+        return int(np.count_nonzero(diff.max(axis=-1) <= tolerance))
+    
+    @staticmethod
+    def threshold(arr, value, above=True):
+        """Boolean mask of pixels whose luminance is above (or below) `value`"""
+        if arr.ndim == 3:
+            # ITU-R 601 luma, same weights as Pillow's 'L' conversion
+            luma = arr[..., 0] * 0.299 + arr[..., 1] * 0.587 + arr[..., 2] * 0.114
+        else:
+            luma = arr
+        return luma > value if above else luma <= value
+    
+    @staticmethod
+    def region_stats(arr, box=None, mask=None):
+        """Per-channel statistics for a box (left, top, right, bottom) or boolean mask"""
+        if box is not None:
+            left, top, right, bottom = box
+            arr = arr[top:bottom, left:right]
+        if mask is not None:
+            pixels = arr[mask]
+        else:
+            pixels = arr.reshape(-1, arr.shape[-1]) if arr.ndim == 3 else arr.ravel()
+        
+        if pixels.size == 0:
+            return {"pixel_count": 0}
+        
+        pixels = pixels.astype(np.float64)
+        return {
+            "pixel_count": int(pixels.shape[0]),
+            "mean": np.round(pixels.mean(axis=0), 4).tolist(),
+            "std": np.round(pixels.std(axis=0), 4).tolist(),
+            "min": pixels.min(axis=0).tolist(),
+            "max": pixels.max(axis=0).tolist()
+        }
+    
+    @staticmethod
+    def analyze_image(arr, operation):
+        """Perform pixel-level analysis on an image array"""
+        try:
+            if operation['type'] == 'count_color':
+                return DataProcessor.count_pixels(arr, operation['color'], operation.get('tolerance', 0))
+            elif operation['type'] == 'most_frequent_color':
+                return DataProcessor.color_histogram(arr, top_n=1)[0].get('hex')
+            elif operation['type'] == 'histogram':
+                return DataProcessor.color_histogram(arr, top_n=operation.get('top_n', 10))
+            elif operation['type'] == 'unique_colors':
+                return len(DataProcessor.color_histogram(arr))
+            elif operation['type'] == 'threshold_count':
+                mask = DataProcessor.threshold(arr, operation['value'], operation.get('above', True))
+                return int(np.count_nonzero(mask))
+            elif operation['type'] == 'region_stats':
+                return DataProcessor.region_stats(arr, box=operation.get('box'))
+            elif operation['type'] == 'dimensions':
+                return {"width": int(arr.shape[1]), "height": int(arr.shape[0])}
             else:
                 return {"error": "Unknown operation"}
         except Exception as e:
@@ -117,47 +312,59 @@ class DataProcessor:
         
         return tables
     
+    @staticmethod
+    def parse_html(html_content):
+        """Parse HTML with lxml; returns None for empty documents"""
+        if not html_content or not html_content.strip():
+            return None
+        try:
+            return lxml_html.fromstring(html_content)
+        except ValueError:
+            # Unicode strings with an XML encoding declaration must be parsed as bytes
+            return lxml_html.fromstring(html_content.encode('utf-8'))
+    
+    @staticmethod
+    def table_from_element(table):
+        """Headers and cell text rows of an lxml <table> element"""
+        headers = []
+        rows = []
+        for tr in table.xpath('./tr|./thead/tr|./tbody/tr|./tfoot/tr'):
+            cells = tr.xpath('./th|./td')
+            values = [cell.text_content().strip() for cell in cells]
+            if not headers and cells and all(cell.tag == 'th' for cell in cells):
+                headers = values
+            else:
+                rows.append(values)
+        return {"headers": headers, "rows": rows}
+    
     @staticmethod
     def scrape_data_from_html(html_content, selector=None):
-        """Extract data from HTML"""
-        from bs4 import BeautifulSoup
-        
+        """Extract data from HTML (a string or an already parsed lxml tree)"""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            tree = html_content if hasattr(html_content, 'iter') else DataProcessor.parse_html(html_content)
+            if tree is None:
+                return [] if selector else ""
             
             if selector:
-                elements = soup.select(selector)
-                return [elem.get_text(strip=True) for elem in elements]
+                elements = tree.cssselect(selector)
+                return [elem.text_content().strip() for elem in elements]
             else:
                 # Extract all text
-                return soup.get_text(strip=True)
+                return " ".join(tree.text_content().split())
         except Exception as e:
             return {"error": str(e)}
     
     @staticmethod
-    def create_visualization(data, chart_type='bar'):
+    def create_visualization(data, chart_type='bar', image_format='png', in_process_pool=False, timeout=30):
         """Create visualization and return as base64 image"""
-        import matplotlib.pyplot as plt
-        import matplotlib
-        matplotlib.use('Agg')
-        
         try:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            
-            if chart_type == 'bar':
-                ax.bar(data.keys(), data.values())
-            elif chart_type == 'line':
-                ax.plot(list(data.keys()), list(data.values()))
-            elif chart_type == 'pie':
-                ax.pie(data.values(), labels=data.keys(), autopct='%1.1f%%')
-            
-            # Save to bytes
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', bbox_inches='tight')
-            buf.seek(0)
-            img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-            plt.close()
+            if in_process_pool:
+                future = get_render_pool().submit(render_chart, data, chart_type, image_format)
+                image_bytes = future.result(timeout=timeout)
+            else:
+                image_bytes = render_chart(data, chart_type, image_format)
             
-            return f"data:image/png;base64,{img_base64}"
+            img_base64 = base64.b64encode(image_bytes).decode('utf-8')
+            return f"data:image/{image_format};base64,{img_base64}"
         except Exception as e:
             return {"error": str(e)}
@@ -0,0 +1,188 @@
+"""
+HTTP downloads: transfer compression, resumable streams and range sampling.
+
+- Full downloads ask for gzip/deflate (and br when a brotli decoder is
+  installed); requests decodes them while streaming.
+- A download interrupted by a timeout or dropped connection resumes: with
+  a Range request from the last byte received when the server supports
+  ranges for an unencoded body, otherwise by re-requesting and skipping
+  the bytes already received. If the file's ETag/Last-Modified shows it
+  changed meanwhile, the download fails with DownloadChanged instead.
+- Range reads fetch just the head or tail of a large file, so the planning
+  step can see a CSV header or a PDF's page count without downloading it.
+"""
+import os
+import re
+import threading
+import time
+
+import requests
+from urllib3.util import make_headers
+
+from memory import CHUNK_SIZE, MAX_DOWNLOAD_BYTES, ResourceLimitExceeded
+
+DOWNLOAD_TIMEOUT = int(os.environ.get("DOWNLOAD_TIMEOUT", 30))
+DOWNLOAD_RESUMES = int(os.environ.get("DOWNLOAD_RESUMES", 3))
+PREVIEW_BYTES = int(os.environ.get("PREVIEW_BYTES", 16 * 1024))
+PREVIEW_TIMEOUT = int(os.environ.get("PREVIEW_TIMEOUT", 5))
+PREVIEW_ROWS = int(os.environ.get("PREVIEW_ROWS", 5))
+
+# Encodings urllib3 can decode here (br only with brotli installed)
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+_local = threading.local()
+
+
+class DownloadChanged(Exception):
+    """The file changed on the server while an interrupted download was being resumed"""
+
+
+def get_session():
+    """Per-thread session, so connections to the same host are reused"""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
+
+
+class Download:
+    """One streamed GET that resumes after interruptions"""
+
+    def __init__(self, url, timeout=DOWNLOAD_TIMEOUT, max_resumes=DOWNLOAD_RESUMES):
+        self.url = url
+        self.timeout = timeout
+        self.max_resumes = max_resumes
+        self.response = None
+        self.size = None
+        self.encoding = None
+        self.ranges = False
+        self.validator = None
+        self.received = 0
+        self.resumes = 0
+
+    def open(self, max_bytes=MAX_DOWNLOAD_BYTES):
+        """Send the request and read the headers: size, encoding, range support"""
+        self.response = get_session().get(self.url, timeout=self.timeout, stream=True)
+        self.response.raise_for_status()
+        headers = self.response.headers
+        self.encoding = headers.get("Content-Encoding", "identity")
+        declared = headers.get("Content-Length")
+        if self.encoding == "identity" and declared and declared.isdigit():
+            self.size = int(declared)
+            if self.size > max_bytes:
+                self.response.close()
+                raise ResourceLimitExceeded(f"Download of {declared} bytes exceeds the {max_bytes} byte cap")
+        # Range offsets count encoded bytes, so only unencoded bodies are resumed in place
+        self.ranges = headers.get("Accept-Ranges") == "bytes" and self.encoding == "identity"
+        self.validator = headers.get("ETag") or headers.get("Last-Modified")
+        return self
+
+    def _reopen(self):
+        headers = {}
+        if self.ranges:
+            headers = {"Range": f"bytes={self.received}-", "Accept-Encoding": "identity"}
+            if self.validator:
+                # A changed file is sent whole (200) instead of a mismatched range
+                headers["If-Range"] = self.validator
+        self.response = get_session().get(self.url, headers=headers, timeout=self.timeout, stream=True)
+        self.response.raise_for_status()
+        if self.received and self.response.status_code != 206:
+            current = self.response.headers.get("ETag") or self.response.headers.get("Last-Modified")
+            # Bytes received so far belong to the old version; splicing the new one on would corrupt it
+            if self.validator and (self.ranges or current != self.validator):
+                raise DownloadChanged(f"{self.url} changed on the server after {self.received} bytes")
+
+    def chunks(self):
+        """Body chunks (decoded), continuing across interruptions"""
+        if self.response is None:
+            self.open()
+        while True:
+            try:
+                if self.response is None:
+                    self._reopen()
+                # Bytes already received that this response will send again
+                # (a whole body is only accepted when there was no validator to check it against)
+                skip = self.received if self.response.status_code != 206 else 0
+                for chunk in self.response.iter_content(chunk_size=CHUNK_SIZE):
+                    if skip:
+                        if len(chunk) <= skip:
+                            skip -= len(chunk)
+                            continue
+                        chunk, skip = chunk[skip:], 0
+                    self.received += len(chunk)
+                    yield chunk
+                return
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if self.resumes >= self.max_resumes:
+                    raise
+                self.resumes += 1
+                print(f"  ↻ Download interrupted at {self.received} bytes ({e.__class__.__name__}), resuming")
+                time.sleep(self.resumes)
+            finally:
+                if self.response is not None:
+                    self.response.close()
+                    self.response = None
+
+
+def fetch_range(url, start=0, length=PREVIEW_BYTES, tail=False, timeout=PREVIEW_TIMEOUT):
+    """First (or with tail=True, last) length bytes from start; (bytes or None, total size or None)"""
+    byte_range = f"bytes=-{length}" if tail else f"bytes={start}-{start + length - 1}"
+    response = get_session().get(url, headers={"Range": byte_range, "Accept-Encoding": "identity"},
+                                 timeout=timeout, stream=True)
+    try:
+        response.raise_for_status()
+        if response.status_code == 206:
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            return response.raw.read(length + 1, decode_content=True)[:length], int(total) if total.isdigit() else None
+        # Range ignored: the head can still be read off the full body, the tail cannot
+        declared = response.headers.get("Content-Length")
+        total = int(declared) if declared and declared.isdigit() else None
+        if tail or start:
+            return None, total
+        return response.raw.read(length, decode_content=True), total
+    finally:
+        response.close()
+
+
+def preview_csv(head):
+    """Header and first rows from the head of a CSV (a cut-off last line is dropped)"""
+    lines = head.decode("utf-8", errors="ignore").splitlines()
+    if len(head) >= PREVIEW_BYTES and len(lines) > 1:
+        lines = lines[:-1]
+    return "\n".join(lines[:PREVIEW_ROWS + 1])
+
+
+PDF_PAGE_COUNT = [
+    # Linearized PDFs state the page count in their first object
+    re.compile(rb"/Linearized\b[^>]*?/N\s+(\d+)"),
+    # The root page tree, usually near the end with the xref
+    re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)"),
+    re.compile(rb"/Count\s+(\d+)[^>]*?/Type\s*/Pages\b"),
+]
+
+
+def pdf_page_count(*samples):
+    counts = [int(m) for pattern in PDF_PAGE_COUNT for sample in samples if sample
+              for m in pattern.findall(sample)]
+    return max(counts) if counts else None
+
+
+def preview_file(url, file_type):
+    """Size and a small sample of a linked file from range reads; None if it cannot be sampled"""
+    try:
+        head, total = fetch_range(url)
+        preview = {"size": total}
+        if file_type == 'csv' and head:
+            preview["sample"] = preview_csv(head)
+        elif file_type == 'json' and head:
+            preview["sample"] = head[:1000].decode("utf-8", errors="ignore")
+        elif file_type == 'pdf':
+            tail = None
+            if total is None or total > PREVIEW_BYTES:
+                tail, _ = fetch_range(url, tail=True)
+            preview["pages"] = pdf_page_count(head, tail)
+        return preview
+    except Exception as e:
+        print(f"  ✗ Preview of {url} failed: {e}")
+        return None
@@ -0,0 +1,31 @@
+"""
+Gunicorn settings. The app is imported once in the master (preload_app) and
+heavy modules are imported there too, so forked workers share them
+copy-on-write and a worker restarted after a timeout boots almost instantly.
+Workers write their metrics to METRICS_DIR so /metrics reports all of them.
+"""
+import glob
+import os
+import tempfile
+
+preload_app = True
+worker_class = "sync"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+timeout = 300
+
+# Set before the app is imported, so tracing picks it up in the master and every worker
+if "METRICS_DIR" not in os.environ:
+    os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="quiz-metrics-")
+
+def on_starting(server):
+    """Drop metrics files left by an earlier run of the server"""
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "metrics-*.json*")):
+        os.remove(path)
+
+def when_ready(server):
+    """Runs in the master after the app is loaded, before workers are forked"""
+    if os.environ.get("PRELOAD_HEAVY_MODULES", "1") != "1":
+        return
+    from lazy_imports import preload_heavy_modules
+    timings = preload_heavy_modules()
+    server.log.info("Preloaded heavy modules in %.2fs: %s", sum(timings.values()), timings)
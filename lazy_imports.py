@@ -0,0 +1,95 @@
+"""
+Deferred imports for heavy dependencies.
+
+Modules returned by lazy_import() are only executed on first attribute
+access, so importing app.py stays cheap. The first access runs the module
+under a lock and the module only turns into a plain one once it is fully
+executed, so other threads wait instead of seeing it half-initialised
+(importlib's LazyLoader is not thread-safe before Python 3.12). Under gunicorn with preload_app,
+preload_heavy_modules() runs once in the master before workers are forked,
+so every worker (including ones restarted after a timeout) shares the
+already-imported modules copy-on-write instead of importing them again.
+"""
+import gc
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+import types
+
+# Modules the pipeline needs for almost every quiz, in import order
+HEAVY_MODULES = [
+    "numpy",
+    "pandas",
+    "PIL.Image",
+    "PIL.ImageOps",
+    "PIL.ImageColor",
+    "lxml.html",
+    "PyPDF2",
+    "openai",
+    "selenium.webdriver",
+    "selenium.webdriver.chrome.options",
+    "selenium.webdriver.common.by",
+]
+
+_load_lock = threading.RLock()
+_loading = set()
+
+class _LazyModule(types.ModuleType):
+    """Module whose code runs, once, on the first attribute access"""
+
+    def __getattribute__(self, attr):
+        with _load_lock:
+            # A module's own import code (same thread) sees it partially initialised, as a normal import would
+            if type(self) is _LazyModule and id(self) not in _loading:
+                _loading.add(id(self))
+                try:
+                    spec = object.__getattribute__(self, '__spec__')
+                    spec.loader.exec_module(self)
+                    self.__class__ = types.ModuleType
+                finally:
+                    _loading.discard(id(self))
+        return object.__getattribute__(self, attr)
+
+def lazy_import(name):
+    """Module object whose code runs on first attribute access"""
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'")
+    module = importlib.util.module_from_spec(spec)
+    module.__class__ = _LazyModule
+    sys.modules[name] = module
+
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+def preload_heavy_modules(modules=HEAVY_MODULES):
+    """Import heavy modules now; returns seconds spent per module"""
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            module = importlib.import_module(name)
+            # Touch an attribute so lazily registered modules actually execute
+            getattr(module, '__name__')
+        except Exception as e:
+            print(f"✗ Preload of {name} failed: {e}")
+        timings[name] = round(time.perf_counter() - start, 4)
+
+    # Configure matplotlib's Agg backend and font cache once, before fork
+    from data_processor import load_chart_backend
+    start = time.perf_counter()
+    load_chart_backend()
+    timings["matplotlib (Agg)"] = round(time.perf_counter() - start, 4)
+
+    # Keep preloaded objects out of the GC's generations so collections in
+    # workers do not touch (and un-share) their pages
+    gc.collect()
+    gc.freeze()
+    return timings
@@ -0,0 +1,187 @@
+"""
+Process-wide rate governor for LLM calls.
+
+Every model call takes a slot from the governor before it is sent:
+- request-per-minute and token-per-minute token buckets keep the process
+  under the provider's limits (tokens are estimated up front and trued up
+  with the reported usage afterwards);
+- the number of calls in flight adapts AIMD-style: it grows by one per
+  window of healthy calls and halves on a 429 or when latency goes above
+  LLM_LATENCY_TARGET;
+- a 429 with Retry-After pauses every caller, not just the one that hit it;
+- waiting callers are served earliest job deadline first, so a chain that
+  is about to run out of time is not stuck behind fresh ones.
+"""
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from tracing import job_deadline, LLM_RATE_LIMITED
+
+LLM_RPM = float(os.environ.get("LLM_RPM", 500))
+LLM_TPM = float(os.environ.get("LLM_TPM", 200000))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+LLM_MIN_CONCURRENCY = int(os.environ.get("LLM_MIN_CONCURRENCY", 1))
+LLM_LATENCY_TARGET = float(os.environ.get("LLM_LATENCY_TARGET", 30))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 1))
+LLM_BACKOFF_CAP = float(os.environ.get("LLM_BACKOFF_CAP", 30))
+
+
+class TokenBucket:
+    """Continuously refilled bucket; reserve() may go into debt and returns the wait"""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take amount now; seconds the caller must wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+            return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount):
+        """Give back (or, if negative, additionally charge) tokens"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level + amount)
+
+
+def estimate_tokens(text, max_tokens):
+    """Rough prompt size (4 chars per token) plus the completion allowance"""
+    return len(text) // 4 + max_tokens
+
+
+def is_rate_limited(error):
+    return getattr(error, "status_code", None) == 429 or "429" in str(error)[:200]
+
+
+def retry_after_seconds(error):
+    """Retry-After from a provider error's response headers, if it sent one"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class LLMGovernor:
+    """Shared RPM/TPM buckets and an AIMD concurrency limit for all model calls"""
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, max_concurrency=LLM_MAX_CONCURRENCY,
+                 min_concurrency=LLM_MIN_CONCURRENCY, latency_target=LLM_LATENCY_TARGET):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target = latency_target
+        self.limit = float(max(min_concurrency, max_concurrency // 2))
+        self.active = 0
+        self.paused_until = 0.0
+        self.rate_limited = 0
+        self._last_decrease = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _acquire_slot(self, deadline):
+        entry = (deadline, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self._waiters[0] == entry and self.active < int(self.limit):
+                    break
+                self._cond.wait(timeout=pause if pause > 0 else 1.0)
+            heapq.heappop(self._waiters)
+            self.active += 1
+            # The next waiter may fit as well
+            self._cond.notify_all()
+
+    def _release_slot(self, latency, rate_limited, retry_after):
+        with self._cond:
+            self.active -= 1
+            now = time.monotonic()
+            if rate_limited or latency > self.latency_target:
+                # Multiplicative decrease, at most once per latency window
+                if now - self._last_decrease > min(self.latency_target, 10):
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+                if rate_limited:
+                    self.rate_limited += 1
+                    if retry_after:
+                        self.paused_until = max(self.paused_until, now + retry_after)
+            else:
+                # Additive increase: about +1 per `limit` healthy calls
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, estimated_tokens, model="llm"):
+        """Wait for capacity, then run one call; report usage with slot['tokens'] = n"""
+        self._acquire_slot(job_deadline() or float("inf"))
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            time.sleep(wait)
+
+        usage = {"tokens": None}
+        start = time.monotonic()
+        rate_limited, retry_after = False, None
+        try:
+            yield usage
+        except Exception as e:
+            rate_limited = is_rate_limited(e)
+            if rate_limited:
+                retry_after = retry_after_seconds(e)
+                LLM_RATE_LIMITED.inc((model,))
+            raise
+        finally:
+            if usage["tokens"] is not None:
+                self.tokens.refund(estimated_tokens - usage["tokens"])
+            self._release_slot(time.monotonic() - start, rate_limited, retry_after)
+
+    def backoff(self, attempt, error=None):
+        """Seconds to wait before retry number attempt (0-based): Retry-After, else full-jitter exponential"""
+        retry_after = retry_after_seconds(error) if error is not None else None
+        if retry_after:
+            return retry_after + random.uniform(0, LLM_BACKOFF_BASE)
+        return random.uniform(0, min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * 2 ** (attempt + 1)))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "active": self.active,
+                "waiting": len(self._waiters),
+                "rate_limited": self.rate_limited,
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2)
+            }
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+def get_governor():
+    """Process-wide LLM governor"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = LLMGovernor()
+    return _governor
@@ -0,0 +1,137 @@
+"""
+ffmpeg stages for video files: audio track and scene-change keyframes.
+
+Artifacts are cached in a directory named by the video's sha256, so the
+same video seen again (retries, other workers on the node) is only hashed,
+not written out or decoded again. On a miss the video is copied into a
+private work directory, the audio extraction and the keyframe sampling run
+there as two ffmpeg subprocesses in parallel, each under VIDEO_TIMEOUT,
+and each finished stage is moved into the cache directory atomically.
+"""
+import glob
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+VIDEO_CACHE_DIR = os.environ.get("VIDEO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "quiz-video-cache"))
+VIDEO_TIMEOUT = int(os.environ.get("VIDEO_TIMEOUT", 60))
+VIDEO_MAX_FRAMES = int(os.environ.get("VIDEO_MAX_FRAMES", 8))
+VIDEO_SCENE_THRESHOLD = float(os.environ.get("VIDEO_SCENE_THRESHOLD", 0.3))
+VIDEO_FRAME_MAX_WIDTH = int(os.environ.get("VIDEO_FRAME_MAX_WIDTH", 1280))
+VIDEO_CACHE_MAX_AGE = int(os.environ.get("VIDEO_CACHE_MAX_AGE", 24 * 3600))
+AUDIO_SAMPLE_RATE = 16000
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+
+def audio_command(source, out_path):
+    """Mono 16 kHz WAV of the first audio track, as speech recognisers expect"""
+    return ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", source,
+            "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(AUDIO_SAMPLE_RATE), "-f", "wav", out_path]
+
+
+def keyframe_command(source, out_dir):
+    """The first frame plus frames where the scene changes, downscaled, as JPEGs"""
+    select = f"select='eq(n\\,0)+gt(scene\\,{VIDEO_SCENE_THRESHOLD})'"
+    scale = f"scale='min({VIDEO_FRAME_MAX_WIDTH}\\,iw)':-2"
+    return ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", source,
+            "-vf", f"{select},{scale}", "-fps_mode", "vfr", "-frames:v", str(VIDEO_MAX_FRAMES),
+            "-q:v", "3", os.path.join(out_dir, "frame_%03d.jpg")]
+
+
+def run_parallel(commands, timeout=VIDEO_TIMEOUT):
+    """Run commands as concurrent subprocesses; name -> error text (None if it succeeded)"""
+    procs = {name: subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+             for name, cmd in commands.items()}
+    deadline = time.monotonic() + timeout
+    errors = {}
+    for name, proc in procs.items():
+        try:
+            _, stderr = proc.communicate(timeout=max(0.1, deadline - time.monotonic()))
+            errors[name] = None if proc.returncode == 0 else stderr.decode(errors="ignore").strip()[-500:]
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            errors[name] = f"timed out after {timeout}s"
+    return errors
+
+
+def file_digest(stream):
+    """sha256 of a seekable stream, rewound afterwards"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def prune_cache(cache_dir=VIDEO_CACHE_DIR, max_age=VIDEO_CACHE_MAX_AGE):
+    """Remove artifact directories not used for max_age seconds"""
+    cutoff = time.time() - max_age
+    for path in glob.glob(os.path.join(cache_dir, "*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+        except OSError:
+            continue
+
+
+def extract_video_artifacts(stream, audio=True):
+    """Audio track (WAV path or None; only extracted with audio=True), keyframe paths and per-stage errors of a video"""
+    prune_cache()
+    artifact_dir = os.path.join(VIDEO_CACHE_DIR, file_digest(stream))
+    os.makedirs(artifact_dir, exist_ok=True)
+    audio_path = os.path.join(artifact_dir, "audio.wav")
+    frames_dir = os.path.join(artifact_dir, "frames")
+
+    errors = {}
+    missing = [stage for stage, path in (("keyframes", frames_dir), ("audio", audio_path))
+               if not os.path.exists(path) and (audio or stage != "audio")]
+    if not missing:
+        print("  ♻️ Video artifacts from cache")
+        os.utime(artifact_dir)
+    else:
+        # Private work directory: concurrent calls for the same video never touch each other's files
+        work_dir = tempfile.mkdtemp(dir=artifact_dir, prefix="work-")
+        try:
+            source = os.path.join(work_dir, "source")
+            with open(source, "wb") as f:
+                shutil.copyfileobj(stream, f, 1024 * 1024)
+            work_audio = os.path.join(work_dir, "audio.wav")
+            work_frames = os.path.join(work_dir, "frames")
+            commands = {}
+            if "keyframes" in missing:
+                os.makedirs(work_frames)
+                commands["keyframes"] = keyframe_command(source, work_frames)
+            if "audio" in missing:
+                commands["audio"] = audio_command(source, work_audio)
+            errors = run_parallel(commands)
+
+            # A video without an audio track is not an error worth reporting; the empty file records it
+            if errors.get("audio") and "matches no streams" in errors["audio"]:
+                errors["audio"] = None
+                open(work_audio, "wb").close()
+            # Finished stages are moved into place atomically; when two calls race, the first one wins
+            if "keyframes" in commands and not errors["keyframes"]:
+                try:
+                    os.rename(work_frames, frames_dir)
+                except OSError:
+                    pass
+            if "audio" in commands and not errors["audio"]:
+                os.replace(work_audio, audio_path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "audio_path": audio_path if audio and os.path.exists(audio_path) and os.path.getsize(audio_path) > 44 else None,
+        "frame_paths": sorted(glob.glob(os.path.join(frames_dir, "frame_*.jpg"))),
+        "errors": {name: error for name, error in errors.items() if error}
+    }
@@ -0,0 +1,254 @@
+"""
+Per-job memory accounting and limits.
+
+Downloads are streamed into a spool that stays in memory below a threshold
+and spills to a temporary file above it, with a per-file size cap and a
+per-job download budget. A background sampler reads the process RSS so
+each tracing span can record the peak memory seen while it ran.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+MAX_DOWNLOAD_BYTES = int(os.environ.get("MAX_DOWNLOAD_BYTES", 200 * 1024 * 1024))
+SPILL_THRESHOLD_BYTES = int(os.environ.get("SPILL_THRESHOLD_BYTES", 8 * 1024 * 1024))
+JOB_DOWNLOAD_BUDGET_BYTES = int(os.environ.get("JOB_DOWNLOAD_BUDGET_BYTES", 500 * 1024 * 1024))
+MEMORY_SAMPLE_INTERVAL = float(os.environ.get("MEMORY_SAMPLE_INTERVAL", 0.1))
+CHUNK_SIZE = 256 * 1024
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_local = threading.local()
+
+
+class ResourceLimitExceeded(Exception):
+    """A download or job went over its memory/size limits"""
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def process_tree_rss_mb(pid):
+    """Resident set size of a process and its descendants in MB (approximate: shared pages count per process)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        p = pending.pop()
+        try:
+            with open(f"/proc/{p}/statm") as f:
+                total += int(f.read().split()[1]) * _PAGE_SIZE
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError, IndexError):
+            continue
+    return total / 1024 / 1024
+
+
+class Watch:
+    """Peak memory observed between start_watch() and stop_watch()"""
+
+    def __init__(self):
+        self.start_rss = current_rss_mb()
+        self.peak_rss = self.start_rss
+        self.start_heap = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.peak_heap = self.start_heap
+
+    def sample(self, rss, heap):
+        if rss > self.peak_rss:
+            self.peak_rss = rss
+        if heap is not None and self.peak_heap is not None and heap > self.peak_heap:
+            self.peak_heap = heap
+
+
+class RssSampler:
+    """Background thread feeding RSS (and tracemalloc heap, if tracing) to active watches"""
+
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._watches = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watches = list(self._watches)
+            if not watches:
+                continue
+            rss = current_rss_mb()
+            heap = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+            for watch in watches:
+                watch.sample(rss, heap)
+
+    def start_watch(self):
+        if self._thread is None or not self._thread.is_alive():
+            # After a fork the sampler thread does not exist in the child
+            self._thread = threading.Thread(target=self._run, daemon=True, name="rss-sampler")
+            self._thread.start()
+        watch = Watch()
+        with self._lock:
+            self._watches.add(watch)
+        return watch
+
+    def stop_watch(self, watch):
+        with self._lock:
+            self._watches.discard(watch)
+        watch.sample(current_rss_mb(), tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None)
+        return watch
+
+
+sampler = RssSampler()
+
+
+class JobAccount:
+    """Downloaded bytes and per-stage memory peaks for one job"""
+
+    def __init__(self, download_budget=JOB_DOWNLOAD_BUDGET_BYTES):
+        self.download_budget = download_budget
+        self.downloaded_bytes = 0
+        self.spilled_files = 0
+        self.stage_peaks = {}
+        self.watch = sampler.start_watch()
+        self._lock = threading.Lock()
+
+    def charge_download(self, n):
+        with self._lock:
+            self.downloaded_bytes += n
+            if self.downloaded_bytes > self.download_budget:
+                raise ResourceLimitExceeded(
+                    f"Job download budget of {self.download_budget} bytes exceeded")
+
+    def record_stage(self, name, watch):
+        with self._lock:
+            peak = round(watch.peak_rss, 1)
+            self.stage_peaks[name] = max(self.stage_peaks.get(name, 0), peak)
+
+    def to_dict(self):
+        result = {
+            "start_rss_mb": round(self.watch.start_rss, 1),
+            "peak_rss_mb": round(self.watch.peak_rss, 1),
+            "downloaded_bytes": self.downloaded_bytes,
+            "spilled_files": self.spilled_files,
+            "stage_peak_rss_mb": dict(self.stage_peaks)
+        }
+        if self.watch.peak_heap is not None:
+            result["peak_python_heap_mb"] = round(self.watch.peak_heap / 1024 / 1024, 1)
+        return result
+
+
+@contextmanager
+def job_account():
+    """Account memory and downloads for the job running on this thread"""
+    previous = getattr(_local, "account", None)
+    account = JobAccount()
+    _local.account = account
+    try:
+        yield account
+    finally:
+        sampler.stop_watch(account.watch)
+        _local.account = previous
+
+
+def current_account():
+    return getattr(_local, "account", None)
+
+
+def set_current_account(account):
+    """Attach an account to this thread (for helper threads); returns the previous one"""
+    previous = getattr(_local, "account", None)
+    _local.account = account
+    return previous
+
+
+class TeeSpool:
+    """File-like reader over download chunks that spools what it reads, so parsing can start while bytes arrive"""
+
+    def __init__(self, chunks, max_bytes=MAX_DOWNLOAD_BYTES, spill_threshold=SPILL_THRESHOLD_BYTES):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+        self.max_bytes = max_bytes
+        self.spill_threshold = spill_threshold
+        self.account = current_account()
+        self.spool = tempfile.SpooledTemporaryFile(max_size=spill_threshold)
+        # Hashed while streaming, so processor results can be cached by content
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.error = None
+
+    def _pull(self):
+        """Move the next chunk into the spool and the read buffer; False at the end"""
+        if self.error:
+            # A parser may have swallowed it; the spool is incomplete either way
+            raise self.error
+        try:
+            return self._pull_chunk()
+        except BaseException as e:
+            self.error = e
+            raise
+
+    def _pull_chunk(self):
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            self.size += len(chunk)
+            if self.size > self.max_bytes:
+                raise ResourceLimitExceeded(f"Download exceeds the {self.max_bytes} byte cap")
+            if self.account:
+                self.account.charge_download(len(chunk))
+            self.digest.update(chunk)
+            self.spool.write(chunk)
+            self._buffer += chunk
+            return True
+        return False
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        while (n is None or n < 0 or len(self._buffer) < n) and self._pull():
+            pass
+        if n is None or n < 0:
+            n = len(self._buffer)
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+    def readline(self, limit=-1):
+        while b"\n" not in self._buffer and self._pull():
+            pass
+        end = self._buffer.find(b"\n") + 1 or len(self._buffer)
+        return self.read(end if limit is None or limit < 0 else min(end, limit))
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def finish(self):
+        """Drain the remaining chunks; returns (spool rewound to 0, size, sha256 hex)"""
+        try:
+            while self._pull():
+                self._buffer.clear()
+        except BaseException:
+            self.spool.close()
+            raise
+        self._buffer.clear()
+
+        if self.account and self.size > self.spill_threshold:
+            self.account.spilled_files += 1
+        self.spool.seek(0)
+        return self.spool, self.size, self.digest.hexdigest()
+
+
+def spool_chunks(chunks, max_bytes=MAX_DOWNLOAD_BYTES, spill_threshold=SPILL_THRESHOLD_BYTES):
+    """Write byte chunks into a spool under the size cap and job budget; returns (spool, size, sha256 hex)"""
+    return TeeSpool(chunks, max_bytes, spill_threshold).finish()
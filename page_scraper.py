@@ -0,0 +1,220 @@
+"""
+Structured scraping for quiz pages: HTML tables and JSON API responses
+become typed DataFrames instead of flattened prompt text.
+"""
+import base64
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse, parse_qs, urlencode, urlunparse
+
+import requests
+
+from lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+
+MAX_JSON_BODIES = 20
+MAX_API_PAGES = 50
+PAGINATION_WORKERS = 8
+
+NUMBER_CLEANUP = re.compile(r"[,\s$€£₹%]")
+NEXT_KEYS = ('next', 'next_url', 'nextPage', 'next_page_url')
+RECORD_KEYS = ('data', 'results', 'items', 'records', 'rows')
+
+def coerce_types(df):
+    """Convert text columns to numbers or datetimes where every value allows it"""
+    for column in df.columns:
+        series = df[column]
+        if series.dtype != object:
+            continue
+
+        stripped = series.astype(str).str.strip()
+        present = stripped[(stripped != '') & series.notna()]
+        if present.empty:
+            continue
+
+        numbers = pd.to_numeric(present.str.replace(NUMBER_CLEANUP, '', regex=True), errors='coerce')
+        if numbers.notna().all():
+            df[column] = pd.to_numeric(stripped.str.replace(NUMBER_CLEANUP, '', regex=True), errors='coerce')
+            continue
+
+        if present.str.contains(r"\d{1,4}[-/]\d{1,2}[-/]\d{1,4}", regex=True).all():
+            dates = pd.to_datetime(present, errors='coerce')
+            if dates.notna().all():
+                df[column] = pd.to_datetime(stripped, errors='coerce')
+    return df
+
+def tables_to_dataframes(tables):
+    """Typed DataFrames from parse_page tables, keyed 'table_<n>'"""
+    frames = {}
+    for i, table in enumerate(tables):
+        rows = [row for row in table['rows'] if any(cell for cell in row)]
+        if not rows:
+            continue
+
+        width = max(len(row) for row in rows)
+        headers = table['headers'] or [f"col_{j}" for j in range(width)]
+        headers = (headers + [f"col_{j}" for j in range(len(headers), width)])[:width]
+        rows = [row + [''] * (width - len(row)) for row in rows]
+
+        frames[f"table_{i}"] = coerce_types(pd.DataFrame(rows, columns=headers))
+    return frames
+
+def find_records(payload):
+    """The list of records inside a JSON payload, if any"""
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        for key in RECORD_KEYS:
+            if isinstance(payload.get(key), list):
+                return payload[key]
+    return None
+
+def json_to_dataframe(payload):
+    """Flatten a JSON payload's records into a typed DataFrame"""
+    records = find_records(payload)
+    if not records:
+        return None
+    if not all(isinstance(r, dict) for r in records):
+        records = [{"value": r} for r in records]
+    return coerce_types(pd.json_normalize(records))
+
+def capture_json_responses(driver, max_bodies=MAX_JSON_BODIES):
+    """JSON/XHR responses the page loaded, from Chrome's performance log"""
+    try:
+        entries = driver.get_log('performance')
+    except Exception as e:
+        print(f"  ✗ Performance log unavailable: {e}")
+        return []
+
+    captured = []
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, ValueError):
+            continue
+        if message.get('method') != 'Network.responseReceived':
+            continue
+
+        params = message['params']
+        response = params.get('response', {})
+        if 'json' not in response.get('mimeType', ''):
+            continue
+
+        try:
+            body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': params['requestId']})
+            text = base64.b64decode(body['body']) if body.get('base64Encoded') else body['body']
+            captured.append({
+                "url": response['url'],
+                "status": response.get('status'),
+                "data": json.loads(text)
+            })
+        except Exception as e:
+            print(f"  ✗ Could not read body of {response.get('url')}: {e}")
+
+        if len(captured) >= max_bodies:
+            break
+
+    print(f"✓ Captured {len(captured)} JSON responses")
+    return captured
+
+def _next_link(payload, url):
+    """Absolute URL of the next page named in a payload, if any"""
+    if not isinstance(payload, dict):
+        return None
+    candidates = [payload.get(key) for key in NEXT_KEYS]
+    links = payload.get('links')
+    if isinstance(links, dict):
+        candidates.append(links.get('next'))
+    for candidate in candidates:
+        if isinstance(candidate, dict):
+            candidate = candidate.get('href')
+        if isinstance(candidate, str) and candidate:
+            return urljoin(url, candidate)
+    return None
+
+def _page_urls(payload, url, max_pages):
+    """All remaining page URLs when the payload states a page count"""
+    if not isinstance(payload, dict):
+        return []
+    total = payload.get('total_pages') or payload.get('totalPages') or payload.get('pages')
+    if not isinstance(total, int):
+        return []
+
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    try:
+        current = int(query.get('page', ['1'])[0])
+    except ValueError:
+        # e.g. ?page=next: the page number cannot be continued
+        return []
+
+    urls = []
+    for page in range(current + 1, min(total, current + max_pages) + 1):
+        query['page'] = [str(page)]
+        urls.append(urlunparse(parsed._replace(query=urlencode(query, doseq=True))))
+    return urls
+
+def _fetch_json(url):
+    """GET a JSON document, None on failure"""
+    try:
+        response = requests.get(url, timeout=15)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        print(f"  ✗ API page failed {url}: {e}")
+        return None
+
+def follow_pagination(payload, url, max_pages=MAX_API_PAGES):
+    """Fetch the remaining pages of a paginated API; returns all payloads in order"""
+    payloads = [payload]
+
+    # Known page count: fetch every page concurrently
+    page_urls = _page_urls(payload, url, max_pages)
+    if page_urls:
+        with ThreadPoolExecutor(max_workers=PAGINATION_WORKERS) as pool:
+            payloads.extend(p for p in pool.map(_fetch_json, page_urls) if p is not None)
+        return payloads
+
+    # Only "next" links: pages must be walked in order
+    seen = {url}
+    next_url = _next_link(payload, url)
+    while next_url and next_url not in seen and len(payloads) < max_pages:
+        seen.add(next_url)
+        page = _fetch_json(next_url)
+        if page is None:
+            break
+        payloads.append(page)
+        next_url = _next_link(page, next_url)
+    return payloads
+
+def api_dataframes(responses):
+    """Typed DataFrames from captured API responses (all pages), keyed 'api:<url>'"""
+    frames = {}
+
+    def collect(response):
+        try:
+            payloads = follow_pagination(response['data'], response['url'])
+        except Exception as e:
+            # One odd endpoint must not fail the page; keep the page that was captured
+            print(f"  ✗ Pagination failed for {response['url']}: {e}")
+            payloads = [response['data']]
+        parts = [df for df in (json_to_dataframe(p) for p in payloads) if df is not None and not df.empty]
+        return response['url'], parts
+
+    # Pages of the same endpoint are re-fetched by follow_pagination
+    by_endpoint = {}
+    for response in responses:
+        parsed = urlparse(response['url'])
+        by_endpoint.setdefault((parsed.netloc, parsed.path), response)
+    responses = list(by_endpoint.values())
+
+    if not responses:
+        return frames
+
+    with ThreadPoolExecutor(max_workers=PAGINATION_WORKERS) as pool:
+        for url, parts in pool.map(collect, responses):
+            if parts:
+                frames[f"api:{url}"] = pd.concat(parts, ignore_index=True)
+    return frames
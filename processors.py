@@ -0,0 +1,523 @@
+"""
+Registry of file processors, keyed by detected file type.
+
+Every downloaded file goes through run_processor(). Each processor declares
+how it is scheduled: CPU-bound ones run on the raw bytes in a shared process
+pool, the rest run on the calling thread; streaming ones read the download
+spool directly instead of a bytes copy. Results of cacheable processors are
+kept in an LRU keyed by (file type, content sha256), so a file that shows up
+again (retries, resumed chains, other jobs) is not processed twice.
+"""
+import base64
+import codecs
+import hashlib
+import itertools
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from lazy_imports import lazy_import
+from data_processor import DataProcessor, summarize_dataframe
+from tracing import span, in_current_trace
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+PyPDF2 = lazy_import('PyPDF2')
+Image = lazy_import('PIL.Image')
+ImageOps = lazy_import('PIL.ImageOps')
+
+PROCESSOR_WORKERS = int(os.environ.get("PROCESSOR_WORKERS", 2))
+PROCESSOR_TIMEOUT = int(os.environ.get("PROCESSOR_TIMEOUT", 60))
+PROCESSOR_CACHE_SIZE = int(os.environ.get("PROCESSOR_CACHE_SIZE", 64))
+
+# Image stage settings
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", 1600))
+VISION_MAX_SIDE = int(os.environ.get("VISION_MAX_SIDE", 1024))
+OCR_MIN_CHARS = int(os.environ.get("OCR_MIN_CHARS", 20))
+OCR_TIMEOUT = int(os.environ.get("OCR_TIMEOUT", 30))
+
+# JSON records are turned into DataFrames this many at a time
+JSON_BATCH_ROWS = int(os.environ.get("JSON_BATCH_ROWS", 10000))
+JSON_CHUNK_SIZE = 1024 * 1024
+
+Processor = namedtuple('Processor', 'file_type fn cpu_bound streaming cacheable')
+
+PROCESSORS = {}
+
+_pool = None
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def register_processor(file_type, cpu_bound=False, streaming=False, cacheable=True):
+    """Register fn(source) -> dict of result fields as the processor for file_type"""
+    if cpu_bound and streaming:
+        # Process-pool work is shipped as bytes; an open spool cannot be pickled
+        raise ValueError(f"Processor for {file_type} cannot be both CPU-bound and streaming")
+
+    def decorator(fn):
+        PROCESSORS[file_type] = Processor(file_type, fn, cpu_bound, streaming, cacheable)
+        return fn
+    return decorator
+
+
+def get_processor(file_type):
+    return PROCESSORS.get(file_type)
+
+
+def get_processor_pool():
+    """Lazily create the process pool shared by CPU-bound processors"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PROCESSOR_WORKERS)
+    return _pool
+
+
+def as_stream(data):
+    """File-like view of bytes or an already open (spooled) file"""
+    return BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+
+
+def _cache_get(key):
+    with _cache_lock:
+        result = _cache.get(key)
+        if result is not None:
+            _cache.move_to_end(key)
+        return result
+
+
+def _cache_put(key, result):
+    with _cache_lock:
+        _cache[key] = result
+        _cache.move_to_end(key)
+        while len(_cache) > PROCESSOR_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def run_processor(file_type, source, digest=None):
+    """Process bytes or a file object with the registered processor; None if there is none"""
+    processor = PROCESSORS.get(file_type)
+    if processor is None:
+        return None
+
+    if not processor.streaming and not isinstance(source, (bytes, bytearray)):
+        source = source.read()
+    if digest is None and isinstance(source, (bytes, bytearray)):
+        digest = hashlib.sha256(source).hexdigest()
+
+    key = (file_type, digest) if processor.cacheable and digest else None
+    if key:
+        cached = _cache_get(key)
+        if cached is not None:
+            print(f"  ✓ {file_type} result from cache")
+            # Callers pop fields when a hop ends, so never hand out the cached dict
+            return dict(cached)
+
+    executor = 'process' if processor.cpu_bound else 'inline'
+    with span('process_file', type=file_type, executor=executor):
+        if processor.cpu_bound:
+            future = get_processor_pool().submit(processor.fn, bytes(source))
+            result = future.result(timeout=PROCESSOR_TIMEOUT)
+        else:
+            result = processor.fn(as_stream(source))
+
+    if key:
+        _cache_put(key, result)
+    return dict(result)
+
+
+@register_processor('pdf', cpu_bound=True)
+def process_pdf(pdf_bytes):
+    """Extract text from PDF"""
+    print("  📄 Processing PDF...")
+    pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_bytes))
+
+    pages = [page.extract_text() for page in pdf_reader.pages]
+    full_text = "\n\n".join(f"[Page {i+1}]\n{text}" for i, text in enumerate(pages))
+    print(f"  ✓ Extracted {len(full_text)} chars from {len(pages)} pages")
+    return {"content": full_text, "text": full_text, "pages": pages}
+
+
+# DataFrames are large and released at the end of each hop, so they are not cached
+@register_processor('csv', streaming=True, cacheable=False)
+def process_csv(csv_file):
+    """Process CSV file"""
+    print("  📊 Processing CSV...")
+    df = pd.read_csv(csv_file)
+    summary = summarize_dataframe(df, rows=10, stats=True)
+    print(f"  ✓ CSV: {df.shape[0]} rows x {df.shape[1]} columns")
+    return {"content": summary, "csv_data": {"dataframe": df, "summary": summary}}
+
+
+@register_processor('excel', streaming=True, cacheable=False)
+def process_excel(excel_file):
+    """Process Excel file, every sheet"""
+    print("  📊 Processing Excel...")
+    sheets = pd.read_excel(excel_file, sheet_name=None)
+    excel_data = {name: {"dataframe": df, "summary": summarize_dataframe(df, rows=10, stats=True)} for name, df in sheets.items()}
+    print(f"  ✓ Excel: {len(sheets)} sheet(s)")
+    return {
+        "content": {name: data["summary"] for name, data in excel_data.items()},
+        "excel_data": excel_data
+    }
+
+
+def first_char(stream):
+    """First non-whitespace character of a byte stream (BOM skipped); rewinds the stream"""
+    while True:
+        chunk = stream.read(4096)
+        if not chunk:
+            char = ''
+            break
+        chunk = chunk.lstrip(codecs.BOM_UTF8 + b' \t\r\n')
+        if chunk:
+            char = chr(chunk[0])
+            break
+    stream.seek(0)
+    return char
+
+
+class JsonReader:
+    """JSON text decoded incrementally from a byte stream, one chunk at a time"""
+
+    def __init__(self, stream, chunk_size=JSON_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+        self.buf, self.pos, self.eof = '', 0, False
+
+    def more(self):
+        """Read the next chunk into the buffer, dropping what was consumed; False at EOF"""
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.text.decode(chunk, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        """Next non-whitespace character ('' at EOF)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.more():
+                return self.buf[self.pos] if self.pos < len(self.buf) else ''
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of chars"""
+        token = self.peek()
+        if not token or token not in chars:
+            raise ValueError(f"Malformed JSON near {self.buf[max(0, self.pos - 20):self.pos + 20]!r}")
+        self.pos += 1
+        return token
+
+    def value(self):
+        """Decode the next complete value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.eof:
+                    self.more()
+                    continue
+                raise
+            # A number cut by the chunk boundary may still decode ("893" of "893.465"), leaving
+            # at most "e-" unread; it only counts once the delimiter after it has been read
+            follow = end
+            while follow < len(self.buf) and self.buf[follow] in ' \t\r\n':
+                follow += 1
+            cut = follow == len(self.buf) or (self.buf[follow] not in ',]}:' and len(self.buf) - end <= 2)
+            if cut and not self.eof:
+                self.more()
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """Elements of the array whose '[' was just consumed"""
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_json_array(stream, chunk_size=JSON_CHUNK_SIZE):
+    """Elements of a top-level JSON array, decoded one at a time from a byte stream"""
+    reader = JsonReader(stream, chunk_size)
+    if reader.peek() != '[':
+        raise ValueError("Not a JSON array")
+    reader.pos += 1
+    yield from reader.items()
+
+
+def object_records(stream, chunk_size=JSON_CHUNK_SIZE):
+    """Records of the first member of a top-level JSON object that is a list of objects, streamed; None if there is none"""
+    reader = JsonReader(stream, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return None
+    while True:
+        reader.value()
+        reader.expect(':')
+        if reader.peek() == '[':
+            reader.pos += 1
+            items = reader.items()
+            first = next(items, None)
+            if isinstance(first, dict):
+                return itertools.chain([first], items)
+            # Other lists are read through one element at a time
+            for _ in items:
+                pass
+        else:
+            reader.value()
+        if reader.expect(',}') == '}':
+            return None
+
+
+def iter_ndjson(stream):
+    """Values of newline-delimited JSON, one line at a time"""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def json_records(stream):
+    """Records of a JSON array, NDJSON, or a document holding a list of records; else (None, document)"""
+    char = first_char(stream)
+    if char == '[':
+        return iter_json_array(stream), None
+    if char == '{':
+        # NDJSON has a whole object on its first line and more lines after it
+        try:
+            json.loads(stream.readline())
+            ndjson = bool(stream.readline().strip())
+        except ValueError:
+            ndjson = False
+        stream.seek(0)
+        if ndjson:
+            return iter_ndjson(stream), None
+        records = object_records(stream)
+        if records is not None:
+            return records, None
+        stream.seek(0)
+    return None, json.load(stream)
+
+
+def records_to_frame(records, batch_rows=JSON_BATCH_ROWS):
+    """DataFrame from an iterator of records, flattened and converted in columnar batches"""
+    frames, batch = [], []
+    for record in records:
+        batch.append(record if isinstance(record, dict) else {"value": record})
+        if len(batch) == batch_rows:
+            frames.append(pd.json_normalize(batch))
+            batch = []
+    if batch or not frames:
+        frames.append(pd.json_normalize(batch))
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+@register_processor('json', streaming=True, cacheable=False)
+def process_json(json_file):
+    """Process JSON or NDJSON: records become a DataFrame, anything else is kept as text"""
+    print("  🧾 Processing JSON...")
+    records, document = json_records(json_file)
+    if records is None:
+        text = json.dumps(document, default=str)
+        print(f"  ✓ JSON document: {len(text)} chars")
+        return {"content": text}
+
+    df = records_to_frame(records)
+    summary = summarize_dataframe(df, rows=10, stats=True)
+    print(f"  ✓ JSON: {df.shape[0]} records x {df.shape[1]} columns")
+    return {"content": summary, "json_data": {"dataframe": df, "summary": summary}}
+
+
+@register_processor('text', streaming=True)
+def process_text(text_file):
+    """Decode a text file"""
+    return {"content": text_file.read().decode('utf-8', errors='ignore')}
+
+
+# transcribe_audio is a stub for now; set to True when it is re-enabled so
+# video processing starts extracting audio tracks for it again
+AUDIO_TRANSCRIPTION = False
+
+
+@register_processor('audio')
+def transcribe_audio(audio_bytes):
+    """Transcribe audio to text using speech recognition"""
+    print("  🎤 Audio transcription disabled")
+    return {"content": None, "transcription": None}
+    # print("  🎤 Transcribing audio...")
+
+    # try:
+    #     # Convert audio to WAV format
+    #     audio = AudioSegment.from_file(BytesIO(audio_bytes))
+    #     audio = audio.set_channels(1).set_frame_rate(16000)
+
+    #     wav_io = BytesIO()
+    #     audio.export(wav_io, format='wav')
+    #     wav_io.seek(0)
+
+    #     # Use speech recognition
+    #     recognizer = sr.Recognizer()
+    #     with sr.AudioFile(wav_io) as source:
+    #         audio_data = recognizer.record(source)
+    #         text = recognizer.recognize_google(audio_data)
+
+    #     print(f"  ✓ Transcribed: {len(text)} chars")
+    #     print(f"  Preview: {text[:200]}")
+    #     return text
+
+    # except Exception as e:
+    #     print(f"  ✗ Transcription failed: {e}")
+    #     # Fallback: try with OpenAI Whisper if available
+    #     try:
+    #         print("  Trying OpenAI Whisper...")
+    #         # Save audio temporarily
+    #         temp_audio = BytesIO(audio_bytes)
+    #         temp_audio.name = "audio.mp3"
+
+    #         response = client.audio.transcriptions.create(
+    #             model="whisper-1",
+    #             file=temp_audio
+    #         )
+    #         text = response.text
+    #         print(f"  ✓ Whisper transcribed: {len(text)} chars")
+    #         return text
+    #     except Exception as e2:
+    #         print(f"  ✗ Whisper also failed: {e2}")
+    #         return None
+
+
+def load_image(image_bytes):
+    """Decode image bytes into an RGB PIL image (first frame, EXIF-rotated)"""
+    img = Image.open(BytesIO(image_bytes))
+    if getattr(img, 'is_animated', False):
+        img.seek(0)
+    img = ImageOps.exif_transpose(img)
+    return img.convert('RGB')
+
+
+def normalize_image(img, max_side=IMAGE_MAX_SIDE):
+    """Downsize an image so its longest side is at most max_side"""
+    img = img.copy()
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    return img
+
+
+def run_ocr(gray):
+    """Run Tesseract on a grayscale image"""
+    import pytesseract
+    # Tesseract works best on text around 30px high, so upscale small images
+    if max(gray.size) < 1000:
+        gray = gray.resize((gray.width * 2, gray.height * 2), Image.LANCZOS)
+    return pytesseract.image_to_string(gray, timeout=OCR_TIMEOUT).strip()
+
+
+def image_statistics(img, top_n=5):
+    """Pixel statistics and dominant colours, computed on the full-size image"""
+    arr = np.asarray(img)
+    histogram = DataProcessor.color_histogram(arr)
+    region = DataProcessor.region_stats(arr)
+
+    return {
+        "width": img.width,
+        "height": img.height,
+        "pixel_count": region['pixel_count'],
+        "unique_colors": len(histogram),
+        "mean_rgb": [round(v, 2) for v in region['mean']],
+        "std_rgb": [round(v, 2) for v in region['std']],
+        "dominant_colors": histogram[:top_n]
+    }
+
+
+def compress_image_for_vision(img, max_side=VISION_MAX_SIDE):
+    """Shrink and JPEG-compress an image into a data URL for a vision call"""
+    small = normalize_image(img, max_side)
+    buf = BytesIO()
+    small.save(buf, format='JPEG', quality=70, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode('utf-8')
+
+
+@register_processor('image', cpu_bound=True)
+def process_image(image_bytes):
+    """Process image: OCR text, pixel statistics, vision fallback payload"""
+    print("  🖼️ Processing image...")
+    img = load_image(image_bytes)
+    stats = image_statistics(img)
+    print(f"  ✓ Image: {img.width}x{img.height}, {stats['unique_colors']} colours")
+
+    normalized = normalize_image(img)
+    gray = ImageOps.autocontrast(normalized.convert('L'))
+
+    ocr_text = None
+    try:
+        ocr_text = run_ocr(gray)
+        print(f"  ✓ OCR: {len(ocr_text)} chars")
+    except Exception as e:
+        print(f"  ✗ OCR failed: {e}")
+
+    result = {
+        "content": ocr_text,
+        "ocr_text": ocr_text,
+        "image_stats": stats,
+        "vision_image": None
+    }
+
+    # Only pay for a vision call when OCR did not recover enough text
+    if not ocr_text or len(ocr_text) < OCR_MIN_CHARS:
+        result['vision_image'] = compress_image_for_vision(normalized)
+
+    return result
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@register_processor('video', streaming=True)
+def process_video(video_file):
+    """Process video: OCR its scene-change keyframes (and transcribe its audio track once transcription is enabled)"""
+    from media import ffmpeg_available, extract_video_artifacts
+    print("  🎬 Processing video...")
+    if not ffmpeg_available():
+        print("  ✗ ffmpeg not installed, video skipped")
+        return {"content": None}
+
+    with span('video_extract'):
+        artifacts = extract_video_artifacts(video_file, audio=AUDIO_TRANSCRIPTION)
+    for stage, error in artifacts['errors'].items():
+        print(f"  ✗ Video {stage} failed: {error}")
+
+    transcription = None
+    if artifacts['audio_path']:
+        transcription = run_processor('audio', read_file(artifacts['audio_path'])).get('transcription')
+
+    # Keyframes go through the image processor (process pool, cached by content) concurrently
+    frames = [read_file(path) for path in artifacts['frame_paths']]
+    keyframes = []
+    if frames:
+        with ThreadPoolExecutor(max_workers=min(len(frames), PROCESSOR_WORKERS)) as pool:
+            keyframes = list(pool.map(in_current_trace(lambda frame: run_processor('image', frame)), frames))
+    print(f"  ✓ Video: {len(keyframes)} keyframe(s), audio {'transcribed' if transcription else 'not transcribed'}")
+
+    frame_text = "\n".join(f"[Keyframe {i+1}] {kf['ocr_text']}" for i, kf in enumerate(keyframes) if kf.get('ocr_text'))
+    content = "\n\n".join(part for part in (transcription, frame_text) if part) or None
+    return {
+        "content": content,
+        "transcription": transcription,
+        "frame_text": frame_text,
+        "keyframe_count": len(keyframes),
+        # The first keyframe is described by the vision call when OCR read too little in every frame
+        "vision_image": keyframes[0]['vision_image'] if keyframes and all(kf.get('vision_image') for kf in keyframes) else None
+    }
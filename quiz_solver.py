@@ -1,13 +1,19 @@
 import anthropic
 import json
 import re
+import time
 from typing import Dict, Any, List, Optional
 
+from data_processor import DataProcessor
+from tracing import span, record_tokens
+from llm_governor import get_governor, estimate_tokens
+
 class QuizSolver:
     """Advanced quiz solving with Claude"""
     
     def __init__(self, api_key: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+        # Retries and backoff go through the shared LLM governor
+        self.client = anthropic.Anthropic(api_key=api_key, max_retries=0)
     
     def solve_quiz(self, quiz_content: Dict[str, Any], files_data: Optional[Dict] = None) -> Dict[str, Any]:
         """Main method to solve a quiz"""
@@ -77,15 +83,20 @@ class QuizSolver:
         
         for attempt in range(max_retries):
             try:
-                message = self.client.messages.create(
-                    model="claude-sonnet-4-20250514",
-                    max_tokens=4096,
-                    temperature=0.1,  # Lower temperature for more consistent answers
-                    messages=[{
-                        "role": "user",
-                        "content": prompt
-                    }]
-                )
+                with span('call_claude', attempt=attempt + 1) as attrs, \
+                        get_governor().slot(estimate_tokens(prompt, 4096), "claude") as usage:
+                    message = self.client.messages.create(
+                        model="claude-sonnet-4-20250514",
+                        max_tokens=4096,
+                        temperature=0.1,  # Lower temperature for more consistent answers
+                        messages=[{
+                            "role": "user",
+                            "content": prompt
+                        }]
+                    )
+                    record_tokens(attrs, message.model, message.usage.input_tokens, message.usage.output_tokens,
+                                  getattr(message.usage, 'cache_read_input_tokens', 0))
+                    usage['tokens'] = message.usage.input_tokens + message.usage.output_tokens
                 
                 return message.content[0].text
             
@@ -93,7 +104,7 @@ class QuizSolver:
                 if attempt == max_retries - 1:
                     raise
                 print(f"Claude API error (attempt {attempt + 1}): {e}")
-                continue
+                time.sleep(get_governor().backoff(attempt, e))
     
     def _parse_response(self, response: str) -> Dict[str, Any]:
         """Parse Claude's response into structured format"""
@@ -171,25 +182,33 @@ class QuizSolver:
         response = self._call_claude("\n".join(prompt_parts))
         return self._parse_response(response)
     
-    def handle_visualization(self, data: Any, viz_type: str) -> str:
+    def handle_visualization(self, data: Any, viz_type: str) -> Dict[str, Any]:
         """Generate visualization if needed"""
         
-        prompt = f"""Generate a {viz_type} visualization for this data:
+        prompt = f"""Prepare data for a {viz_type} chart of this data:
 
 {json.dumps(data, indent=2)}
 
 Return a JSON object with:
 {{
   "chart_type": "{viz_type}",
-  "data_for_chart": {{"x": [...], "y": [...]}},
-  "base64_image": "data:image/png;base64,..." 
+  "data_for_chart": {{"label1": value1, "label2": value2}}
 }}
-
-If you cannot generate the image, describe what the chart should show.
 """
         
         response = self._call_claude(prompt)
-        return self._parse_response(response)
+        result = self._parse_response(response)
+        
+        # The image is rendered locally; the model only picks the data
+        chart_data = result.get('data_for_chart')
+        if isinstance(chart_data, dict) and chart_data:
+            image = DataProcessor.create_visualization(chart_data, result.get('chart_type', viz_type))
+            if isinstance(image, str):
+                result['base64_image'] = image
+            else:
+                result['error'] = image.get('error')
+        
+        return result
     
     def validate_answer(self, answer: Any, expected_type: str) -> bool:
         """Validate answer matches expected type"""
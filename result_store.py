@@ -0,0 +1,186 @@
+"""
+Persistent store for quiz chain progress (SQLite in WAL mode).
+
+Every hop is written as soon as its answer is graded, so a chain that dies
+mid-way (worker timeout, crash) can be resumed from its last unanswered URL,
+and answers already graded correct can be re-submitted without re-solving.
+
+A job is only resumed when the caller passes its job_id again; requests
+without one get a fresh id. A job still running (updated within
+JOB_STALE_SECONDS) is not resumed a second time. Any quiz URL already
+answered correctly for that email is re-submitted from the store, so
+benchmarks and load tests use their own RESULT_DB_PATH.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+RESULT_DB_PATH = os.environ.get("RESULT_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quiz_results.db"))
+# A running job not updated for this long is taken to have died
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", 300))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    initial_url TEXT NOT NULL,
+    current_url TEXT,
+    status TEXT NOT NULL,
+    attempt INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hops (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    attempt INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    url TEXT NOT NULL,
+    submit_url TEXT,
+    answer TEXT,
+    correct INTEGER,
+    reason TEXT,
+    next_url TEXT,
+    seconds REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hops_by_job ON hops (job_id, attempt, id);
+CREATE INDEX IF NOT EXISTS hops_correct_by_url ON hops (url, email, correct);
+"""
+
+
+class JobRunning(Exception):
+    """The job is already being run by a live request or worker"""
+
+
+class ResultStore:
+    """Chain progress and graded answers, one SQLite connection per thread"""
+
+    def __init__(self, path=RESULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # WAL: readers never block the writer; NORMAL sync is durable enough with WAL
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def new_job_id():
+        return uuid.uuid4().hex[:16]
+
+    def start_job(self, job_id, email, initial_url, leased=False):
+        """Create or resume a job; returns (url to continue from, results recorded so far)
+
+        A job still running is only taken over once it has gone stale, or when
+        the caller holds the job's work-queue lease (leased=True).
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO jobs (job_id, email, initial_url, current_url, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, 'running', ?, ?)",
+                    (job_id, email, initial_url, initial_url, now, now))
+                resume = None
+            elif row["status"] == "running" and row["current_url"]:
+                if not leased and now - row["updated_at"] < JOB_STALE_SECONDS:
+                    raise JobRunning(f"Job {job_id} is already running")
+                conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (now, job_id))
+                resume = row
+            else:
+                # A finished job submitted again starts a fresh attempt
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', current_url = ?, attempt = attempt + 1, updated_at = ? "
+                    "WHERE job_id = ?", (initial_url, now, job_id))
+                resume = None
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        if resume is None:
+            return initial_url, []
+        print(f"↻ Resuming job {job_id} at {resume['current_url']}")
+        return resume["current_url"], self.job_results(job_id, resume["attempt"])
+
+    def record_hop(self, job_id, email, url, submit_url, answer, correct, reason, next_url, seconds):
+        """Store a graded hop and move the job on to next_url, atomically"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            attempt = conn.execute("SELECT attempt FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            conn.execute(
+                "INSERT INTO hops (job_id, attempt, email, url, submit_url, answer, correct, reason, next_url, seconds, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, attempt["attempt"] if attempt else 1, email, url, submit_url, json.dumps(answer),
+                 None if correct is None else int(bool(correct)), reason, next_url, seconds, now))
+            conn.execute("UPDATE jobs SET current_url = ?, updated_at = ? WHERE job_id = ?", (next_url, now, job_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def finish_job(self, job_id, status="completed"):
+        """Give the job a terminal status: completed, failed or timed_out"""
+        self._connect().execute("UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?",
+                                (status, time.time(), job_id))
+
+    def job_results(self, job_id, attempt=None):
+        """Recorded hops of a job (latest attempt by default), in results format"""
+        conn = self._connect()
+        if attempt is None:
+            row = conn.execute("SELECT attempt FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return []
+            attempt = row["attempt"]
+        rows = conn.execute("SELECT * FROM hops WHERE job_id = ? AND attempt = ? ORDER BY id",
+                            (job_id, attempt)).fetchall()
+        return [{
+            "url": r["url"],
+            "answer": json.loads(r["answer"]),
+            "correct": None if r["correct"] is None else bool(r["correct"]),
+            "reason": r["reason"],
+            "seconds": r["seconds"]
+        } for r in rows]
+
+    def job_status(self, job_id):
+        row = self._connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def correct_answer(self, url, email):
+        """Most recent answer graded correct for this quiz URL, as (submit_url, answer, next_url)"""
+        row = self._connect().execute(
+            "SELECT submit_url, answer, next_url FROM hops WHERE url = ? AND email = ? AND correct = 1 "
+            "ORDER BY id DESC LIMIT 1", (url, email)).fetchone()
+        if row is None:
+            return None
+        return row["submit_url"], json.loads(row["answer"]), row["next_url"]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_result_store():
+    """Process-wide result store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultStore()
+    return _store
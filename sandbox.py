@@ -0,0 +1,362 @@
+"""
+Sandboxed execution of short pandas/NumPy snippets written by the model.
+
+Each snippet runs in its own child interpreter that was started ahead of
+time (pandas and NumPy already imported), so a run only pays for pickling
+the DataFrames in. Children run with CPU-time and address-space limits, no
+inherited secrets in the environment, an empty working directory and an
+import whitelist, and exit after a single job so no state leaks between
+quizzes. When the app runs as root, children run as an unprivileged uid
+(SANDBOX_UID). File and network access is refused: pandas/NumPy readers
+and writers reject paths and URLs, and Landlock keeps the child from
+opening anything outside the Python installation at all. Without Landlock
+(older kernels, seccomp profiles) the sandbox refuses to run snippets
+unless SANDBOX_ALLOW_UNCONFINED=1. The result comes back as JSON, so the
+parent never unpickles child output.
+"""
+import os
+import sys
+import json
+import pickle
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+
+SANDBOX_POOL_SIZE = int(os.environ.get("SANDBOX_POOL_SIZE", 2))
+SANDBOX_CPU_SECONDS = int(os.environ.get("SANDBOX_CPU_SECONDS", 10))
+SANDBOX_MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", 1024))
+SANDBOX_TIMEOUT = int(os.environ.get("SANDBOX_TIMEOUT", 20))
+# Uid/gid the children run as when the app runs as root (65534 = nobody)
+SANDBOX_UID = int(os.environ.get("SANDBOX_UID", 65534))
+# Run snippets even where Landlock is unavailable (only the import whitelist and path checks then)
+SANDBOX_ALLOW_UNCONFINED = os.environ.get("SANDBOX_ALLOW_UNCONFINED", "0") == "1"
+
+ALLOWED_MODULES = {
+    'math', 'statistics', 're', 'json', 'datetime', 'collections', 'itertools',
+    'functools', 'decimal', 'fractions', 'string', 'heapq', 'bisect',
+    'numpy', 'pandas'
+}
+
+BLOCKED_BUILTINS = {'open', 'exec', 'eval', 'compile', 'input', 'breakpoint', 'exit', 'quit', 'help'}
+
+# DataFrame/Series methods that write to a path when given one
+FILE_WRITERS = ('to_csv', 'to_json', 'to_excel', 'to_parquet', 'to_pickle', 'to_feather', 'to_hdf', 'to_html',
+                'to_latex', 'to_markdown', 'to_orc', 'to_stata', 'to_xml', 'to_string', 'to_sql', 'to_clipboard')
+
+READY = b'R'
+UNCONFINED = b'U'
+
+
+class SandboxPool:
+    """Pool of pre-warmed sandbox interpreters, one job per interpreter"""
+
+    def __init__(self, size=SANDBOX_POOL_SIZE):
+        self.size = size
+        self._idle = queue.Queue()
+        self._workdir = tempfile.mkdtemp(prefix="sandbox-")
+        self._started = False
+        self._disabled = None
+        self._lock = threading.Lock()
+        if os.geteuid() == 0:
+            os.chown(self._workdir, SANDBOX_UID, SANDBOX_UID)
+
+    def start(self):
+        """Start warming workers in the background"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            threading.Thread(target=self._spawn, daemon=True).start()
+
+    def _spawn(self):
+        """Launch one worker and queue it once its imports are done"""
+        if self._disabled:
+            return
+        try:
+            # Root children would still be able to read other processes' environments
+            drop = dict(user=SANDBOX_UID, group=SANDBOX_UID, extra_groups=[]) if os.geteuid() == 0 else {}
+            env = {
+                "PATH": os.environ.get("PATH", ""),
+                "OMP_NUM_THREADS": "1",
+                "OPENBLAS_NUM_THREADS": "1",
+            }
+            proc = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--worker"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=self._workdir,
+                env=env,
+                **drop
+            )
+            status = proc.stdout.read(1)
+            if status == READY:
+                self._idle.put(proc)
+            else:
+                proc.kill()
+                if status == UNCONFINED:
+                    self._disable("Landlock is not available, sandbox disabled (SANDBOX_ALLOW_UNCONFINED=1 runs without it)")
+        except Exception as e:
+            print(f"  ✗ Sandbox worker failed to start: {e}")
+
+    def _disable(self, reason):
+        """Stop spawning workers; waiting and later runs fail with reason"""
+        with self._lock:
+            if self._disabled:
+                return
+            self._disabled = reason
+        print(f"  ✗ {reason}")
+        self._idle.put(None)
+
+    def _acquire(self, timeout):
+        """Take a warm worker, starting a replacement in the background"""
+        self.start()
+        if self._disabled:
+            raise RuntimeError(self._disabled)
+        try:
+            proc = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No sandbox worker became ready")
+        if proc is None:
+            # Leave the marker for the next waiter
+            self._idle.put(None)
+            raise RuntimeError(self._disabled)
+        threading.Thread(target=self._spawn, daemon=True).start()
+        return proc
+
+    def run(self, code, dataframes=None, timeout=SANDBOX_TIMEOUT):
+        """Run a snippet; returns {"ok", "result", "stdout"} or {"ok": False, "error"}"""
+        start = time.time()
+        try:
+            proc = self._acquire(timeout)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+        job = pickle.dumps({"code": code, "dataframes": dataframes or {}}, protocol=pickle.HIGHEST_PROTOCOL)
+        remaining = max(1, timeout - (time.time() - start))
+
+        try:
+            out, err = proc.communicate(input=job, timeout=remaining)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            return {"ok": False, "error": f"Timed out after {timeout}s"}
+
+        if not out:
+            detail = err.decode('utf-8', errors='ignore').strip()[-500:]
+            return {"ok": False, "error": f"Sandbox exited with code {proc.returncode} (resource limit?) {detail}"}
+
+        try:
+            # JSON, not pickle: the child ran untrusted code
+            return json.loads(out)
+        except Exception as e:
+            return {"ok": False, "error": f"Bad sandbox response: {e}"}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_sandbox_pool():
+    """Process-wide sandbox pool, warming starts on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+            _pool.start()
+    return _pool
+
+def run_code(code, dataframes=None, timeout=SANDBOX_TIMEOUT):
+    """Run a snippet in the shared sandbox pool"""
+    return get_sandbox_pool().run(code, dataframes, timeout)
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+def _to_jsonable(value):
+    """Convert pandas/NumPy results into plain JSON-friendly values"""
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, pd.DataFrame):
+        return value.to_dict('records')
+    if isinstance(value, pd.Series):
+        return {str(k): _to_jsonable(v) for k, v in value.to_dict().items()}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {str(k): _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return str(value)
+    return value
+
+def _safe_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """__import__ limited to ALLOWED_MODULES"""
+    if name.split('.')[0] not in ALLOWED_MODULES:
+        raise ImportError(f"Import of '{name}' is not allowed in the sandbox")
+    return __import__(name, globals, locals, fromlist, level)
+
+def _capture_last_expression(code):
+    """Compile code so a trailing expression is stored in `result`"""
+    import ast
+    tree = ast.parse(code, mode='exec')
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = tree.body[-1]
+        tree.body[-1] = ast.Assign(targets=[ast.Name(id='result', ctx=ast.Store())], value=last.value)
+        ast.fix_missing_locations(tree)
+    return compile(tree, '<sandbox>', 'exec')
+
+def _refuse_paths(fn, first_arg=0):
+    """Wrap a pandas/NumPy reader or writer so it only accepts in-memory buffers"""
+    import functools
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        targets = list(args[first_arg:first_arg + 1]) + [
+            kwargs.get(k) for k in ('filepath_or_buffer', 'path_or_buf', 'path', 'io', 'fname', 'file', 'excel_writer')]
+        if any(isinstance(t, (str, bytes, os.PathLike)) for t in targets):
+            raise PermissionError("File and network access is not allowed in the sandbox")
+        return fn(*args, **kwargs)
+    return wrapper
+
+def _block_file_access(pd, np):
+    """Make pandas/NumPy I/O functions refuse paths and URLs"""
+    for name in dir(pd):
+        if name.startswith('read_'):
+            setattr(pd, name, _refuse_paths(getattr(pd, name)))
+    for name in ('load', 'save', 'savez', 'savez_compressed', 'loadtxt', 'savetxt', 'genfromtxt', 'fromfile'):
+        if hasattr(np, name):
+            setattr(np, name, _refuse_paths(getattr(np, name)))
+    for cls in (pd.DataFrame, pd.Series):
+        for name in FILE_WRITERS:
+            if hasattr(cls, name):
+                setattr(cls, name, _refuse_paths(getattr(cls, name), first_arg=1))
+
+def _landlock(read_paths):
+    """Deny this process all file access except reading read_paths (and TCP, on newer kernels); False if unsupported"""
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    create_ruleset, add_rule, restrict_self = 444, 445, 446
+
+    abi = libc.syscall(create_ruleset, None, ctypes.c_size_t(0), ctypes.c_uint32(1))
+    if abi < 1:
+        return False
+    handled_fs = (1 << 13) - 1
+    if abi >= 2:
+        handled_fs |= 1 << 13
+    if abi >= 3:
+        handled_fs |= 1 << 14
+    handled_net = 0b11 if abi >= 4 else 0
+
+    class RulesetAttr(ctypes.Structure):
+        _fields_ = [("handled_access_fs", ctypes.c_uint64), ("handled_access_net", ctypes.c_uint64)]
+
+    class PathBeneath(ctypes.Structure):
+        _pack_ = 1
+        _fields_ = [("allowed_access", ctypes.c_uint64), ("parent_fd", ctypes.c_int32)]
+
+    attr = RulesetAttr(handled_fs, handled_net)
+    size = ctypes.sizeof(attr) if abi >= 4 else ctypes.sizeof(ctypes.c_uint64)
+    ruleset = libc.syscall(create_ruleset, ctypes.byref(attr), ctypes.c_size_t(size), ctypes.c_uint32(0))
+    if ruleset < 0:
+        return False
+    try:
+        read_access = (1 << 0) | (1 << 2) | (1 << 3)  # execute, read file, read dir
+        for path in read_paths:
+            try:
+                fd = os.open(path, os.O_PATH | os.O_CLOEXEC)
+            except OSError:
+                continue
+            try:
+                rule = PathBeneath(read_access, fd)
+                libc.syscall(add_rule, ruleset, ctypes.c_int(1), ctypes.byref(rule), ctypes.c_uint32(0))
+            finally:
+                os.close(fd)
+        # PR_SET_NO_NEW_PRIVS is required before restricting an unprivileged process
+        if libc.prctl(38, 1, 0, 0, 0) != 0:
+            return False
+        return libc.syscall(restrict_self, ruleset, ctypes.c_uint32(0)) == 0
+    finally:
+        os.close(ruleset)
+
+def _library_paths():
+    """Directories the interpreter may still need to read from: the Python installation and system libraries"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = {sys.prefix, sys.base_prefix, sys.exec_prefix, '/usr/lib', '/usr/lib64', '/lib', '/lib64', '/usr/share/zoneinfo'}
+    # Site directories, but not the application's own directory (sources, .env)
+    paths.update(p for p in sys.path if p and os.path.isdir(p) and os.path.abspath(p) != here)
+    return sorted(paths)
+
+def _set_limits():
+    """Apply CPU, memory and process limits to this interpreter"""
+    import resource
+    resource.setrlimit(resource.RLIMIT_CPU, (SANDBOX_CPU_SECONDS, SANDBOX_CPU_SECONDS + 1))
+    memory = SANDBOX_MEMORY_MB * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    try:
+        resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    except (ValueError, OSError):
+        pass
+
+def _worker_main():
+    """Warm up, run a single job from stdin, write the result to stdout as JSON"""
+    import builtins
+    import io
+    import traceback
+    import numpy as np
+    import pandas as pd
+
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    # Confined before any job is read; without Landlock the other checks are not a boundary
+    if not _landlock(_library_paths()) and not SANDBOX_ALLOW_UNCONFINED:
+        protocol_out.write(UNCONFINED)
+        protocol_out.flush()
+        return
+    protocol_out.write(READY)
+    protocol_out.flush()
+
+    job = pickle.loads(sys.stdin.buffer.read())
+    _set_limits()
+    _block_file_access(pd, np)
+
+    captured = io.StringIO()
+    sys.stdout = captured
+
+    safe_builtins = {k: v for k, v in vars(builtins).items() if k not in BLOCKED_BUILTINS}
+    safe_builtins['__import__'] = _safe_import
+
+    dfs = job['dataframes']
+    namespace = {
+        '__builtins__': safe_builtins,
+        'pd': pd,
+        'np': np,
+        'dfs': dfs,
+        'df': next(iter(dfs.values()), None),
+        'result': None,
+    }
+
+    try:
+        exec(_capture_last_expression(job['code']), namespace)
+        response = {"ok": True, "result": _to_jsonable(namespace.get('result')), "stdout": captured.getvalue()[-2000:]}
+    except BaseException as e:
+        response = {"ok": False, "error": f"{type(e).__name__}: {e}",
+                    "traceback": traceback.format_exc()[-2000:], "stdout": captured.getvalue()[-2000:]}
+
+    try:
+        payload = json.dumps(response, default=str)
+    except ValueError as e:
+        payload = json.dumps({"ok": False, "error": f"Result is not serializable: {e}"})
+    protocol_out.write(payload.encode('utf-8'))
+    protocol_out.flush()
+
+
+if __name__ == '__main__' and '--worker' in sys.argv:
+    _worker_main()
@@ -0,0 +1,210 @@
+"""
+Embedded SQL (DuckDB) over downloaded CSV, Parquet and JSON files.
+
+Each quiz hop gets a SqlWorkspace: downloads of those types are written to
+a private temporary directory and exposed as views, so SQL written by the
+model scans the files in place (vectorized, multi-threaded) and can join
+across them without anything being loaded into pandas. Queries are
+validated to be a single SELECT and run on a connection that may only read
+the workspace directory, with its configuration locked.
+"""
+import datetime
+import decimal
+import importlib.util
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+SQL_THREADS = int(os.environ.get("SQL_THREADS", os.cpu_count() or 2))
+SQL_MEMORY_LIMIT = os.environ.get("SQL_MEMORY_LIMIT", "1GB")
+SQL_TIMEOUT = int(os.environ.get("SQL_TIMEOUT", 20))
+SQL_MAX_ROWS = int(os.environ.get("SQL_MAX_ROWS", 1000))
+# CSVs larger than this are only summarized through SQL, not loaded into pandas
+SQL_PANDAS_MAX_BYTES = int(os.environ.get("SQL_PANDAS_MAX_BYTES", 50 * 1024 * 1024))
+
+# File type -> DuckDB table function that scans it
+SQL_READERS = {
+    'csv': "read_csv_auto",
+    'parquet': "read_parquet",
+    'json': "read_json_auto",
+}
+
+
+def sql_available():
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def table_name(url, taken):
+    """SQL identifier for a file URL: its base name, made unique"""
+    base = os.path.splitext(os.path.basename(url.split('?')[0]))[0].lower()
+    name = re.sub(r'[^a-z0-9_]', '_', base).strip('_') or 'data'
+    if name[0].isdigit():
+        name = f"t_{name}"
+    candidate, n = name, 2
+    while candidate in taken:
+        candidate, n = f"{name}_{n}", n + 1
+    return candidate
+
+
+def validate_sql(sql):
+    """The query as one SELECT statement; raises ValueError for anything else"""
+    import duckdb
+    sql = sql.strip().rstrip(';').strip()
+    try:
+        statements = duckdb.extract_statements(sql)
+    except duckdb.Error as e:
+        raise ValueError(f"SQL does not parse: {e}")
+    if len(statements) != 1:
+        raise ValueError("Exactly one SQL statement is allowed")
+    if statements[0].type != duckdb.StatementType.SELECT:
+        raise ValueError(f"Only SELECT queries are allowed, got {statements[0].type.name}")
+    return sql
+
+
+def _jsonable(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    return value
+
+
+def _shape_result(columns, rows):
+    """A single value, a list (one column) or records, like the sandbox's results"""
+    rows = [tuple(_jsonable(v) for v in row) for row in rows]
+    if len(columns) == 1:
+        if len(rows) == 1:
+            return rows[0][0]
+        return [row[0] for row in rows]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _run(conn, sql, timeout, max_rows):
+    """Execute with a wall-clock limit (DuckDB interrupts the running query)"""
+    timer = threading.Timer(timeout, conn.interrupt)
+    timer.start()
+    try:
+        cursor = conn.execute(sql)
+        columns = [d[0] for d in cursor.description]
+        rows = cursor.fetchmany(max_rows + 1)
+    finally:
+        timer.cancel()
+    if len(rows) > max_rows:
+        raise ValueError(f"Query returned more than {max_rows} rows; aggregate or add a LIMIT")
+    return columns, rows
+
+
+def _new_connection():
+    import duckdb
+    conn = duckdb.connect(":memory:")
+    conn.execute(f"SET threads = {SQL_THREADS}")
+    conn.execute(f"SET memory_limit = '{SQL_MEMORY_LIMIT}'")
+    return conn
+
+
+def _restrict(conn, allowed_dir=None):
+    """Forbid file/network access outside allowed_dir and further SET/INSTALL"""
+    if allowed_dir:
+        conn.execute("SET allowed_directories = ?", [[allowed_dir + os.sep]])
+    conn.execute("SET enable_external_access = false")
+    conn.execute("SET lock_configuration = true")
+
+
+class SqlWorkspace:
+    """Downloaded data files of one quiz hop, queryable as SQL views"""
+
+    def __init__(self):
+        self.dir = tempfile.mkdtemp(prefix="sql-")
+        self.tables = {}
+        self._conn = None
+        self._retired = []
+        self._lock = threading.Lock()
+
+    def add_file(self, url, file_type, stream):
+        """Copy a downloaded file into the workspace; returns its table name"""
+        with self._lock:
+            name = table_name(url, self.tables)
+            path = os.path.join(self.dir, f"{name}.{file_type}")
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(stream, f, 1024 * 1024)
+            self.tables[name] = {"url": url, "type": file_type, "path": path}
+            # Views are fixed once the connection is locked, so build a new one;
+            # the old one may still be serving a describe() on another thread
+            if self._conn is not None:
+                self._retired.append(self._conn)
+                self._conn = None
+        return name
+
+    def _connect(self):
+        if self._conn is None:
+            conn = _new_connection()
+            for name, table in self.tables.items():
+                path = table["path"].replace("'", "''")
+                conn.execute(f'CREATE VIEW "{name}" AS SELECT * FROM {SQL_READERS[table["type"]]}(\'{path}\')')
+            _restrict(conn, self.dir)
+            self._conn = conn
+        return self._conn
+
+    def describe(self, name, rows=10):
+        """Shape, columns, types and first rows of a table, without loading it"""
+        with self._lock:
+            conn = self._connect().cursor()
+        try:
+            columns = conn.execute(f'DESCRIBE "{name}"').fetchall()
+            count = conn.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+            head_columns, head_rows = _run(conn, f'SELECT * FROM "{name}" LIMIT {rows}', SQL_TIMEOUT, rows)
+        finally:
+            conn.close()
+        return {
+            "shape": (count, len(columns)),
+            "columns": [c[0] for c in columns],
+            "dtypes": {c[0]: c[1] for c in columns},
+            "head": [dict(zip(head_columns, (_jsonable(v) for v in row))) for row in head_rows]
+        }
+
+    def query(self, sql, timeout=SQL_TIMEOUT, max_rows=SQL_MAX_ROWS):
+        """Run one validated SELECT over the workspace's tables"""
+        sql = validate_sql(sql)
+        with self._lock:
+            # A cursor per query, so concurrent candidates do not share state
+            conn = self._connect().cursor()
+        try:
+            return _shape_result(*_run(conn, sql, timeout, max_rows))
+        finally:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            for conn in self._retired + [self._conn]:
+                if conn is not None:
+                    conn.close()
+            self._conn, self._retired = None, []
+            shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def open_sql_workspace():
+    """Workspace for one hop, or None when DuckDB is not installed"""
+    if not sql_available():
+        return None
+    return SqlWorkspace()
+
+
+def query_frames(frames, sql, timeout=SQL_TIMEOUT, max_rows=SQL_MAX_ROWS):
+    """Run one validated SELECT over in-memory DataFrames, registered by name"""
+    sql = validate_sql(sql)
+    conn = _new_connection()
+    try:
+        for name, df in frames.items():
+            conn.register(name, df)
+        _restrict(conn)
+        return _shape_result(*_run(conn, sql, timeout, max_rows))
+    finally:
+        conn.close()
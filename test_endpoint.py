@@ -2,18 +2,27 @@
 """
 Test script for LLM Analysis Quiz endpoint
 Usage: python test_endpoint.py
+       python test_endpoint.py --load 20 --rate 2 --concurrency 10 --report load.json
 """
 
 import requests
 import json
 import sys
 import os
+import time
+import argparse
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from tracing import percentile
+
 # Configuration
 ENDPOINT_URL = os.environ.get("ENDPOINT_URL", "http://localhost:5000/quiz")
 EMAIL = os.environ.get("STUDENT_EMAIL", "your-email@example.com")
 SECRET = os.environ.get("STUDENT_SECRET", "your-secret")
+DEMO_QUIZ_URL = "https://tds-llm-analysis.s-anand.net/demo"
 
 def test_health_check(base_url):
     """Test if service is running"""
@@ -81,7 +90,7 @@ def test_demo_quiz(endpoint_url, email, secret):
             json={
                 "email": email,
                 "secret": secret,
-                "url": "https://tds-llm-analysis.s-anand.net/demo"
+                "url": DEMO_QUIZ_URL
             },
             timeout=180
         )
@@ -150,7 +159,146 @@ def run_all_tests():
         print("⚠️  Some tests failed. Check the errors above.")
         return 1
 
+def wait_for_job(endpoint_url, body, started, timeout):
+    """Completion time of a queued job (polls /jobs/<id>), or None if the server does not report jobs"""
+    job_id = body.get('job_id')
+    if not job_id:
+        return None, None
+    status_url = endpoint_url.replace('/quiz', f"/jobs/{job_id}")
+    while time.time() - started < timeout:
+        try:
+            response = requests.get(status_url, timeout=10)
+            if response.status_code == 404:
+                return None, None
+            status = response.json()
+            if status.get("status") in ("completed", "failed"):
+                return time.time() - started, status
+        except Exception:
+            pass
+        time.sleep(1)
+    return None, None
+
+def load_request(endpoint_url, email, secret, quiz_url, timeout):
+    """One /quiz submission; returns a record of what happened"""
+    started = time.time()
+    record = {"started": started}
+    try:
+        response = requests.post(
+            endpoint_url,
+            # A fresh job id, or the server resumes/replays an earlier run of this URL
+            json={"email": email, "secret": secret, "url": quiz_url, "job_id": f"load-{uuid.uuid4().hex}"},
+            timeout=timeout
+        )
+        record["status_code"] = response.status_code
+        record["response_seconds"] = time.time() - started
+        body = response.json() if response.content else {}
+        
+        if response.status_code in (200, 202) and body.get("job_id") and body.get("status") != "completed":
+            completion, body = wait_for_job(endpoint_url, body, started, timeout)
+            record["completion_seconds"] = completion
+        elif response.status_code == 200:
+            record["completion_seconds"] = record["response_seconds"]
+        
+        results = (body or {}).get("results") or []
+        record["quizzes"] = len(results)
+        record["correct"] = sum(1 for r in results if r.get("correct"))
+    except requests.Timeout:
+        record["error"] = "timeout"
+        record["response_seconds"] = time.time() - started
+    except Exception as e:
+        record["error"] = str(e)
+        record["response_seconds"] = time.time() - started
+    return record
+
+def run_load_test(endpoint_url, email, secret, quiz_url, total, rate, concurrency, timeout):
+    """Fire `total` submissions at `rate` per second with at most `concurrency` in flight"""
+    print("=" * 60)
+    print("LLM Analysis Quiz - Load Test")
+    print("=" * 60)
+    print(f"Endpoint: {endpoint_url}")
+    print(f"Quiz: {quiz_url}")
+    print(f"Requests: {total} at {rate}/s, concurrency {concurrency}")
+    print("=" * 60)
+    
+    records = []
+    lock = threading.Lock()
+    
+    def worker():
+        record = load_request(endpoint_url, email, secret, quiz_url, timeout)
+        with lock:
+            records.append(record)
+            code = record.get("status_code", record.get("error"))
+            print(f"  [{len(records)}/{total}] {code} in {record['response_seconds']:.2f}s")
+    
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(total):
+            delay = start + i / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(worker)
+    wall = time.time() - start
+    
+    response_times = [r["response_seconds"] for r in records]
+    completion_times = [r["completion_seconds"] for r in records if r.get("completion_seconds") is not None]
+    status_counts = {}
+    for r in records:
+        key = str(r.get("status_code", "error"))
+        status_counts[key] = status_counts.get(key, 0) + 1
+    
+    errors = sum(1 for r in records if "error" in r or r.get("status_code", 500) >= 400)
+    rate_limited = status_counts.get("429", 0)
+    
+    report = {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "endpoint": endpoint_url,
+        "quiz_url": quiz_url,
+        "config": {"total": total, "rate": rate, "concurrency": concurrency, "timeout": timeout},
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(records) / wall, 3) if wall else None,
+        "status_counts": status_counts,
+        "error_rate": round(errors / len(records), 4) if records else None,
+        "rate_limited_rate": round(rate_limited / len(records), 4) if records else None,
+        "response_seconds": {
+            "p50": percentile(response_times, 50, digits=3),
+            "p95": percentile(response_times, 95, digits=3),
+            "p99": percentile(response_times, 99, digits=3),
+            "max": round(max(response_times), 3) if response_times else None
+        },
+        "completion_seconds": {
+            "p50": percentile(completion_times, 50, digits=3),
+            "p95": percentile(completion_times, 95, digits=3),
+            "max": round(max(completion_times), 3) if completion_times else None
+        },
+        "quizzes": sum(r.get("quizzes", 0) for r in records),
+        "correct": sum(r.get("correct", 0) for r in records)
+    }
+    
+    print()
+    print("=" * 60)
+    print("SUMMARY")
+    print("=" * 60)
+    print(f"Status codes: {status_counts}")
+    print(f"Error rate: {report['error_rate']}, 429 rate: {report['rate_limited_rate']}")
+    print(f"Response p50/p95/p99: {report['response_seconds']['p50']}s / "
+          f"{report['response_seconds']['p95']}s / {report['response_seconds']['p99']}s")
+    print(f"Job completion p50/p95: {report['completion_seconds']['p50']}s / {report['completion_seconds']['p95']}s")
+    print(f"Quizzes solved: {report['correct']}/{report['quizzes']}")
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Test or load-test the quiz endpoint")
+    parser.add_argument("--load", type=int, default=0, help="number of /quiz submissions for a load test")
+    parser.add_argument("--rate", type=float, default=1.0, help="submissions started per second")
+    parser.add_argument("--concurrency", type=int, default=10, help="maximum submissions in flight")
+    parser.add_argument("--quiz-url", default=DEMO_QUIZ_URL, help="quiz URL to submit")
+    parser.add_argument("--timeout", type=int, default=300, help="per-request timeout in seconds")
+    parser.add_argument("--report", help="write the JSON report to this file")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    
     # Check if environment variables are set
     if ENDPOINT_URL == "http://localhost:5000/quiz":
         print("⚠️  Using default localhost endpoint")
@@ -165,4 +313,15 @@ if __name__ == "__main__":
         print("❌ Please set STUDENT_SECRET environment variable")
         sys.exit(1)
     
+    if args.load:
+        report = run_load_test(ENDPOINT_URL, EMAIL, SECRET, args.quiz_url,
+                               args.load, args.rate, args.concurrency, args.timeout)
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Report written to {args.report}")
+        else:
+            print(json.dumps(report, indent=2))
+        sys.exit(0 if report["error_rate"] == 0 else 1)
+    
     sys.exit(run_all_tests())
@@ -0,0 +1,50 @@
+"""Incremental JSON parsing in processors.py, across every chunk boundary"""
+import io
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processors import iter_json_array, json_records
+
+SCALARS = [893.465, -406.1, 1.5e-7, -2E+10, 0, -0, 12, True, False, None, "a,]b", "é", -0.25e3]
+
+
+@pytest.mark.parametrize("separators", [(",", ":"), (", ", ": "), (" ,\n ", " : ")])
+def test_array_of_scalars_every_chunk_size(separators):
+    data = json.dumps(SCALARS, separators=separators).encode()
+    for chunk_size in range(1, len(data) + 2):
+        assert list(iter_json_array(io.BytesIO(data), chunk_size)) == SCALARS, chunk_size
+
+
+def test_random_floats():
+    rng = random.Random(0)
+    values = [round(rng.uniform(-1000, 1000), 3) for _ in range(2000)]
+    data = json.dumps(values).encode()
+    for chunk_size in (7, 64, 1000, 4096):
+        assert list(iter_json_array(io.BytesIO(data), chunk_size)) == values
+
+
+def test_empty_and_malformed_arrays():
+    assert list(iter_json_array(io.BytesIO(b" [ ] "), 1)) == []
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.BytesIO(b"[1 2]"), 1))
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.BytesIO(b"[1, 2"), 1))
+
+
+def test_records_in_object_are_streamed():
+    document = {"meta": {"n": [1, 2]}, "tags": ["x", "y"], "data": [{"a": 1.5}, {"a": -2e3}], "more": 1}
+    records, rest = json_records(io.BytesIO(json.dumps(document, indent=1).encode()))
+    assert rest is None
+    assert list(records) == document["data"]
+
+
+def test_object_without_records():
+    document = {"meta": {"n": 1}, "values": [1, 2, 3]}
+    records, rest = json_records(io.BytesIO(json.dumps(document).encode()))
+    assert records is None and rest == document
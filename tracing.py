@@ -0,0 +1,361 @@
+"""
+Lightweight per-stage tracing for the quiz pipeline.
+
+Spans time each stage of a chain (browser fetch, downloads, model calls,
+submits) and record the peak RSS seen while they ran. Every finished span
+feeds a process-wide latency histogram that is exported in Prometheus
+text format, and is also recorded in the trace of the job that is
+currently running on this thread.
+
+With METRICS_DIR set (gunicorn.conf.py sets it for its workers), every
+process writes its metrics to its own file there every few seconds and
+/metrics sums the files, so a scrape sees the same series whichever
+worker answers it. Files of exited workers are kept, so counters never
+go backwards.
+"""
+import atexit
+import functools
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from memory import sampler, current_account, set_current_account
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+
+_local = threading.local()
+
+
+def percentile(values, pct, digits=None):
+    """Nearest-rank percentile of raw samples (None if there are none), optionally rounded"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank] if digits is None else round(ordered[rank], digits)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram keyed by a label tuple"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        _start_flusher()
+        with self._lock:
+            series = self._series.setdefault(labels, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def reset(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """[labels, series] pairs, JSON-serialisable"""
+        with self._lock:
+            return [[list(labels), {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}]
+                    for labels, s in self._series.items()]
+
+    def merge(self, into, snapshot):
+        for labels, s in snapshot:
+            series = into.setdefault(tuple(labels), {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            series["counts"] = [a + b for a, b in zip(series["counts"], s["counts"])]
+            series["sum"] += s["sum"]
+            series["count"] += s["count"]
+
+    def render(self, snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            self.merge(merged, snapshot)
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(merged.items()):
+            base = _format_labels(self.label_names, labels)
+            for bound, count in zip(self.buckets, series["counts"]):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series["count"]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series['count']}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by a label tuple"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        _start_flusher()
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """[labels, value] pairs, JSON-serialisable"""
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+    def render(self, snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            for labels, value in snapshot:
+                merged[tuple(labels)] = merged.get(tuple(labels), 0) + value
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(merged.items()):
+            lines.append(f"{self.name}{{{_format_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def _format_labels(names, values):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"') for v in values)
+    return ",".join(f'{n}="{v}"' for n, v in zip(names, escaped))
+
+
+STAGE_LATENCY = Histogram("quiz_stage_duration_seconds", "Latency of quiz pipeline stages", ("stage",))
+STAGE_ERRORS = Counter("quiz_stage_errors_total", "Quiz pipeline stages that raised", ("stage",))
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens used by model calls", ("model", "kind"))
+LLM_RATE_LIMITED = Counter("llm_rate_limited_total", "Model calls rejected with HTTP 429", ("model",))
+
+METRICS = [STAGE_LATENCY, STAGE_ERRORS, LLM_TOKENS, LLM_RATE_LIMITED]
+
+_flusher_pid = None
+_metrics_path = None
+_flusher_lock = threading.Lock()
+
+
+def _write_metrics(path):
+    """Replace this process's metrics file with its current values"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({metric.name: metric.snapshot() for metric in METRICS}, f)
+    os.replace(tmp, path)
+
+
+def _flush_loop(path):
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            _write_metrics(path)
+        except OSError as e:
+            print(f"✗ Could not write metrics to {path}: {e}")
+
+
+def _start_flusher():
+    """Start writing this process's metrics to METRICS_DIR (once per process)"""
+    global _flusher_pid, _metrics_path
+    if METRICS_DIR is None or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        # A fresh name per process start, so a reused pid never overwrites an exited worker's totals
+        _metrics_path = os.path.join(METRICS_DIR, f"metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        threading.Thread(target=_flush_loop, args=(_metrics_path,), daemon=True).start()
+        atexit.register(_write_metrics, _metrics_path)
+
+
+def _reset_after_fork():
+    # A forked child (gunicorn worker, process pool) starts from zero; its parent still reports its own values
+    global _flusher_pid, _metrics_path, _flusher_lock
+    _flusher_pid = _metrics_path = None
+    _flusher_lock = threading.Lock()
+    for metric in METRICS:
+        metric.reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class Trace:
+    """Spans recorded for one job"""
+
+    def __init__(self):
+        self.start = time.time()
+        self.spans = []
+        self.deadline = None
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start"])
+        totals = {}
+        for s in spans:
+            totals[s["name"]] = round(totals.get(s["name"], 0) + s["duration"], 4)
+        return {
+            "total_seconds": round(time.time() - self.start, 4),
+            "stage_totals": totals,
+            "spans": spans
+        }
+
+
+@contextmanager
+def job_trace():
+    """Collect spans from this thread into a new Trace"""
+    previous = getattr(_local, "trace", None)
+    trace = Trace()
+    _local.trace = trace
+    _local.stack = []
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def set_job_deadline(deadline):
+    """Record when the current job runs out of time (time.monotonic() based)"""
+    trace = current_trace()
+    if trace is not None:
+        trace.deadline = deadline
+
+
+def job_deadline():
+    """Deadline of the job on this thread (follows in_current_trace), or None"""
+    trace = current_trace()
+    return trace.deadline if trace is not None else None
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a stage; yields a dict for extra attributes (e.g. token counts)"""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(name)
+
+    start = time.time()
+    watch = sampler.start_watch()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.time() - start
+        sampler.stop_watch(watch)
+        stack.pop()
+        account = current_account()
+        if account is not None:
+            account.record_stage(name, watch)
+        STAGE_LATENCY.observe((name,), duration)
+        if error:
+            STAGE_ERRORS.inc((name,))
+        trace = current_trace()
+        if trace is not None:
+            record = {
+                "name": name,
+                "parent": parent,
+                "start": round(start - trace.start, 4),
+                "duration": round(duration, 4),
+                "peak_rss_mb": round(watch.peak_rss, 1),
+            }
+            if attrs:
+                record["attrs"] = attrs
+            if error:
+                record["error"] = error
+            trace.add(record)
+
+
+def traced(name):
+    """Decorator form of span()"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def in_current_trace(fn):
+    """Wrap fn so spans it opens on a pool thread land in the caller's job trace and account"""
+    trace = current_trace()
+    account = current_account()
+    stack = getattr(_local, "stack", None)
+    parent = stack[-1] if stack else None
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous_trace = getattr(_local, "trace", None)
+        previous_stack = getattr(_local, "stack", None)
+        previous_account = set_current_account(account)
+        _local.trace = trace
+        _local.stack = [parent] if parent else []
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace = previous_trace
+            _local.stack = previous_stack
+            set_current_account(previous_account)
+    return wrapper
+
+
+def record_tokens(attrs, model, prompt_tokens, completion_tokens, cached_prompt_tokens=0):
+    """Attach token usage to a span and count it (cached: prompt tokens served from the provider's cache)"""
+    attrs["model"] = model
+    attrs["prompt_tokens"] = prompt_tokens or 0
+    attrs["cached_prompt_tokens"] = cached_prompt_tokens or 0
+    attrs["completion_tokens"] = completion_tokens or 0
+    LLM_TOKENS.inc((model, "prompt"), prompt_tokens or 0)
+    LLM_TOKENS.inc((model, "cached_prompt"), cached_prompt_tokens or 0)
+    LLM_TOKENS.inc((model, "completion"), completion_tokens or 0)
+
+
+def _metric_snapshots():
+    """Per-process snapshots to sum: every file in METRICS_DIR, or just this process"""
+    if METRICS_DIR is None:
+        return [{metric.name: metric.snapshot() for metric in METRICS}]
+    if _metrics_path is not None:
+        _write_metrics(_metrics_path)
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def render_metrics():
+    """All metrics in Prometheus text exposition format"""
+    snapshots = _metric_snapshots()
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render([s.get(metric.name, []) for s in snapshots]))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,324 @@
+"""
+Shared work queue for running quiz chains on worker nodes.
+
+With WORK_QUEUE_URL set, the web tier only enqueues chain jobs; worker.py
+processes on any node claim them, run solve_quiz_chain and write per-hop
+progress and the final result back. A claimed job is leased for
+QUEUE_VISIBILITY_TIMEOUT seconds and the worker keeps extending the lease
+while it runs, so the job of a worker that died is handed to another one
+once its lease runs out.
+
+Backends:
+    redis://host:6379/0   Redis (any server speaking the Redis protocol)
+    sqlite:///path.db     SQLite stand-in for one machine / local runs
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+WORK_QUEUE_URL = os.environ.get("WORK_QUEUE_URL", "")
+QUEUE_VISIBILITY_TIMEOUT = int(os.environ.get("QUEUE_VISIBILITY_TIMEOUT", 60))
+QUEUE_MAX_ATTEMPTS = int(os.environ.get("QUEUE_MAX_ATTEMPTS", 3))
+QUEUE_POLL_INTERVAL = float(os.environ.get("QUEUE_POLL_INTERVAL", 0.5))
+QUEUE_RESULT_TTL = int(os.environ.get("QUEUE_RESULT_TTL", 24 * 3600))
+QUEUE_PREFIX = os.environ.get("QUEUE_PREFIX", "quiz")
+
+ACTIVE = ("queued", "running")
+
+
+class SQLiteQueue:
+    """Work queue in a SQLite database (WAL), shared by processes on one machine"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS queue_jobs (
+        job_id TEXT PRIMARY KEY,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL,
+        worker TEXT,
+        lease_until REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        current_url TEXT,
+        results TEXT,
+        response TEXT,
+        error TEXT,
+        enqueued_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS queue_jobs_by_status ON queue_jobs (status, enqueued_at);
+    """
+
+    def __init__(self, path, visibility_timeout=QUEUE_VISIBILITY_TIMEOUT, max_attempts=QUEUE_MAX_ATTEMPTS):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, job_id, payload):
+        """Queue a job; a job that is already queued or running is left as it is"""
+        def add(conn):
+            row = conn.execute("SELECT status FROM queue_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row and row["status"] in ACTIVE:
+                return False
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO queue_jobs (job_id, payload, status, attempts, current_url, enqueued_at, updated_at) "
+                "VALUES (?, ?, 'queued', 0, ?, ?, ?)",
+                (job_id, json.dumps(payload), payload.get("url"), now, now))
+            return True
+        return self._transaction(add)
+
+    def _reclaim_expired(self, conn, now):
+        """Return jobs whose lease ran out to the queue (or fail them after max attempts)"""
+        conn.execute(
+            "UPDATE queue_jobs SET status = 'failed', worker = NULL, error = 'lease expired too many times', updated_at = ? "
+            "WHERE status = 'running' AND lease_until < ? AND attempts >= ?", (now, now, self.max_attempts))
+        reclaimed = conn.execute(
+            "UPDATE queue_jobs SET status = 'queued', worker = NULL, updated_at = ? "
+            "WHERE status = 'running' AND lease_until < ?", (now, now)).rowcount
+        if reclaimed:
+            print(f"↻ Reclaimed {reclaimed} job(s) from dead workers")
+
+    def claim(self, worker_id, timeout=5):
+        """Lease the oldest queued job to worker_id; None if nothing arrives within timeout"""
+        deadline = time.time() + timeout
+        while True:
+            def take(conn):
+                now = time.time()
+                self._reclaim_expired(conn, now)
+                row = conn.execute(
+                    "SELECT * FROM queue_jobs WHERE status = 'queued' ORDER BY enqueued_at LIMIT 1").fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE queue_jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE job_id = ?",
+                    (worker_id, now + self.visibility_timeout, now, row["job_id"]))
+                return self._job(conn.execute("SELECT * FROM queue_jobs WHERE job_id = ?", (row["job_id"],)).fetchone())
+            job = self._transaction(take)
+            if job or time.time() >= deadline:
+                return job
+            time.sleep(QUEUE_POLL_INTERVAL)
+
+    def _owned_update(self, job_id, worker_id, assignments, values):
+        """UPDATE a running job only while worker_id still holds its lease"""
+        cursor = self._connect().execute(
+            f"UPDATE queue_jobs SET {assignments}, updated_at = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+            (*values, time.time(), job_id, worker_id))
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id, worker_id):
+        """Extend the lease; False if the job was reclaimed meanwhile"""
+        return self._owned_update(job_id, worker_id, "lease_until = ?", (time.time() + self.visibility_timeout,))
+
+    def record_progress(self, job_id, worker_id, results, current_url):
+        return self._owned_update(job_id, worker_id, "results = ?, current_url = ?, lease_until = ?",
+                                  (json.dumps(results), current_url, time.time() + self.visibility_timeout))
+
+    def complete(self, job_id, worker_id, response):
+        return self._owned_update(job_id, worker_id, "status = 'completed', response = ?, results = ?",
+                                  (json.dumps(response), json.dumps(response.get("results", []))))
+
+    def fail(self, job_id, worker_id, error):
+        return self._owned_update(job_id, worker_id, "status = 'failed', error = ?", (error,))
+
+    def _job(self, row):
+        job = json.loads(row["payload"])
+        job.update({
+            "job_id": row["job_id"],
+            "status": row["status"],
+            "worker": row["worker"],
+            "attempts": row["attempts"],
+            "current_url": row["current_url"],
+            "results": json.loads(row["results"]) if row["results"] else [],
+            "response": json.loads(row["response"]) if row["response"] else None,
+            "error": row["error"]
+        })
+        return job
+
+    def status(self, job_id):
+        row = self._connect().execute("SELECT * FROM queue_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+
+# Each script runs atomically on the Redis server, so a claim, lease or
+# reclaim can never be half-applied by a worker dying mid-way
+_CLAIM = """
+local id = redis.call('RPOP', KEYS[1])
+if not id then return nil end
+local key = ARGV[4] .. id
+redis.call('HSET', key, 'status', 'running', 'worker', ARGV[1], 'updated_at', ARGV[2])
+redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('ZADD', KEYS[2], ARGV[3], id)
+return id
+"""
+
+_RECLAIM = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[2], id)
+    local key = ARGV[3] .. id
+    if tonumber(redis.call('HGET', key, 'attempts') or '0') >= tonumber(ARGV[2]) then
+        redis.call('HSET', key, 'status', 'failed', 'worker', '', 'error', 'lease expired too many times', 'updated_at', ARGV[1])
+    else
+        redis.call('HSET', key, 'status', 'queued', 'worker', '', 'updated_at', ARGV[1])
+        redis.call('RPUSH', KEYS[1], id)
+    end
+end
+return #ids
+"""
+
+_OWNED_UPDATE = """
+if redis.call('HGET', KEYS[1], 'worker') ~= ARGV[1] or redis.call('HGET', KEYS[1], 'status') ~= 'running' then
+    return 0
+end
+for i = 5, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+if ARGV[2] == 'lease' then
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[4])
+else
+    redis.call('ZREM', KEYS[2], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return 1
+"""
+
+_ENQUEUE = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if status == 'queued' or status == 'running' then return 0 end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'payload', ARGV[1], 'status', 'queued', 'worker', '', 'attempts', 0,
+           'current_url', ARGV[2], 'enqueued_at', ARGV[3], 'updated_at', ARGV[3])
+redis.call('LPUSH', KEYS[2], ARGV[4])
+return 1
+"""
+
+
+class RedisQueue:
+    """Work queue in Redis: a pending list, a lease sorted set and one hash per job"""
+
+    def __init__(self, url, visibility_timeout=QUEUE_VISIBILITY_TIMEOUT, max_attempts=QUEUE_MAX_ATTEMPTS,
+                 prefix=QUEUE_PREFIX):
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.pending_key = f"{prefix}:pending"
+        self.leases_key = f"{prefix}:leases"
+        self.job_prefix = f"{prefix}:job:"
+        self._claim = self.redis.register_script(_CLAIM)
+        self._reclaim = self.redis.register_script(_RECLAIM)
+        self._update = self.redis.register_script(_OWNED_UPDATE)
+        self._enqueue = self.redis.register_script(_ENQUEUE)
+
+    def enqueue(self, job_id, payload):
+        """Queue a job; a job that is already queued or running is left as it is"""
+        return bool(self._enqueue(keys=[self.job_prefix + job_id, self.pending_key],
+                                  args=[json.dumps(payload), payload.get("url") or "", time.time(), job_id]))
+
+    def claim(self, worker_id, timeout=5):
+        """Lease the oldest queued job to worker_id; None if nothing arrives within timeout"""
+        deadline = time.time() + timeout
+        while True:
+            now = time.time()
+            reclaimed = self._reclaim(keys=[self.pending_key, self.leases_key],
+                                      args=[now, self.max_attempts, self.job_prefix])
+            if reclaimed:
+                print(f"↻ Reclaimed {reclaimed} job(s) from dead workers")
+            job_id = self._claim(keys=[self.pending_key, self.leases_key],
+                                 args=[worker_id, now, now + self.visibility_timeout, self.job_prefix])
+            if job_id:
+                return self.status(job_id)
+            if time.time() >= deadline:
+                return None
+            time.sleep(QUEUE_POLL_INTERVAL)
+
+    def _owned_update(self, job_id, worker_id, fields, final=False):
+        """Set fields on a running job only while worker_id still holds its lease"""
+        fields = dict(fields, updated_at=time.time())
+        pairs = [v for item in fields.items() for v in item]
+        if final:
+            args = [worker_id, "final", QUEUE_RESULT_TTL, job_id, *pairs]
+        else:
+            args = [worker_id, "lease", time.time() + self.visibility_timeout, job_id, *pairs]
+        return bool(self._update(keys=[self.job_prefix + job_id, self.leases_key], args=args))
+
+    def heartbeat(self, job_id, worker_id):
+        """Extend the lease; False if the job was reclaimed meanwhile"""
+        return self._owned_update(job_id, worker_id, {})
+
+    def record_progress(self, job_id, worker_id, results, current_url):
+        return self._owned_update(job_id, worker_id, {"results": json.dumps(results), "current_url": current_url or ""})
+
+    def complete(self, job_id, worker_id, response):
+        return self._owned_update(job_id, worker_id, {
+            "status": "completed", "response": json.dumps(response),
+            "results": json.dumps(response.get("results", []))
+        }, final=True)
+
+    def fail(self, job_id, worker_id, error):
+        return self._owned_update(job_id, worker_id, {"status": "failed", "error": error}, final=True)
+
+    def status(self, job_id):
+        data = self.redis.hgetall(self.job_prefix + job_id)
+        if not data:
+            return None
+        job = json.loads(data["payload"])
+        job.update({
+            "job_id": job_id,
+            "status": data.get("status"),
+            "worker": data.get("worker") or None,
+            "attempts": int(data.get("attempts") or 0),
+            "current_url": data.get("current_url") or None,
+            "results": json.loads(data["results"]) if data.get("results") else [],
+            "response": json.loads(data["response"]) if data.get("response") else None,
+            "error": data.get("error")
+        })
+        return job
+
+
+def open_queue(url):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisQueue(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteQueue(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported WORK_QUEUE_URL: {url}")
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_work_queue():
+    """Process-wide work queue, or None when chains run inline in the web tier"""
+    global _queue
+    if not WORK_QUEUE_URL:
+        return None
+    with _queue_lock:
+        if _queue is None:
+            _queue = open_queue(WORK_QUEUE_URL)
+    return _queue
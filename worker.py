@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Queue worker: claims chain jobs from the shared work queue (WORK_QUEUE_URL)
+and runs them with solve_quiz_chain. Workers are stateless, so any number
+can run on any node; each keeps the lease of its jobs alive while they run
+and writes per-hop progress back, so a job whose worker dies is resumed by
+another worker from its last unanswered URL.
+Usage: WORK_QUEUE_URL=redis://host:6379/0 python worker.py [--concurrency 2]
+"""
+
+import argparse
+import os
+import signal
+import socket
+import threading
+import traceback
+
+from app import solve_quiz_chain, YOUR_SECRET
+from memory import job_account
+from tracing import job_trace
+from work_queue import get_work_queue, QUEUE_VISIBILITY_TIMEOUT
+
+_stopping = threading.Event()
+
+class LeaseLost(Exception):
+    """The job was reclaimed by another worker; this run must stop"""
+
+def merge_results(prior, results):
+    """Progress saved by an earlier worker followed by this run's hops"""
+    seen = {r.get("url") for r in results}
+    return [r for r in prior if r.get("url") not in seen] + results
+
+def keep_lease(queue, job_id, worker_id, done, lost):
+    """Extend the job's lease until done is set; sets lost if the job was taken away"""
+    while not done.wait(QUEUE_VISIBILITY_TIMEOUT / 3):
+        if not queue.heartbeat(job_id, worker_id):
+            print(f"✗ Lost the lease on job {job_id}")
+            lost.set()
+            return
+
+def run_job(queue, worker_id, job):
+    """Run one claimed chain and report its outcome to the queue"""
+    job_id = job["job_id"]
+    prior = job.get("results") or []
+    start_url = job.get("current_url") or job["url"]
+    print(f"\n📋 {worker_id} running job {job_id} (attempt {job['attempts']}) from {start_url}")
+
+    done = threading.Event()
+    lost = threading.Event()
+    threading.Thread(target=keep_lease, args=(queue, job_id, worker_id, done, lost), daemon=True).start()
+
+    def on_hop(results, next_url):
+        # Another worker owns the job now: stop before solving and submitting alongside it
+        if lost.is_set() or not queue.record_progress(job_id, worker_id, merge_results(prior, results), next_url):
+            lost.set()
+            raise LeaseLost(f"Lost the lease on job {job_id}")
+
+    try:
+        with job_account() as account, job_trace() as trace:
+            results = solve_quiz_chain(start_url, job["email"], YOUR_SECRET,
+                                       max_time=job.get("max_time", 180), job_id=job_id, on_hop=on_hop,
+                                       leased=True)
+        queue.complete(job_id, worker_id, {
+            "results": merge_results(prior, results),
+            "trace": trace.to_dict(),
+            "memory": account.to_dict()
+        })
+        print(f"✓ Job {job_id} completed")
+    except LeaseLost as e:
+        print(f"✗ {e}, abandoning it to its new owner")
+    except Exception as e:
+        print(f"✗ Job {job_id} failed: {e}")
+        traceback.print_exc()
+        queue.fail(job_id, worker_id, str(e))
+    finally:
+        done.set()
+
+def worker_loop(queue, worker_id):
+    while not _stopping.is_set():
+        try:
+            job = queue.claim(worker_id, timeout=5)
+        except Exception as e:
+            print(f"✗ Claim failed: {e}")
+            _stopping.wait(5)
+            continue
+        if job:
+            run_job(queue, worker_id, job)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("WORKER_CONCURRENCY", 2)),
+                        help="chains run at once by this process (they share one browser)")
+    args = parser.parse_args()
+
+    queue = get_work_queue()
+    if queue is None:
+        parser.error("WORK_QUEUE_URL is not set")
+
+    # Finish running chains on SIGTERM; unfinished ones are reclaimed by other workers
+    signal.signal(signal.SIGTERM, lambda *_: _stopping.set())
+
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"\n{'='*60}")
+    print(f"Queue worker {base_id} - {args.concurrency} slot(s)")
+    print(f"{'='*60}\n")
+
+    threads = [threading.Thread(target=worker_loop, args=(queue, f"{base_id}:{i}"), name=f"worker-{i}")
+               for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        _stopping.set()
+
+if __name__ == "__main__":
+    main()